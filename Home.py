@@ -2,10 +2,13 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import base64
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from api_client import TinyAPIClient
-from database import DatabaseManager
-from utils import DataUtils
+from conexoes import BancoCompartilhado
+from vendas_store import VendasStore
+from financeiro_store import FinanceiroStore
+from blacklist_cache import BlacklistCache
+from figure_cache import FigureCache
 
 # ============================================================
 # CONFIGURAÇÃO GERAL
@@ -18,147 +21,33 @@ st.set_page_config(
 )
 
 # Inicializa Banco Local
-db = DatabaseManager()
-db.inicializar_banco()
-
-# ============================================================
-# FUNÇÕES DE APOIO (INTEGRIDADE DOS DADOS)
-# ============================================================
-
-def gerar_assinatura_venda(venda, valor_float):
-    """
-    Gera o mesmo 'RG' único usado no Dashboard de Vendas.
-    Formato: YYYYMMDD-NomeClienteSemEspaco-ValorCentavos
-    """
-    try:
-        # 1. Data (Tiny envia geralmente como dd/mm/yyyy)
-        data_str = venda.get('data_emissao', '')
-        try:
-            dt = datetime.strptime(data_str, '%d/%m/%Y')
-        except ValueError:
-            # Tenta fallback para formato ISO se mudar
-            try:
-                dt = datetime.strptime(data_str, '%Y-%m-%d')
-            except:
-                dt = date.today() # Fallback extremo (raro)
-        
-        d = dt.strftime('%Y%m%d')
-        
-        # 2. Cliente (Remove espaços para evitar erros de digitação)
-        c = str(venda.get('nome', '')).strip().replace(" ", "")
-        
-        # 3. Valor (Em centavos para evitar flutuação de float)
-        v = str(int(valor_float * 100))
-        
-        return f"{d}-{c}-{v}"
-    except Exception:
-        return "erro-geracao-id"
-
-def identificar_canal(nota):
-    """
-    Identifica o canal de venda baseado no PADRÃO DO PEDIDO (xPed).
-    """
-    xPed = str(nota.get('numero_ecommerce', '')).strip()
-    if not xPed:
-        xPed = str(nota.get('numero_ordem_compra', '')).strip()
-    
-    xPed_upper = xPed.upper()
-    
-    # REGRA 1: xPed Vazio -> Tenta achar palavras chave
-    if not xPed or xPed_upper in ['NONE', 'NULL', 'N/A']:
-        texto_fallback = (str(nota.get('obs', '')) + str(nota.get('nome', ''))).lower()
-        if 'shopee' in texto_fallback: return "Shopee"
-        if 'mercado' in texto_fallback or 'ebazar' in texto_fallback: return "Mercado Livre"
-        return "Venda Direta"
-
-    # REGRA 2: Shopee (Letras + Números)
-    tem_letra = any(c.isalpha() for c in xPed)
-    tem_numero = any(c.isdigit() for c in xPed)
-    if tem_letra and tem_numero:
-        return "Shopee"
-
-    # REGRA 3: Numéricos
-    if xPed.isdigit():
-        if len(xPed) > 10:
-            return "Mercado Livre"
-        else:
-            return "Site"
-            
-    return "Shopee" if tem_letra else "Venda Direta"
+db = BancoCompartilhado.obter()
+store = VendasStore(db)
+financeiro = FinanceiroStore(db)
 
 # ============================================================
 # FUNÇÕES DE CACHE E LÓGICA (BACKEND)
 # ============================================================
 
-@st.cache_data(ttl=60) # Cache reduzido para 60s para refletir exclusões rápido
 def buscar_dados_tiny_filtrados(token, data_ini, data_fim):
     """
-    Busca vendas no Tiny e aplica o filtro da BLACKLIST (Lixeira).
-    Só soma o que não foi excluído no Dashboard.
+    Totais de vendas do período a partir do espelho local (rollups por dia e canal).
+    Só baixa do Tiny os dias fechados que ainda faltam e, no máximo a cada
+    minuto, o dia de hoje. As vendas da BLACKLIST (Lixeira) já vêm descontadas.
     """
-    # 1. Busca a Lista Negra atualizada do Banco
-    blacklist_ids = db.obter_blacklist()
-    
-    client = TinyAPIClient(token)
-    vendas = client.buscar_vendas(data_ini, data_fim)
+    blacklist_ids = BlacklistCache.obter_ids(db)
+    store.aplicar_blacklist(blacklist_ids, BlacklistCache.versao())
     
-    total_vendas = 0.0
-    qtd_pedidos = 0
-    por_canal = {"Shopee": 0.0, "Mercado Livre": 0.0, "Site": 0.0, "Venda Direta": 0.0}
+    try:
+        store.sincronizar(TinyAPIClient(token), data_ini, blacklist_ids)
+    except Exception as e:
+        st.warning(f"Não foi possível atualizar as vendas do Tiny agora ({e}). Exibindo a última sincronização.")
     
-    if vendas:
-        for v_wrap in vendas:
-            v = v_wrap.get('nota_fiscal', v_wrap)
-            
-            # Valor
-            raw_valor = v.get('valor_nota') or v.get('valor') or v.get('valor_total')
-            valor = DataUtils.converter_valor(raw_valor)
-            
-            # --- O FILTRO MÁGICO ---
-            # Gera a assinatura dessa venda
-            assinatura = gerar_assinatura_venda(v, valor)
-            
-            # Se a assinatura estiver na blacklist, IGNORE esta venda
-            if assinatura in blacklist_ids:
-                continue 
-            # -----------------------
-            
-            total_vendas += valor
-            qtd_pedidos += 1
-            
-            canal = identificar_canal(v)
-            if canal in por_canal:
-                por_canal[canal] += valor
-            else:
-                por_canal["Venda Direta"] += valor 
-                
-    return total_vendas, qtd_pedidos, por_canal
+    return store.resumo_periodo(data_ini, data_fim)
 
 def buscar_dados_financeiros_locais(data_ini, data_fim):
-    """Busca Contas a Pagar e Saldo Total"""
-    df = db.buscar_lancamentos()
-    
-    contas_pagar_periodo = 0.0
-    saldo_caixa_total = 0.0
-    
-    if df is not None and not df.empty:
-        df['data'] = pd.to_datetime(df['data']).dt.date
-        
-        # 1. Contas a Pagar (Saída + Pendente + No Período)
-        mask_pagar = (
-            (df['tipo_movimento'] == 'Saída') & 
-            (df['status'] == 'Pendente') &
-            (df['data'] >= data_ini) & 
-            (df['data'] <= data_fim)
-        )
-        contas_pagar_periodo = df.loc[mask_pagar, 'valor'].sum()
-        
-        # 2. Saldo Total (Entradas Pagas - Saídas Pagas)
-        entradas = df.loc[(df['tipo_movimento'] == 'Entrada') & (df['status'] == 'Pago'), 'valor'].sum()
-        saidas = df.loc[(df['tipo_movimento'] == 'Saída') & (df['status'] == 'Pago'), 'valor'].sum()
-        saldo_caixa_total = entradas - saidas
-        
-    return contas_pagar_periodo, saldo_caixa_total
+    """Busca Contas a Pagar e Saldo Total (somas feitas no SQLite)"""
+    return financeiro.resumo_home(data_ini, data_fim)
 
 # ============================================================
 # INTERFACE (FRONTEND)
@@ -233,17 +122,20 @@ with col_graf:
         df_canais = df_canais[df_canais['Valor'] > 0]
         
         if not df_canais.empty:
-            fig = px.pie(
-                df_canais, values='Valor', names='Canal', hole=0.5, color='Canal',
-                color_discrete_map={
-                    "Mercado Livre": "#FFE600", "Shopee": "#FF5722", 
-                    "Site": "#2E7D32", "Venda Direta": "#111111"
-                }
-            )
-            fig.update_layout(
-                annotations=[dict(text=f'R$ {vendas_tiny:,.0f}', x=0.5, y=0.5, font_size=16, showarrow=False)],
-                margin=dict(l=20, r=20, t=0, b=0), height=300, showlegend=True
-            )
+            def construir_pizza():
+                fig = px.pie(
+                    df_canais, values='Valor', names='Canal', hole=0.5, color='Canal',
+                    color_discrete_map={
+                        "Mercado Livre": "#FFE600", "Shopee": "#FF5722", 
+                        "Site": "#2E7D32", "Venda Direta": "#111111"
+                    }
+                )
+                fig.update_layout(
+                    annotations=[dict(text=f'R$ {vendas_tiny:,.0f}', x=0.5, y=0.5, font_size=16, showarrow=False)],
+                    margin=dict(l=20, r=20, t=0, b=0), height=300, showlegend=True
+                )
+                return fig
+            fig = FigureCache.obter("home_canais", [df_canais], {"total": round(vendas_tiny)}, construir_pizza)
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("Vendas encontradas, mas canal não identificado.")
@@ -0,0 +1,153 @@
+"""
+Amostragem de Notas - Dashboard Comercial Tiny ERP
+Amostra estratificada (mês x canal) proporcional ao valor, com estimativas e intervalos de confiança
+"""
+
+import math
+import zlib
+import logging
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from itens_store import ItensStore
+
+logger = logging.getLogger(__name__)
+
+
+class AmostragemProdutos:
+    """
+    Estima volume e faturamento por produto abrindo só uma amostra de notas.
+
+    - Estratos: mês x canal (a lista de notas do Tiny já traz data, canal e valor)
+    - Alocação: proporcional ao faturamento do estrato (mínimo de 2 sorteios)
+    - Sorteio: com reposição e probabilidade proporcional ao valor da nota (PPS)
+    - Estimador: Hansen-Hurwitz por estrato, somado; variância entre sorteios
+
+    Em PPS a nota grande (que carrega mais itens) sai mais vezes, então o
+    erro do faturamento por produto cai bem mais rápido que numa amostra
+    simples das N notas mais recentes, e sem o viés de sazonalidade.
+    """
+
+    Z_95 = 1.96
+    MIN_POR_ESTRATO = 2
+
+    @staticmethod
+    def semente(*partes: Any) -> int:
+        """Semente estável entre processos (mesmo período = mesma amostra = notas já lidas reaproveitadas)."""
+        return zlib.crc32("|".join(str(p) for p in partes).encode())
+
+    @classmethod
+    def sortear(cls, populacao: pd.DataFrame, tamanho: int, semente: int) -> pd.DataFrame:
+        """
+        Sorteia as notas da amostra.
+
+        Args:
+            populacao: Notas do período (id_nota, data, canal, valor)
+            tamanho: Total de sorteios
+            semente: Semente do gerador
+
+        Returns:
+            DataFrame com um sorteio por linha: id_nota, estrato, valor,
+            valor_estrato (V_h) e sorteios_estrato (n_h)
+        """
+        colunas = ['id_nota', 'numero', 'data', 'canal', 'valor', 'estrato', 'valor_estrato', 'sorteios_estrato']
+        pop = populacao[populacao['valor'] > 0].copy()
+        if pop.empty:
+            return pd.DataFrame(columns=colunas)
+
+        pop['estrato'] = pop['data'].str[:7] + "|" + pop['canal']
+        estratos = pop.groupby('estrato').agg(valor_estrato=('valor', 'sum'), notas=('valor', 'size'))
+
+        # Alocação proporcional ao faturamento, com mínimo por estrato
+        alocacao = np.maximum(
+            np.rint(tamanho * estratos['valor_estrato'] / estratos['valor_estrato'].sum()),
+            cls.MIN_POR_ESTRATO
+        ).astype(int)
+        estratos['sorteios_estrato'] = alocacao
+
+        rng = np.random.default_rng(semente)
+        partes = []
+        for estrato, grupo in pop.groupby('estrato', sort=True):
+            n_h = int(estratos.at[estrato, 'sorteios_estrato'])
+            probs = grupo['valor'].to_numpy() / grupo['valor'].sum()
+            posicoes = rng.choice(len(grupo), size=n_h, replace=True, p=probs)
+            partes.append(grupo.iloc[posicoes])
+
+        amostra = pd.concat(partes, ignore_index=True)
+        amostra = amostra.join(estratos[['valor_estrato', 'sorteios_estrato']], on='estrato')
+        return amostra[colunas]
+
+    @classmethod
+    def estimar(cls, amostra: pd.DataFrame, itens: pd.DataFrame) -> pd.DataFrame:
+        """
+        Estima Qtd e Valor_Total por produto para o período inteiro.
+
+        Args:
+            amostra: Retorno de `sortear` (só sorteios cujas notas já foram lidas)
+            itens: Itens das notas da amostra (id_nota, SKU, Nome_Limpo, Qtd, Valor_Total)
+
+        Returns:
+            DataFrame no formato de `ItensStore.ranking_produtos`, mais as colunas
+            Qtd_IC e Valor_IC (meia-largura do intervalo de 95%)
+        """
+        colunas = ['SKU', 'Nome_Limpo', 'Nome_Completo', 'Qtd', 'Qtd_IC',
+                   'Valor_Total', 'Valor_IC', '% Acumulada', 'Curva ABC']
+        if amostra.empty or itens.empty:
+            return pd.DataFrame(columns=colunas)
+
+        # Cada sorteio j do estrato h vale z = y * V_h / valor_j (Hansen-Hurwitz).
+        # n = sorteios efetivamente lidos no estrato (falhas da API ficam de fora)
+        sorteios = amostra.reset_index(drop=True)
+        sorteios['sorteio'] = sorteios.index
+        sorteios['fator'] = sorteios['valor_estrato'] / sorteios['valor']
+        sorteios['n_lidos'] = sorteios.groupby('estrato')['id_nota'].transform('size')
+
+        # Um produto pode aparecer em vários itens da mesma nota: soma por sorteio antes
+        por_sorteio = sorteios[['sorteio', 'id_nota', 'estrato', 'fator', 'n_lidos']].merge(itens, on='id_nota')
+        por_sorteio['zq'] = por_sorteio['Qtd'] * por_sorteio['fator']
+        por_sorteio['zv'] = por_sorteio['Valor_Total'] * por_sorteio['fator']
+        por_sorteio = por_sorteio.groupby(['estrato', 'sorteio', 'SKU'], as_index=False).agg(
+            zq=('zq', 'sum'), zv=('zv', 'sum'), n_lidos=('n_lidos', 'first')
+        )
+
+        # Média e variância por (estrato, produto), com zeros nos sorteios sem o produto
+        por_sorteio['zq2'] = por_sorteio['zq'] ** 2
+        por_sorteio['zv2'] = por_sorteio['zv'] ** 2
+        g = por_sorteio.groupby(['estrato', 'SKU']).agg(
+            sq=('zq', 'sum'), sq2=('zq2', 'sum'), sv=('zv', 'sum'), sv2=('zv2', 'sum'), n=('n_lidos', 'first')
+        )
+        n = g['n'].astype(float)
+        g['Qtd'] = g['sq'] / n
+        g['Valor_Total'] = g['sv'] / n
+        denominador = (n * (n - 1)).where(n > 1)
+        g['var_q'] = ((g['sq2'] - g['sq'] ** 2 / n) / denominador).fillna(0).clip(lower=0)
+        g['var_v'] = ((g['sv2'] - g['sv'] ** 2 / n) / denominador).fillna(0).clip(lower=0)
+
+        est = g.groupby('SKU')[['Qtd', 'Valor_Total', 'var_q', 'var_v']].sum()
+        est['Qtd_IC'] = cls.Z_95 * np.sqrt(est['var_q'])
+        est['Valor_IC'] = cls.Z_95 * np.sqrt(est['var_v'])
+
+        nomes = itens.drop_duplicates('SKU').set_index('SKU')['Nome_Limpo']
+        df = est.join(nomes).reset_index().sort_values('Valor_Total', ascending=False, ignore_index=True)
+        df['Nome_Completo'] = df['SKU'] + " - " + df['Nome_Limpo']
+        total = df['Valor_Total'].sum()
+        df['% Acumulada'] = df['Valor_Total'].cumsum() / total * 100 if total > 0 else 100.0
+        df['Curva ABC'] = ItensStore.classificar_abc(df['% Acumulada'])
+        return df[colunas]
+
+    @staticmethod
+    def tamanho_necessario(estimativa: pd.DataFrame, tamanho_atual: int, erro_alvo: float) -> int:
+        """
+        Sorteios necessários para que o faturamento dos produtos classe A tenha
+        erro relativo médio (IC 95%, ponderado pelo faturamento) de no máximo
+        `erro_alvo` (ex: 0.05).
+
+        O erro cai com 1/raiz(n), então n_necessario = n_atual * (erro_atual / erro_alvo)^2.
+        """
+        classe_a = estimativa[estimativa['Curva ABC'] == 'A (Vital)']
+        if classe_a.empty or tamanho_atual <= 0 or classe_a['Valor_Total'].sum() <= 0:
+            return tamanho_atual
+        erro_atual = float(classe_a['Valor_IC'].sum() / classe_a['Valor_Total'].sum())
+        return max(tamanho_atual, math.ceil(tamanho_atual * (erro_atual / erro_alvo) ** 2))
@@ -30,9 +30,14 @@ class TinyAPIClient:
         self.timeout = getattr(Config, 'REQUEST_TIMEOUT', 30)
         logger.info("TinyAPIClient inicializado")
     
-    def buscar_vendas(self, data_ini: Union[date, datetime], data_fim: Union[date, datetime]) -> List[Dict[str, Any]]:
+    def buscar_vendas(self, data_ini: Union[date, datetime], data_fim: Union[date, datetime],
+                      estrito: bool = False) -> List[Dict[str, Any]]:
         """
         Busca a LISTA de notas fiscais (sem os produtos).
+
+        Por padrão, um erro numa página interrompe a busca e devolve o que já
+        veio (lista parcial). Com `estrito=True` o erro é levantado como
+        TinyAPIError, para quem grava o resultado como período completo.
         """
         if not ValidationUtils.validar_periodo_datas(data_ini, data_fim):
             raise ValueError("Período de datas inválido")
@@ -76,6 +81,10 @@ class TinyAPIClient:
                 
             except Exception as e:
                 logger.error(f"Erro na página {pagina_atual}: {e}")
+                if estrito:
+                    if isinstance(e, TinyAPIError):
+                        raise
+                    raise TinyAPIError(f"Falha na página {pagina_atual} de {total_paginas}: {e}") from e
                 # Se der erro numa página, tenta parar para não travar tudo
                 break
         
@@ -0,0 +1,161 @@
+"""
+Cache da Blacklist (Lixeira) - Dashboard Comercial Tiny ERP
+Mantém as vendas excluídas em memória, versionadas e invalidadas a cada exclusão
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+from conexoes import FilaEscrita
+
+logger = logging.getLogger(__name__)
+
+
+class BlacklistCache:
+    """
+    Cache process-wide da blacklist.
+
+    O banco só é lido quando a versão em memória está desatualizada.
+    Cada exclusão feita por aqui incrementa a versão e atualiza o conjunto
+    sem reler a tabela inteira.
+    """
+
+    MAX_MASCARAS = 32
+
+    _lock = threading.RLock()
+    _versao = 0
+    _ids: Optional[frozenset] = None
+    _versao_ids = -1
+    # Histórico (versao -> id adicionado) para atualizar máscaras sem recalcular tudo
+    _historico: "OrderedDict[int, str]" = OrderedDict()
+    # (chave_dataset) -> (versao, mascara)
+    _mascaras: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    @classmethod
+    def versao(cls) -> int:
+        """Versão atual da blacklist (muda a cada exclusão ou invalidação)."""
+        return cls._versao
+
+    @classmethod
+    def obter_ids(cls, db: Any) -> frozenset:
+        """
+        Retorna o conjunto de IDs excluídos.
+
+        Args:
+            db: Instância do DatabaseManager
+
+        Returns:
+            frozenset com as assinaturas (id_unico) das vendas excluídas
+        """
+        with cls._lock:
+            if cls._ids is None or cls._versao_ids != cls._versao:
+                ids = db.obter_blacklist() or []
+                cls._ids = frozenset(ids)
+                cls._versao_ids = cls._versao
+                logger.info(f"Blacklist carregada do banco ({len(cls._ids)} itens, versão {cls._versao})")
+            return cls._ids
+
+    @classmethod
+    def adicionar(cls, db: Any, id_unico: str) -> bool:
+        """
+        Adiciona uma venda à blacklist e incrementa a versão.
+
+        Args:
+            db: Instância do DatabaseManager
+            id_unico: Assinatura da venda
+
+        Returns:
+            True se o banco confirmou a exclusão
+        """
+        # Chave de idempotência: clique repetido na mesma venda não grava de novo
+        if not FilaEscrita.escrever(db, lambda: db.adicionar_blacklist(id_unico), chave=f"blacklist:{id_unico}"):
+            return False
+
+        with cls._lock:
+            atualizado = cls._ids is not None and cls._versao_ids == cls._versao
+            cls._versao += 1
+            cls._historico[cls._versao] = id_unico
+            while len(cls._historico) > 1000:
+                cls._historico.popitem(last=False)
+
+            # Atualiza o conjunto em memória sem reler o banco
+            if atualizado:
+                cls._ids = cls._ids | {id_unico}
+                cls._versao_ids = cls._versao
+        return True
+
+    @classmethod
+    def invalidar(cls) -> None:
+        """Força a releitura do banco (ex: exclusões feitas por outro processo)."""
+        with cls._lock:
+            cls._versao += 1
+            cls._historico.clear()
+            cls._mascaras.clear()
+
+    @classmethod
+    def mascara_visivel(cls, db: Any, chave_dataset: Hashable, ids: pd.Series) -> np.ndarray:
+        """
+        Máscara booleana das linhas visíveis (fora da blacklist) de um dataset.
+
+        A máscara fica em cache por (dataset, versão). Quando a versão avança
+        apenas por exclusões conhecidas, a máscara anterior é atualizada só com
+        os IDs novos em vez de refazer o `isin` contra a blacklist inteira.
+
+        Args:
+            db: Instância do DatabaseManager
+            chave_dataset: Identificador estável do dataset carregado
+            ids: Série com o id_unico de cada linha
+
+        Returns:
+            Array booleano (True = linha visível). Não deve ser alterado.
+        """
+        with cls._lock:
+            versao_atual = cls._versao
+            cache = cls._mascaras.get(chave_dataset)
+
+            if cache is not None:
+                versao_cache, mascara = cache
+                if versao_cache == versao_atual:
+                    cls._mascaras.move_to_end(chave_dataset)
+                    return mascara
+
+                novos = [cls._historico.get(v) for v in range(versao_cache + 1, versao_atual + 1)]
+                if all(n is not None for n in novos):
+                    mascara = mascara & ~ids.isin(novos).to_numpy()
+                    mascara.flags.writeable = False
+                    cls._mascaras[chave_dataset] = (versao_atual, mascara)
+                    cls._mascaras.move_to_end(chave_dataset)
+                    return mascara
+
+        blacklist = cls.obter_ids(db)
+        if blacklist:
+            mascara = ~ids.isin(blacklist).to_numpy()
+        else:
+            mascara = np.ones(len(ids), dtype=bool)
+        mascara.flags.writeable = False
+
+        with cls._lock:
+            cls._mascaras[chave_dataset] = (versao_atual, mascara)
+            cls._mascaras.move_to_end(chave_dataset)
+            while len(cls._mascaras) > cls.MAX_MASCARAS:
+                cls._mascaras.popitem(last=False)
+        return mascara
+
+    @classmethod
+    def filtrar(cls, db: Any, chave_dataset: Hashable, df: pd.DataFrame, coluna: str = 'id_unico') -> pd.DataFrame:
+        """
+        Retorna apenas as linhas visíveis do dataset.
+
+        Se nada estiver excluído, devolve o próprio DataFrame (sem cópia).
+        """
+        if df.empty:
+            return df
+        mascara = cls.mascara_visivel(db, chave_dataset, df[coluna])
+        if mascara.all():
+            return df
+        return df[mascara]
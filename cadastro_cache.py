@@ -0,0 +1,241 @@
+"""
+Cache do Cadastro de Custos - Plante Forte
+Insumos e espécies em memória, com índice nome -> preço versionado e invalidado a cada edição
+"""
+
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from conexoes import FilaEscrita
+
+logger = logging.getLogger(__name__)
+
+
+class CadastroCache:
+    """
+    Cache process-wide das tabelas de insumos e espécies.
+
+    As tabelas são lidas do banco só quando a versão em memória está
+    desatualizada. Junto com os DataFrames ficam índices por nome
+    (dicionários), então cada consulta de preço é O(1) em vez de um
+    filtro sobre o DataFrame inteiro.
+
+    Edições devem passar pelos métodos daqui (atualizar_insumo,
+    adicionar_insumo, excluir_insumo, atualizar_especie_campo), que
+    gravam no banco e incrementam a versão. Gravações diretas no banco
+    (ex: CustosEngine) chamam `invalidar`.
+    """
+
+    # Colunas que o salvamento em lote pode alterar, por tabela
+    CAMPOS_EDITAVEIS = {
+        'insumos': ('nome', 'custo_unitario', 'unidade', 'categoria'),
+        'especies': ('custo_ponto',),
+    }
+
+    _lock = threading.RLock()
+    _versao = 0
+    _versao_carregada = -1
+    _insumos: Optional[pd.DataFrame] = None
+    _especies: Optional[pd.DataFrame] = None
+    # nome normalizado -> custo_unitario / linha da espécie
+    _preco_insumo: Dict[str, float] = {}
+    _especie_por_nome: Dict[str, Dict[str, Any]] = {}
+    # tamanho do saco (kg) -> nome do primeiro insumo com "Saco {t}kg" no nome
+    _nome_saco: Dict[float, Optional[str]] = {}
+
+    @staticmethod
+    def _chave(nome: Any) -> str:
+        return " ".join(str(nome).split()).lower()
+
+    @classmethod
+    def versao(cls) -> int:
+        """Versão atual do cadastro (muda a cada edição ou invalidação)."""
+        return cls._versao
+
+    @classmethod
+    def invalidar(cls) -> None:
+        """Força a releitura do banco na próxima consulta."""
+        with cls._lock:
+            cls._versao += 1
+
+    @classmethod
+    def _carregar(cls, db: Any) -> None:
+        with cls._lock:
+            if cls._versao_carregada == cls._versao and cls._insumos is not None:
+                return
+            versao = cls._versao
+            insumos = db.listar_insumos()
+            especies = db.listar_especies()
+            insumos = insumos if insumos is not None else pd.DataFrame(columns=['id', 'nome', 'custo_unitario', 'unidade', 'categoria'])
+            especies = especies if especies is not None else pd.DataFrame(columns=['id', 'nome', 'familia', 'custo_ponto', 'custo_kg_projetado'])
+
+            # Em nomes repetidos vale o primeiro, como no filtro `.iloc[0]` de antes
+            precos = {}
+            for nome, custo in zip(insumos['nome'], insumos['custo_unitario']):
+                precos.setdefault(cls._chave(nome), float(custo or 0.0))
+            por_nome = {}
+            for linha in especies.to_dict('records'):
+                por_nome.setdefault(cls._chave(linha['nome']), linha)
+
+            cls._insumos, cls._especies = insumos, especies
+            cls._preco_insumo, cls._especie_por_nome = precos, por_nome
+            cls._nome_saco = {}
+            cls._versao_carregada = versao
+            logger.info(f"Cadastro carregado do banco ({len(insumos)} insumos, {len(especies)} espécies, versão {versao})")
+
+    # ------------------------------------------------------------
+    # CONSULTAS
+    # ------------------------------------------------------------
+    @classmethod
+    def insumos(cls, db: Any) -> pd.DataFrame:
+        """Tabela de insumos (compartilhada: copiar antes de alterar)."""
+        cls._carregar(db)
+        return cls._insumos
+
+    @classmethod
+    def especies(cls, db: Any) -> pd.DataFrame:
+        """Tabela de espécies (compartilhada: copiar antes de alterar)."""
+        cls._carregar(db)
+        return cls._especies
+
+    @classmethod
+    def custo_insumo(cls, db: Any, nome: str) -> float:
+        """Custo unitário do insumo pelo nome exato (0 se não existir)."""
+        cls._carregar(db)
+        return cls._preco_insumo.get(cls._chave(nome), 0.0)
+
+    @classmethod
+    def especie(cls, db: Any, nome: str) -> Optional[Dict[str, Any]]:
+        """Dados da espécie pelo nome (dicionário com as colunas da tabela)."""
+        cls._carregar(db)
+        return cls._especie_por_nome.get(cls._chave(nome))
+
+    @classmethod
+    def nome_saco(cls, db: Any, tamanho: float) -> Optional[str]:
+        """Nome do primeiro insumo cujo nome contém 'Saco {tamanho}kg' (None se não houver)."""
+        cls._carregar(db)
+        with cls._lock:
+            if tamanho not in cls._nome_saco:
+                alvo = cls._chave(f"Saco {tamanho:g}kg")
+                cls._nome_saco[tamanho] = next(
+                    (nome for nome in cls._insumos['nome'] if alvo in cls._chave(nome)), None
+                )
+            return cls._nome_saco[tamanho]
+
+    @classmethod
+    def custo_saco(cls, db: Any, tamanho: float) -> float:
+        """Custo do insumo de `nome_saco` (0 se não houver)."""
+        nome = cls.nome_saco(db, tamanho)
+        return cls.custo_insumo(db, nome) if nome is not None else 0.0
+
+    # ------------------------------------------------------------
+    # EDIÇÕES (gravam no banco e invalidam)
+    # ------------------------------------------------------------
+    @classmethod
+    def atualizar_insumo(cls, db: Any, id_insumo: int, campo: str, valor: Any) -> Any:
+        try:
+            return db.atualizar_insumo(id_insumo, campo, valor)
+        finally:
+            cls.invalidar()
+
+    @classmethod
+    def adicionar_insumo(cls, db: Any, nome: str, unidade: str, custo: float, categoria: str) -> Any:
+        try:
+            return db.adicionar_insumo(nome, unidade, custo, categoria)
+        finally:
+            cls.invalidar()
+
+    @classmethod
+    def excluir_insumo(cls, db: Any, id_insumo: int) -> Any:
+        try:
+            return db.excluir_insumo(id_insumo)
+        finally:
+            cls.invalidar()
+
+    @classmethod
+    def atualizar_especie_campo(cls, db: Any, id_especie: int, campo: str, valor: Any) -> Any:
+        try:
+            return db.atualizar_especie_campo(id_especie, campo, valor)
+        finally:
+            cls.invalidar()
+
+    # ------------------------------------------------------------
+    # SALVAMENTO EM LOTE (editores da tabela de preços)
+    # ------------------------------------------------------------
+    @staticmethod
+    def diferencas(original: pd.DataFrame, editado: pd.DataFrame, campos: List[str],
+                   chave: str = 'id') -> pd.DataFrame:
+        """
+        Células alteradas entre a tabela original e a editada, sem laço por linha.
+
+        Returns:
+            DataFrame com id, campo, antes e depois (uma linha por célula alterada)
+        """
+        a = original.set_index(chave)[campos]
+        b = editado.set_index(chave)[campos]
+        ids = a.index.intersection(b.index)
+        a, b = a.loc[ids], b.loc[ids]
+        va, vb = a.to_numpy(dtype=object), b.to_numpy(dtype=object)
+        mudou = ~((va == vb) | (a.isna().to_numpy() & b.isna().to_numpy()))
+        linhas, colunas = np.nonzero(mudou)
+        return pd.DataFrame({
+            'id': ids.to_numpy()[linhas],
+            'campo': np.asarray(campos, dtype=object)[colunas],
+            'antes': va[linhas, colunas],
+            'depois': vb[linhas, colunas],
+        })
+
+    @staticmethod
+    def _nativo(valor: Any) -> Any:
+        """Converte escalares NumPy (int64, float64...) para tipos aceitos pelo sqlite3."""
+        if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+            return None
+        return valor.item() if isinstance(valor, np.generic) else valor
+
+    @classmethod
+    def aplicar_lote(cls, db: Any, tabela: str, alteracoes: pd.DataFrame, exclusoes: Iterable[int] = (),
+                     cascata: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Grava todas as alterações e exclusões numa única transação (pela fila de escrita).
+
+        Args:
+            db: Instância do DatabaseManager
+            tabela: 'insumos' ou 'especies'
+            alteracoes: Retorno de `diferencas` (id, campo, depois)
+            exclusoes: IDs a excluir
+            cascata: Função chamada com a conexão, dentro da mesma transação,
+                depois das gravações (ex: CustosEngine.propagar)
+
+        Returns:
+            Retorno de `cascata` (None se não houver)
+        """
+        campos_validos = cls.CAMPOS_EDITAVEIS[tabela]
+        exclusoes = [cls._nativo(i) for i in exclusoes]
+        invalidos = set(alteracoes['campo']) - set(campos_validos) if not alteracoes.empty else set()
+        if invalidos:
+            raise ValueError(f"Campos não editáveis em {tabela}: {sorted(invalidos)}")
+
+        def gravar():
+            conn = db._get_connection()
+            try:
+                with conn:
+                    for campo, grupo in alteracoes.groupby('campo'):
+                        conn.executemany(
+                            f"UPDATE {tabela} SET {campo} = ? WHERE id = ?",
+                            [(cls._nativo(v), cls._nativo(i)) for v, i in zip(grupo['depois'], grupo['id'])]
+                        )
+                    conn.executemany(f"DELETE FROM {tabela} WHERE id = ?", [(i,) for i in exclusoes])
+                    return cascata(conn) if cascata else None
+            finally:
+                conn.close()
+
+        try:
+            resultado = FilaEscrita.escrever(db, gravar)
+        finally:
+            cls.invalidar()
+        logger.info(f"Cadastro {tabela}: {len(alteracoes)} alterações e {len(exclusoes)} exclusões gravadas em lote")
+        return resultado
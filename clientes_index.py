@@ -0,0 +1,333 @@
+"""
+Índice de Clientes - Dashboard Comercial Tiny ERP
+Atividade por cliente (primeira/última compra, totais, canais) derivada do espelho de vendas
+"""
+
+import re
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, Tuple
+
+import pandas as pd
+
+from utils import TextUtils
+from perf_utils import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# Bits fixos por canal (são gravados no banco: não reordenar)
+BITS_CANAIS = {"Shopee": 1, "Mercado Livre": 2, "Site": 4, "Venda Direta": 8}
+
+
+class ClientesIndex:
+    """
+    Índice de atividade por cliente, mantido junto com `vendas_notas`.
+
+    - `clientes_dia`: total, pedidos e máscara de canais por (dia, cliente)
+    - `clientes_mes`: o mesmo por (mês, cliente), base da matriz de coortes
+    - `clientes_atividade`: primeira/última compra, total, pedidos e canais de toda a história
+
+    A identidade do cliente é o nome normalizado (sem acento, maiúsculo,
+    espaços colapsados), gravado em `vendas_notas.cliente_chave`. O
+    VendasStore chama `atualizar_periodo` na mesma transação em que regrava
+    dias, então o índice nunca diverge do espelho e nada é rebaixado da API.
+    """
+
+    BITS_CANAIS = BITS_CANAIS
+    BIT_PADRAO = 8  # canal desconhecido conta como Venda Direta
+
+    # Máscara -> "Canal A, Canal B" (no máximo 16 combinações)
+    NOMES_MASCARA = {
+        mascara: ", ".join(c for c, b in BITS_CANAIS.items() if mascara & b)
+        for mascara in range(16)
+    }
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    # ------------------------------------------------------------
+    # IDENTIDADE E CANAIS
+    # ------------------------------------------------------------
+    @staticmethod
+    def normalizar(nome: Any) -> str:
+        """Chave do cliente: sem acentos, maiúscula e com espaços colapsados."""
+        if not nome:
+            return ""
+        texto = TextUtils.remover_acentos(str(nome)).upper()
+        return re.sub(r"\s+", " ", texto).strip()
+
+    @classmethod
+    def bits_canais(cls, canais: Iterable[str]) -> int:
+        """Máscara de bits de uma lista de canais."""
+        mascara = 0
+        for canal in canais:
+            mascara |= cls.BITS_CANAIS.get(canal, cls.BIT_PADRAO)
+        return mascara
+
+    @classmethod
+    def _sql_bit_canal(cls) -> str:
+        casos = " ".join(f"WHEN '{c}' THEN {b}" for c, b in cls.BITS_CANAIS.items())
+        return f"(CASE canal {casos} ELSE {cls.BIT_PADRAO} END)"
+
+    @classmethod
+    def _sql_ou_canais(cls, coluna: str = "canais", condicao: str = "") -> str:
+        """OU bit a bit agregado (o SQLite não tem BIT_OR): MAX(c & 1) | MAX(c & 2) | ..."""
+        partes = []
+        for b in cls.BITS_CANAIS.values():
+            valor = f"{coluna} & {b}"
+            if condicao:
+                valor = f"CASE WHEN {condicao} THEN {valor} ELSE 0 END"
+            partes.append(f"MAX({valor})")
+        return " | ".join(partes)
+
+    # ------------------------------------------------------------
+    # ESQUEMA E MANUTENÇÃO (chamados pelo VendasStore)
+    # ------------------------------------------------------------
+    @classmethod
+    def criar_tabelas(cls, conn) -> bool:
+        """
+        Cria as tabelas do índice e a coluna `cliente_chave` em `vendas_notas`.
+
+        Returns:
+            True se o índice precisa ser reconstruído (espelho já tinha notas)
+        """
+        colunas = {row[1] for row in conn.execute("PRAGMA table_info(vendas_notas)")}
+        migrar = "cliente_chave" not in colunas
+        if migrar:
+            conn.execute("ALTER TABLE vendas_notas ADD COLUMN cliente_chave TEXT")
+            linhas = conn.execute("SELECT id_nota, cliente FROM vendas_notas").fetchall()
+            conn.executemany(
+                "UPDATE vendas_notas SET cliente_chave = ? WHERE id_nota = ?",
+                [(cls.normalizar(cliente), id_nota) for id_nota, cliente in linhas]
+            )
+
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS clientes_dia (
+                data TEXT NOT NULL,
+                cliente_chave TEXT NOT NULL,
+                nome TEXT,
+                total REAL NOT NULL DEFAULT 0,
+                pedidos INTEGER NOT NULL DEFAULT 0,
+                canais INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (data, cliente_chave)
+            );
+            CREATE INDEX IF NOT EXISTS idx_clientes_dia_cliente ON clientes_dia(cliente_chave);
+
+            CREATE TABLE IF NOT EXISTS clientes_mes (
+                mes TEXT NOT NULL,
+                cliente_chave TEXT NOT NULL,
+                total REAL NOT NULL DEFAULT 0,
+                pedidos INTEGER NOT NULL DEFAULT 0,
+                canais INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (mes, cliente_chave)
+            );
+
+            CREATE TABLE IF NOT EXISTS clientes_atividade (
+                cliente_chave TEXT PRIMARY KEY,
+                nome TEXT,
+                primeira_compra TEXT,
+                ultima_compra TEXT,
+                total REAL NOT NULL DEFAULT 0,
+                pedidos INTEGER NOT NULL DEFAULT 0,
+                canais INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+        vazio = (
+            conn.execute("SELECT 1 FROM clientes_atividade LIMIT 1").fetchone() is None
+            or conn.execute("SELECT 1 FROM clientes_mes LIMIT 1").fetchone() is None
+        )
+        tem_notas = conn.execute("SELECT 1 FROM vendas_notas LIMIT 1").fetchone() is not None
+        return tem_notas and (migrar or vazio)
+
+    @classmethod
+    def atualizar_periodo(cls, conn, ini: str, fim: str) -> None:
+        """
+        Recalcula `clientes_dia` para [ini, fim], `clientes_mes` para os meses
+        tocados e a atividade dos clientes afetados. Meses fora do intervalo
+        (já fechados) não são recalculados.
+
+        Roda dentro da transação de quem chamou (VendasStore).
+
+        Args:
+            conn: Conexão SQLite com transação aberta
+            ini: Primeiro dia (ISO)
+            fim: Último dia (ISO)
+        """
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS clientes_tocados (cliente_chave TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM clientes_tocados")
+        conn.execute(
+            "INSERT OR IGNORE INTO clientes_tocados "
+            "SELECT cliente_chave FROM clientes_dia WHERE data BETWEEN ? AND ?",
+            (ini, fim)
+        )
+
+        conn.execute("DELETE FROM clientes_dia WHERE data BETWEEN ? AND ?", (ini, fim))
+        conn.execute(
+            "INSERT INTO clientes_dia (data, cliente_chave, nome, total, pedidos, canais) "
+            f"SELECT data, cliente_chave, MAX(cliente), SUM(valor), COUNT(*), SUM(DISTINCT {cls._sql_bit_canal()}) "
+            "FROM vendas_notas "
+            "WHERE data BETWEEN ? AND ? AND excluida = 0 AND cliente_chave <> '' "
+            "GROUP BY data, cliente_chave",
+            (ini, fim)
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO clientes_tocados "
+            "SELECT cliente_chave FROM clientes_dia WHERE data BETWEEN ? AND ?",
+            (ini, fim)
+        )
+
+        conn.execute("DELETE FROM clientes_mes WHERE mes BETWEEN ? AND ?", (ini[:7], fim[:7]))
+        conn.execute(
+            "INSERT INTO clientes_mes (mes, cliente_chave, total, pedidos, canais) "
+            f"SELECT substr(data, 1, 7), cliente_chave, SUM(total), SUM(pedidos), {cls._sql_ou_canais()} "
+            "FROM clientes_dia WHERE data BETWEEN ? AND ? "
+            "GROUP BY substr(data, 1, 7), cliente_chave",
+            (ini[:7] + "-01", fim[:7] + "-31")
+        )
+
+        conn.execute(
+            "DELETE FROM clientes_atividade WHERE cliente_chave IN (SELECT cliente_chave FROM clientes_tocados)"
+        )
+        conn.execute(
+            "INSERT INTO clientes_atividade "
+            "(cliente_chave, nome, primeira_compra, ultima_compra, total, pedidos, canais) "
+            f"SELECT cliente_chave, MAX(nome), MIN(data), MAX(data), SUM(total), SUM(pedidos), {cls._sql_ou_canais()} "
+            "FROM clientes_dia "
+            "WHERE cliente_chave IN (SELECT cliente_chave FROM clientes_tocados) "
+            "GROUP BY cliente_chave"
+        )
+
+    def reconstruir(self) -> None:
+        """Refaz o índice inteiro a partir de `vendas_notas`."""
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM clientes_dia")
+                conn.execute("DELETE FROM clientes_mes")
+                conn.execute("DELETE FROM clientes_atividade")
+                self.atualizar_periodo(conn, "0000-01-01", "9999-12-31")
+        finally:
+            conn.close()
+        logger.info("Índice de clientes reconstruído")
+
+    # ------------------------------------------------------------
+    # CONSULTAS
+    # ------------------------------------------------------------
+    def comparar(self, data_ini_1: date, data_fim_1: date,
+                 data_ini_2: date, data_fim_2: date) -> pd.DataFrame:
+        """
+        Atividade de cada cliente em dois períodos, numa única consulta agregada.
+
+        Args:
+            data_ini_1, data_fim_1: Período 1 (referência)
+            data_ini_2, data_fim_2: Período 2 (comparação)
+
+        Returns:
+            DataFrame com colunas cliente_chave, nome, total_1, pedidos_1, canais_1,
+            total_2, pedidos_2, canais_2, primeira_compra, ultima_compra
+        """
+        p1 = "d.data BETWEEN :ini_1 AND :fim_1"
+        p2 = "d.data BETWEEN :ini_2 AND :fim_2"
+        params: Dict[str, str] = {
+            'ini_1': data_ini_1.isoformat(), 'fim_1': data_fim_1.isoformat(),
+            'ini_2': data_ini_2.isoformat(), 'fim_2': data_fim_2.isoformat(),
+        }
+        sql = (
+            "SELECT d.cliente_chave, a.nome, "
+            f"SUM(CASE WHEN {p1} THEN d.total ELSE 0 END) AS total_1, "
+            f"SUM(CASE WHEN {p1} THEN d.pedidos ELSE 0 END) AS pedidos_1, "
+            f"{self._sql_ou_canais('d.canais', p1)} AS canais_1, "
+            f"SUM(CASE WHEN {p2} THEN d.total ELSE 0 END) AS total_2, "
+            f"SUM(CASE WHEN {p2} THEN d.pedidos ELSE 0 END) AS pedidos_2, "
+            f"{self._sql_ou_canais('d.canais', p2)} AS canais_2, "
+            "a.primeira_compra, a.ultima_compra "
+            "FROM clientes_dia d JOIN clientes_atividade a ON a.cliente_chave = d.cliente_chave "
+            f"WHERE ({p1}) OR ({p2}) "
+            "GROUP BY d.cliente_chave"
+        )
+        conn = self.db._get_connection()
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    def impressao(self) -> Tuple:
+        """Resumo barato do índice; muda sempre que alguma nota entra, sai ou muda de valor."""
+        conn = self.db._get_connection()
+        try:
+            return tuple(conn.execute(
+                "SELECT COUNT(*), SUM(pedidos), ROUND(TOTAL(total), 2), MAX(ultima_compra) FROM clientes_atividade"
+            ).fetchone())
+        finally:
+            conn.close()
+
+    def matriz_coortes(self, mes_ini: str, mes_fim: str) -> Dict[str, pd.DataFrame]:
+        """
+        Matriz de coortes (mês de aquisição x meses seguintes), com cache.
+
+        Uma única consulta agregada sobre `clientes_mes` devolve, por (coorte, mês),
+        clientes ativos, receita e o canal de aquisição; o resto é pivot vetorizado.
+        O resultado fica no ResultCache até o índice mudar (ver `impressao`).
+
+        Args:
+            mes_ini: Primeira coorte ('AAAA-MM')
+            mes_fim: Última coorte e último mês observado ('AAAA-MM')
+
+        Returns:
+            Dicionário com DataFrames (linhas = coorte, colunas = M+0, M+1, ...):
+            'clientes', 'retencao' (%), 'receita', 'retencao_receita' (%) e
+            'canais' (% da coorte adquirida por canal; linhas = coorte, colunas = canal)
+        """
+        chave = ("coortes", mes_ini, mes_fim, self.impressao())
+        return ResultCache.obter(chave, lambda: self._calcular_coortes(mes_ini, mes_fim))
+
+    def _calcular_coortes(self, mes_ini: str, mes_fim: str) -> Dict[str, pd.DataFrame]:
+        colunas_canais = ", ".join(
+            f"SUM(CASE WHEN m.mes = c.coorte AND (m.canais & {b}) THEN 1 ELSE 0 END) AS \"{canal}\""
+            for canal, b in self.BITS_CANAIS.items()
+        )
+        sql = (
+            f"SELECT c.coorte, m.mes, COUNT(*) AS clientes, SUM(m.total) AS receita, {colunas_canais} "
+            "FROM clientes_mes m "
+            "JOIN (SELECT cliente_chave, substr(primeira_compra, 1, 7) AS coorte FROM clientes_atividade) c "
+            "ON c.cliente_chave = m.cliente_chave "
+            "WHERE c.coorte BETWEEN ? AND ? AND m.mes <= ? "
+            "GROUP BY c.coorte, m.mes"
+        )
+        conn = self.db._get_connection()
+        try:
+            df = pd.read_sql_query(sql, conn, params=(mes_ini, mes_fim, mes_fim))
+        finally:
+            conn.close()
+
+        if df.empty:
+            vazio = pd.DataFrame()
+            return {'clientes': vazio, 'retencao': vazio, 'receita': vazio,
+                    'retencao_receita': vazio, 'canais': vazio}
+
+        def indice_mes(serie: pd.Series) -> pd.Series:
+            return serie.str[:4].astype(int) * 12 + serie.str[5:7].astype(int)
+
+        df['offset'] = indice_mes(df['mes']) - indice_mes(df['coorte'])
+        colunas = [f"M+{i}" for i in range(int(df['offset'].max()) + 1)]
+
+        clientes = df.pivot(index='coorte', columns='offset', values='clientes')
+        receita = df.pivot(index='coorte', columns='offset', values='receita')
+        clientes.columns = receita.columns = [f"M+{i}" for i in clientes.columns]
+        clientes = clientes.reindex(columns=colunas)
+        receita = receita.reindex(columns=colunas)
+
+        base_clientes = clientes['M+0']
+        base_receita = receita['M+0'].where(receita['M+0'] > 0)
+
+        canais = df[df['offset'] == 0].set_index('coorte')[list(self.BITS_CANAIS)]
+        canais = canais.div(base_clientes, axis=0) * 100
+
+        return {
+            'clientes': clientes,
+            'retencao': clientes.div(base_clientes, axis=0) * 100,
+            'receita': receita,
+            'retencao_receita': receita.div(base_receita, axis=0) * 100,
+            'canais': canais,
+        }
@@ -0,0 +1,487 @@
+"""
+Conexões SQLite - Plante Forte
+Uma conexão por thread (WAL, pragmas ajustados, statements em cache), banco inicializado uma vez por processo
+e gravações serializadas numa fila com commit em grupo
+"""
+
+import json
+import time
+import queue
+import sqlite3
+import weakref
+import functools
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class ConexaoCompartilhada(sqlite3.Connection):
+    """
+    Conexão reaproveitada entre chamadas da mesma thread.
+
+    O código existente abre com `db._get_connection()` e fecha com
+    `conn.close()`. Aqui `close()` não fecha: só desfaz uma transação que
+    tenha ficado aberta (o mesmo efeito de fechar sem commit), e a conexão
+    volta a ficar disponível para a próxima consulta da thread.
+
+    Como a mesma conexão é entregue a chamadas aninhadas da thread, `usuarios`
+    conta as aberturas ainda não fechadas: só o `close()` do usuário mais
+    externo desfaz a transação (um helper que abre e fecha no meio não
+    descarta o trabalho de quem o chamou).
+    """
+
+    usuarios = 0
+
+    def emprestar(self) -> "ConexaoCompartilhada":
+        """Registra mais um usuário da conexão (chamado a cada `_get_connection()`)."""
+        self.usuarios += 1
+        return self
+
+    def close(self) -> None:
+        self.usuarios = max(0, self.usuarios - 1)
+        if self.usuarios == 0 and self.in_transaction:
+            self.rollback()
+
+    def fechar(self) -> None:
+        """Fecha de verdade (fim do processo ou troca de banco)."""
+        super().close()
+
+
+class ConexaoEscritora(ConexaoCompartilhada):
+    """
+    Conexão da thread de escrita (autocommit; a fila controla as transações).
+
+    Enquanto um lote está aberto, cada escrita roda dentro do savepoint
+    `escrita`, com um savepoint interno `pendente` marcando o que ela ainda
+    não confirmou:
+
+    - `commit()` confirma o pendente (RELEASE + novo SAVEPOINT pendente),
+      sem encerrar a transação do grupo
+    - `rollback()` desfaz só o que está pendente
+    - `close()` não fecha; o que ficou sem commit é descartado pela fila
+      ao fim da escrita (como fechar uma conexão sem commit)
+    """
+
+    em_lote = False
+
+    def commit(self) -> None:
+        if self.em_lote:
+            self.execute("RELEASE SAVEPOINT pendente")
+            self.execute("SAVEPOINT pendente")
+        else:
+            super().commit()
+
+    def rollback(self) -> None:
+        if self.em_lote:
+            self.execute("ROLLBACK TO SAVEPOINT pendente")
+        else:
+            super().rollback()
+
+    def close(self) -> None:
+        if self.em_lote:
+            self.usuarios = max(0, self.usuarios - 1)
+        else:
+            super().close()
+
+    def __exit__(self, tipo, valor, rastro):
+        # O __exit__ nativo faz COMMIT direto, sem passar por commit()
+        if not self.em_lote:
+            return super().__exit__(tipo, valor, rastro)
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+class _Reserva:
+    """Conexões em uso por uma thread (devolvidas ao pool quando a thread termina)."""
+
+    def __init__(self):
+        self.conexoes: Dict[str, ConexaoCompartilhada] = {}
+
+
+class PoolConexoes:
+    """
+    Conexões SQLite por thread, process-wide.
+
+    Cada thread usa sempre a mesma conexão; quando a thread termina (o
+    Streamlit roda cada rerun numa thread nova), a conexão volta para uma
+    lista de ociosas e é reaproveitada pela próxima, sem reabrir o arquivo
+    nem reaplicar os pragmas.
+
+    - journal_mode=WAL: leitores não esperam o escritor (e vice-versa)
+    - synchronous=NORMAL: seguro com WAL, sem fsync a cada commit
+    - cache_size / mmap_size: páginas quentes em memória entre reruns
+    - busy_timeout: escritores concorrentes esperam em vez de falhar na hora
+    - cached_statements: SQL repetido reaproveita o statement preparado
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -65536",       # 64 MB
+        "PRAGMA mmap_size = 268435456",     # 256 MB
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA busy_timeout = 10000",
+    )
+    STATEMENTS_EM_CACHE = 256
+    MAX_OCIOSAS = 8
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    _ociosas: Dict[str, List[ConexaoCompartilhada]] = {}
+    estatisticas = {'abertas': 0, 'reaproveitadas': 0}
+
+    @classmethod
+    def _abrir(cls, caminho: str) -> ConexaoCompartilhada:
+        conn = sqlite3.connect(
+            caminho,
+            timeout=10,
+            factory=ConexaoCompartilhada,
+            cached_statements=cls.STATEMENTS_EM_CACHE,
+            check_same_thread=False,  # passa de thread em thread, mas nunca em duas ao mesmo tempo
+        )
+        for pragma in cls.PRAGMAS:
+            conn.execute(pragma)
+        cls.estatisticas['abertas'] += 1
+        return conn
+
+    @classmethod
+    def _devolver(cls, conexoes: Dict[str, ConexaoCompartilhada]) -> None:
+        with cls._lock:
+            for caminho, conn in conexoes.items():
+                conn.usuarios = 0
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except sqlite3.Error:
+                    conn.fechar()
+                    continue
+                ociosas = cls._ociosas.setdefault(caminho, [])
+                if len(ociosas) < cls.MAX_OCIOSAS:
+                    ociosas.append(conn)
+                else:
+                    conn.fechar()
+            conexoes.clear()
+
+    @classmethod
+    def conexao(cls, caminho: str, row_factory: Any = None) -> ConexaoCompartilhada:
+        """
+        Conexão da thread atual para o banco em `caminho`.
+
+        Args:
+            caminho: Arquivo do banco
+            row_factory: Mesmo row_factory das conexões originais do DatabaseManager
+        """
+        reserva: Optional[_Reserva] = getattr(cls._local, 'reserva', None)
+        if reserva is None:
+            reserva = cls._local.reserva = _Reserva()
+            weakref.finalize(reserva, cls._devolver, reserva.conexoes)
+
+        conn = reserva.conexoes.get(caminho)
+        if conn is None:
+            with cls._lock:
+                ociosas = cls._ociosas.get(caminho)
+                conn = ociosas.pop() if ociosas else None
+            if conn is None:
+                conn = cls._abrir(caminho)
+            else:
+                cls.estatisticas['reaproveitadas'] += 1
+            conn.row_factory = row_factory
+            reserva.conexoes[caminho] = conn
+        return conn.emprestar()
+
+    @classmethod
+    def fixar(cls, caminho: str, conn: ConexaoCompartilhada) -> None:
+        """Usa `conn` como conexão da thread atual para `caminho` (sem devolvê-la ao pool)."""
+        reserva = getattr(cls._local, 'reserva', None)
+        if reserva is None:
+            reserva = cls._local.reserva = _Reserva()
+        reserva.conexoes[caminho] = conn
+
+    @classmethod
+    def fechar_todas(cls) -> None:
+        """Fecha as conexões ociosas e as da thread atual."""
+        reserva = getattr(cls._local, 'reserva', None)
+        if reserva is not None:
+            cls._devolver(reserva.conexoes)
+        with cls._lock:
+            for ociosas in cls._ociosas.values():
+                for conn in ociosas:
+                    conn.fechar()
+            cls._ociosas.clear()
+
+
+class _Escrita:
+    __slots__ = ('funcao', 'chave', 'futuro')
+
+    def __init__(self, funcao: Callable[[], Any], chave: Optional[str], futuro: Future):
+        self.funcao = funcao
+        self.chave = chave
+        self.futuro = futuro
+
+
+class FilaEscrita:
+    """
+    Escritor único do banco: uma thread dedicada executa todas as gravações.
+
+    Quem grava recebe um Future (`enviar`) ou espera a confirmação
+    (`executar`). A thread junta tudo o que estiver pendente num único
+    BEGIN IMMEDIATE ... COMMIT (commit em grupo), com um savepoint por
+    escrita: uma escrita que falha é desfeita sozinha e as outras do lote
+    seguem. Como só essa thread escreve, sessões concorrentes não disputam
+    o lock do SQLite.
+
+    Idempotência: com `chave`, a escrita é registrada em
+    `escritas_idempotentes` na mesma transação. Repetir a chave (retry,
+    clique duplo, rerun) devolve o resultado gravado sem executar de novo;
+    enquanto a primeira ainda está na fila, devolve o mesmo Future.
+    Resultados False não são registrados, para que o retry tente outra vez.
+    """
+
+    MAX_LOTE = 256
+    TIMEOUT = 60
+    RETENCAO_CHAVES = 7 * 24 * 3600  # segundos
+
+    def __init__(self, caminho: str, row_factory: Any = None):
+        self.caminho = caminho
+        self.row_factory = row_factory
+        self.estatisticas = {'escritas': 0, 'lotes': 0, 'repetidas': 0, 'falhas': 0}
+        self._fila: "queue.Queue[_Escrita]" = queue.Queue()
+        self._pendentes: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._executar_fila, name="fila-escrita", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+    def na_escritora(self) -> bool:
+        """True se a thread atual é a de escrita (ex: escrita chamando outra escrita)."""
+        return threading.current_thread() is self._thread
+
+    def enviar(self, funcao: Callable[[], Any], chave: Optional[str] = None) -> Future:
+        """
+        Enfileira uma escrita.
+
+        Args:
+            funcao: Executada na thread de escrita; grava via `db._get_connection()`
+            chave: Chave de idempotência (opcional)
+
+        Returns:
+            Future com o retorno de `funcao`
+        """
+        if chave is None:
+            futuro = Future()
+        else:
+            with self._lock:
+                futuro = self._pendentes.get(chave)
+                if futuro is not None:
+                    return futuro
+                futuro = self._pendentes[chave] = Future()
+        self._fila.put(_Escrita(funcao, chave, futuro))
+        return futuro
+
+    def executar(self, funcao: Callable[[], Any], chave: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Any:
+        """Enfileira e espera a confirmação (roda direto se já estiver na thread de escrita)."""
+        if self.na_escritora():
+            return funcao()
+        return self.enviar(funcao, chave).result(timeout or self.TIMEOUT)
+
+    @staticmethod
+    def escrever(db: Any, funcao: Callable[[], Any], chave: Optional[str] = None) -> Any:
+        """
+        Executa `funcao` pela fila de escrita do `db`.
+
+        Sem fila (DatabaseManager não ligado ao BancoCompartilhado), executa direto.
+        """
+        fila = getattr(db, 'fila_escrita', None)
+        return fila.executar(funcao, chave) if fila is not None else funcao()
+
+    # ------------------------------------------------------------
+    # THREAD DE ESCRITA
+    # ------------------------------------------------------------
+    def _conectar(self) -> ConexaoEscritora:
+        conn = sqlite3.connect(
+            self.caminho,
+            timeout=10,
+            factory=ConexaoEscritora,
+            isolation_level=None,
+            cached_statements=PoolConexoes.STATEMENTS_EM_CACHE,
+            check_same_thread=False,
+        )
+        for pragma in PoolConexoes.PRAGMAS:
+            conn.execute(pragma)
+        conn.row_factory = self.row_factory
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS escritas_idempotentes ("
+            "chave TEXT PRIMARY KEY, resultado TEXT, criado_em REAL NOT NULL)"
+        )
+        conn.execute(
+            "DELETE FROM escritas_idempotentes WHERE criado_em < ?",
+            (time.time() - self.RETENCAO_CHAVES,)
+        )
+        # Escritas que gravam via db._get_connection() usam esta conexão
+        PoolConexoes.fixar(self.caminho, conn)
+        return conn
+
+    def _executar_fila(self) -> None:
+        conn = self._conectar()
+        while True:
+            lote = [self._fila.get()]
+            # Commit em grupo: tudo o que chegou enquanto o lote anterior gravava
+            while len(lote) < self.MAX_LOTE:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            self._gravar(conn, lote)
+
+    @staticmethod
+    def _encerrar(conn: ConexaoEscritora, resultado: Any) -> None:
+        """Descarta o que a escrita não confirmou com commit(); tudo dela, se devolveu False."""
+        if not conn.in_transaction:
+            return
+        if resultado is False:
+            conn.execute("ROLLBACK TO SAVEPOINT escrita")
+        else:
+            conn.execute("ROLLBACK TO SAVEPOINT pendente")
+
+    def _aplicar(self, conn: ConexaoEscritora, escrita: _Escrita) -> Any:
+        if escrita.chave is not None:
+            linha = conn.execute(
+                "SELECT resultado FROM escritas_idempotentes WHERE chave = ?", (escrita.chave,)
+            ).fetchone()
+            if linha is not None:
+                self.estatisticas['repetidas'] += 1
+                return json.loads(linha[0])
+        resultado = escrita.funcao()
+        self._encerrar(conn, resultado)
+        if escrita.chave is not None and resultado is not False:
+            conn.execute(
+                "INSERT INTO escritas_idempotentes (chave, resultado, criado_em) VALUES (?, ?, ?)",
+                (escrita.chave, json.dumps(resultado, default=str), time.time())
+            )
+        return resultado
+
+    def _gravar(self, conn: ConexaoEscritora, lote: List[_Escrita]) -> None:
+        resultados: List[Tuple[_Escrita, Any, Optional[BaseException]]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.em_lote = True
+            for escrita in lote:
+                conn.execute("SAVEPOINT escrita")
+                conn.execute("SAVEPOINT pendente")
+                conn.usuarios = 0
+                try:
+                    resultado = self._aplicar(conn, escrita)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO SAVEPOINT escrita")
+                    conn.execute("RELEASE SAVEPOINT escrita")
+                    resultados.append((escrita, None, e))
+                    continue
+                if conn.in_transaction:
+                    conn.execute("RELEASE SAVEPOINT escrita")
+                else:
+                    # A escrita encerrou a transação por conta própria (ex: executescript)
+                    conn.execute("BEGIN IMMEDIATE")
+                resultados.append((escrita, resultado, None))
+            conn.em_lote = False
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.em_lote = False
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Falha no commit do lote de escrita ({len(lote)} escritas): {e}")
+            resultados = [(escrita, None, e) for escrita in lote]
+
+        self.estatisticas['lotes'] += 1
+        for escrita, resultado, erro in resultados:
+            if escrita.chave is not None:
+                with self._lock:
+                    self._pendentes.pop(escrita.chave, None)
+            if erro is None:
+                self.estatisticas['escritas'] += 1
+                escrita.futuro.set_result(resultado)
+            else:
+                self.estatisticas['falhas'] += 1
+                escrita.futuro.set_exception(erro)
+
+
+class BancoCompartilhado:
+    """
+    DatabaseManager único por processo, já ligado ao pool.
+
+    Nas páginas, `BancoCompartilhado.obter()` substitui o par
+    `DatabaseManager()` + `inicializar_banco()` de cada rerun:
+
+    - o caminho do banco vem de `PRAGMA database_list` de uma conexão original
+    - `_get_connection` da instância passa a devolver a conexão da thread
+    - `inicializar_banco` roda uma vez por processo (é idempotente, CREATE IF NOT
+      EXISTS), então tabelas e colunas novas chegam aos bancos já existentes
+    - os métodos de METODOS_ESCRITA passam pela FilaEscrita (`db.fila_escrita`)
+    """
+
+    METODOS_ESCRITA = (
+        'adicionar_lancamento', 'excluir_lancamento', 'adicionar_cliente',
+        'adicionar_blacklist', 'registrar_lote_producao',
+        'adicionar_insumo', 'atualizar_insumo', 'excluir_insumo', 'atualizar_especie_campo',
+    )
+
+    _lock = threading.Lock()
+    _db: Optional[Any] = None
+
+    @staticmethod
+    def caminho_banco(conn: sqlite3.Connection) -> str:
+        """Arquivo do banco principal de uma conexão."""
+        for _, nome, arquivo in conn.execute("PRAGMA database_list").fetchall():
+            if nome == "main":
+                return arquivo
+        raise RuntimeError("Conexão sem banco principal")
+
+    @staticmethod
+    def _enfileirar(fila: FilaEscrita, metodo: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(metodo)
+        def escrita(*args, **kwargs):
+            return fila.executar(lambda: metodo(*args, **kwargs))
+        return escrita
+
+    @classmethod
+    def ligar(cls, db: Any) -> Any:
+        """
+        Liga uma instância de DatabaseManager ao pool de conexões e à fila de escrita.
+
+        Returns:
+            A própria instância (com `_get_connection` e os métodos de escrita trocados)
+        """
+        original = db._get_connection()
+        try:
+            caminho = cls.caminho_banco(original)
+            row_factory = original.row_factory
+        finally:
+            original.close()
+        db._get_connection = lambda: PoolConexoes.conexao(caminho, row_factory)
+        db.fila_escrita = FilaEscrita(caminho, row_factory)
+        for nome in cls.METODOS_ESCRITA:
+            if hasattr(db, nome):
+                setattr(db, nome, cls._enfileirar(db.fila_escrita, getattr(db, nome)))
+        return db
+
+    @classmethod
+    def obter(cls) -> Any:
+        """DatabaseManager do processo (criado, ligado e inicializado na primeira chamada)."""
+        if cls._db is not None:
+            return cls._db
+        with cls._lock:
+            if cls._db is None:
+                db = cls.ligar(DatabaseManager())
+                db.inicializar_banco()
+                cls._db = db
+        return cls._db
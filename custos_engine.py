@@ -0,0 +1,309 @@
+"""
+Motor de Custos - Plante Forte
+Propaga mudanças de preço de insumos e de custo do ponto para espécies e produtos padrão
+"""
+
+import re
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import TextUtils
+from conexoes import FilaEscrita
+from cadastro_cache import CadastroCache
+
+logger = logging.getLogger(__name__)
+
+PROCESSO_CONVENCIONAL = "SEMENTE CONVENCIONAL"
+PROCESSO_INCRUSTADO = "SEMENTE INCRUSTADA GRAFITADA"
+
+# Batidas de referência (mesmos valores iniciais da calculadora de Custos de Produção)
+RECEITAS: Dict[str, Dict[str, float]] = {
+    PROCESSO_CONVENCIONAL: {"qtd_batida": 1000.0, "pureza_ini": 62.0, "pureza_des": 27.0, "perc_palha": 20.0},
+    PROCESSO_INCRUSTADO: {"qtd_semente": 338.0, "pureza_final": 90.0, "qtd_seedgel": 900.0, "qtd_grafite": 13.5},
+}
+
+INSUMO_ANALISE = "Analise Laboratorio"
+
+# Embalagens oferecidas em cada processo (kg)
+TAMANHOS_POR_PROCESSO: Dict[str, List[int]] = {
+    PROCESSO_CONVENCIONAL: [5, 20],
+    PROCESSO_INCRUSTADO: [2, 10],
+}
+
+
+class CustosEngine:
+    """
+    Dependências de custo entre insumos, espécies e produtos padrão.
+
+    O custo por kg de uma batida é linear nos preços: pontos x custo do ponto
+    mais kg de cada insumo x preço do insumo, dividido pelo peso final.
+    Assim a variação de custo de cada item é a matriz de coeficientes
+    (kg de insumo por kg de produto) vezes o vetor de variações de preço.
+
+    - Espécie: `custo_kg_projetado` segue a batida convencional de referência
+      (a palha depende da família)
+    - Produto padrão: tamanho do saco (kg, lido da descrição) x custo/kg da
+      espécie de mesmo nome, no processo indicado na descrição, mais o saco
+      (o insumo de `CadastroCache.nome_saco`, o mesmo da precificação)
+
+    Só a variação é propagada: o que já estiver embutido no custo atual
+    (ajustes manuais, outros agregados) é preservado. Itens ainda sem
+    custo gravado (NULL) ficam como estão.
+    """
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    # ------------------------------------------------------------
+    # MODELO
+    # ------------------------------------------------------------
+    @staticmethod
+    def _chave(nome: Any) -> str:
+        return " ".join(TextUtils.remover_acentos(str(nome)).split())
+
+    @staticmethod
+    def nome_palha(familia: str) -> str:
+        return "Palha Panicum" if familia == "Panicum" else "Palha Brachiaria"
+
+    @classmethod
+    def coeficientes(cls, processo: str, familia: str) -> Tuple[float, Dict[str, float]]:
+        """
+        Coeficientes de 1 kg da batida de referência.
+
+        Returns:
+            (pontos por kg, {nome do insumo: quantidade por kg})
+        """
+        r = RECEITAS[processo]
+        if processo == PROCESSO_CONVENCIONAL:
+            qtd = r["qtd_batida"]
+            pontos = qtd * r["pureza_des"]
+            enchimento = qtd - pontos / r["pureza_ini"]
+            kg_palha = enchimento * r["perc_palha"] / 100
+            insumos = {cls.nome_palha(familia): kg_palha, "Granulado": enchimento - kg_palha}
+        else:
+            qtd = r["qtd_semente"] + r["qtd_seedgel"] + r["qtd_grafite"]
+            pontos = r["qtd_semente"] * r["pureza_final"]
+            insumos = {"Seedgel": r["qtd_seedgel"], "Grafite": r["qtd_grafite"]}
+        insumos[INSUMO_ANALISE] = 1.0
+        return pontos / qtd, {nome: kg / qtd for nome, kg in insumos.items()}
+
+    @classmethod
+    def batida_referencia(cls, processo: str, familia: str, custo_ponto: float,
+                          preco_insumo: Callable[[str], float]) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Composição da batida de referência com os preços atuais (mesmo formato da calculadora).
+
+        Args:
+            preco_insumo: Nome do insumo -> custo unitário (ex: CadastroCache.custo_insumo)
+
+        Returns:
+            (itens [{nome, peso, valor}], peso total da batida em kg)
+        """
+        coef_ponto, coef = cls.coeficientes(processo, familia)
+        r = RECEITAS[processo]
+        if processo == PROCESSO_CONVENCIONAL:
+            peso_total = r["qtd_batida"]
+            semente = ("Semente Pura", peso_total * r["pureza_des"] / r["pureza_ini"])
+        else:
+            peso_total = r["qtd_semente"] + r["qtd_seedgel"] + r["qtd_grafite"]
+            semente = ("Semente Base", r["qtd_semente"])
+
+        itens = [{"nome": semente[0], "peso": semente[1], "valor": coef_ponto * peso_total * custo_ponto}]
+        for nome, kg_por_kg in coef.items():
+            if nome == INSUMO_ANALISE:
+                itens.append({"nome": "Analise Lab", "peso": 0, "valor": preco_insumo(nome)})
+            else:
+                itens.append({"nome": nome, "peso": kg_por_kg * peso_total, "valor": kg_por_kg * peso_total * preco_insumo(nome)})
+        return itens, peso_total
+
+    @classmethod
+    def _matriz(cls, processos: np.ndarray, familias: np.ndarray,
+                insumos: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Coeficientes por kg de várias linhas de uma vez.
+
+        Returns:
+            (pontos por kg (n,), matriz (n, len(insumos)) de kg de insumo por kg)
+        """
+        n = len(processos)
+        pontos = np.zeros(n)
+        matriz = np.zeros((n, len(insumos)))
+        chaves = [cls._chave(i) for i in insumos]
+        for processo in RECEITAS:
+            for familia in pd.unique(familias):
+                linhas = (processos == processo) & (familias == familia)
+                if not linhas.any():
+                    continue
+                coef_ponto, coef = cls.coeficientes(processo, familia)
+                coef = {cls._chave(k): v for k, v in coef.items()}
+                pontos[linhas] = coef_ponto
+                matriz[linhas] = [coef.get(c, 0.0) for c in chaves]
+        return pontos, matriz
+
+    @classmethod
+    def _produtos(cls, produtos: pd.DataFrame, especies: pd.DataFrame) -> pd.DataFrame:
+        """Liga cada produto padrão à espécie, ao processo e ao tamanho do saco."""
+        df = produtos.copy()
+        texto = (df['nome'].astype(str) + " " + df['descricao'].fillna("").astype(str)).map(cls._chave)
+        df['tamanho'] = pd.to_numeric(
+            texto.str.extract(r'(\d+(?:[.,]\d+)?)\s*KG', expand=False).str.replace(',', '.'), errors='coerce'
+        ).fillna(0.0)
+        df['processo'] = np.where(texto.str.contains("INCRUST"), PROCESSO_INCRUSTADO, PROCESSO_CONVENCIONAL)
+
+        # Espécie: nome igual; senão, o nome de espécie mais longo contido no nome do produto
+        chaves_esp = especies.assign(chave=especies['nome'].map(cls._chave)).sort_values(
+            'chave', key=lambda s: s.str.len(), ascending=False
+        )
+        nome_prod = df['nome'].map(cls._chave)
+        df['especie_id'] = nome_prod.map(dict(zip(chaves_esp['chave'], chaves_esp['id'])))
+        for chave, id_esp in zip(chaves_esp['chave'], chaves_esp['id']):
+            faltando = df['especie_id'].isna()
+            if not faltando.any():
+                break
+            contem = faltando & nome_prod.map(lambda n: re.search(rf"\b{re.escape(chave)}\b", n) is not None)
+            df.loc[contem, 'especie_id'] = id_esp
+        return df
+
+    def _nomes_saco(self, tamanhos: pd.Series) -> pd.Series:
+        """Insumo do saco de cada tamanho ("" se não houver), pela regra de CadastroCache.custo_saco."""
+        nomes = {t: CadastroCache.nome_saco(self.db, t) for t in pd.unique(tamanhos) if t > 0}
+        return tamanhos.map(lambda t: nomes.get(t) or "")
+
+    def dependencias(self) -> pd.DataFrame:
+        """
+        Tabela das dependências modeladas (para conferência).
+
+        Returns:
+            DataFrame com Item, Tipo, Depende de e Coeficiente (por unidade do item)
+        """
+        especies, produtos = self._carregar()
+        linhas = []
+        for e in especies.itertuples():
+            coef_ponto, coef = self.coeficientes(PROCESSO_CONVENCIONAL, e.familia)
+            linhas.append((e.nome, "Espécie (R$/kg)", "Custo Ponto", coef_ponto))
+            linhas.extend((e.nome, "Espécie (R$/kg)", nome, c) for nome, c in coef.items())
+        if not produtos.empty:
+            df = self._produtos(produtos, especies)
+            df['saco'] = self._nomes_saco(df['tamanho'])
+            nomes_esp = dict(zip(especies['id'], especies['nome']))
+            familias = dict(zip(especies['id'], especies['familia']))
+            for p in df.itertuples():
+                item = f"{p.sku} - {p.nome}"
+                if p.tamanho > 0:
+                    linhas.append((item, "Produto (R$)", p.saco or f"Saco {p.tamanho:g}kg", 1.0))
+                if pd.notna(p.especie_id) and p.tamanho > 0:
+                    coef_ponto, coef = self.coeficientes(p.processo, familias[p.especie_id])
+                    linhas.append((item, "Produto (R$)", f"Custo Ponto ({nomes_esp[p.especie_id]})", coef_ponto * p.tamanho))
+                    linhas.extend((item, "Produto (R$)", nome, c * p.tamanho) for nome, c in coef.items())
+        return pd.DataFrame(linhas, columns=['Item', 'Tipo', 'Depende de', 'Coeficiente'])
+
+    # ------------------------------------------------------------
+    # PROPAGAÇÃO
+    # ------------------------------------------------------------
+    def _carregar(self, conn=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        proprio = conn is None
+        conn = conn or self.db._get_connection()
+        try:
+            especies = pd.read_sql_query(
+                "SELECT id, nome, familia, custo_ponto, custo_kg_projetado FROM especies", conn
+            )
+            produtos = pd.read_sql_query(
+                "SELECT sku, nome, descricao, custo_padrao FROM produtos_padrao", conn
+            )
+        finally:
+            if proprio:
+                conn.close()
+        return especies, produtos
+
+    def _recalcular(self, conn, nomes: List[str], delta_insumos: np.ndarray,
+                    custos_ponto: Dict[int, Tuple[float, float]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Aplica as variações na conexão informada; retorna (espécies, produtos) alterados com a coluna 'novo'."""
+        especies, produtos = self._carregar(conn)
+        delta_ponto = especies['id'].map(
+            {k: novo - antigo for k, (antigo, novo) in custos_ponto.items()}
+        ).fillna(0.0).to_numpy()
+        familias = especies['familia'].fillna("").to_numpy()
+
+        # Espécies: d(custo/kg) = pontos/kg x d(ponto) + kg insumo/kg . d(preço)
+        pontos, matriz = self._matriz(
+            np.full(len(especies), PROCESSO_CONVENCIONAL), familias, nomes
+        )
+        delta_esp = pontos * delta_ponto + matriz @ delta_insumos
+        # Sem custo gravado (ex: espécie sem lote) não há base para aplicar a variação
+        base_esp = pd.to_numeric(especies['custo_kg_projetado'], errors='coerce')
+        especies['novo'] = base_esp + delta_esp
+        esp_mudou = especies[(np.abs(delta_esp) > 1e-9) & base_esp.notna().to_numpy()]
+
+        # Produtos: d(custo) = tamanho x d(custo/kg no processo do produto) + d(saco)
+        prod_mudou = produtos.assign(novo=0.0).iloc[0:0]
+        if not produtos.empty:
+            df = self._produtos(produtos, especies)
+            tem_esp = df['especie_id'].notna().to_numpy()
+            familia_prod = df['especie_id'].map(dict(zip(especies['id'], familias))).fillna("").to_numpy()
+            ponto_prod = df['especie_id'].map(dict(zip(especies['id'], delta_ponto))).fillna(0.0).to_numpy()
+            pontos_p, matriz_p = self._matriz(df['processo'].to_numpy(), familia_prod, nomes)
+            # Sem espécie associada, o produto só depende do saco
+            delta_kg = np.where(tem_esp, pontos_p * ponto_prod + matriz_p @ delta_insumos, 0.0)
+            chaves = np.array([self._chave(n) for n in nomes])
+            sacos = self._nomes_saco(df['tamanho']).map(lambda n: self._chave(n) if n else "").to_numpy()
+            saco = (sacos[:, None] == chaves[None, :]).astype(float)
+            delta_prod = df['tamanho'].to_numpy() * delta_kg + saco @ delta_insumos
+            base_prod = pd.to_numeric(df['custo_padrao'], errors='coerce')
+            df['novo'] = base_prod + delta_prod
+            prod_mudou = df[(np.abs(delta_prod) > 1e-9) & base_prod.notna().to_numpy()]
+
+        conn.executemany(
+            "UPDATE especies SET custo_kg_projetado = ? WHERE id = ?",
+            list(zip(esp_mudou['novo'].round(4).tolist(), esp_mudou['id'].tolist()))
+        )
+        conn.executemany(
+            "UPDATE produtos_padrao SET custo_padrao = ? WHERE sku = ?",
+            list(zip(prod_mudou['novo'].round(4).tolist(), prod_mudou['sku'].tolist()))
+        )
+        return esp_mudou, prod_mudou
+
+    def propagar(self, insumos: Dict[str, Tuple[float, float]],
+                 custos_ponto: Dict[int, Tuple[float, float]] = None, conn=None) -> pd.DataFrame:
+        """
+        Recalcula só os itens afetados pelas mudanças e grava numa transação.
+
+        Args:
+            insumos: Nome do insumo -> (preço antigo, preço novo)
+            custos_ponto: ID da espécie -> (custo do ponto antigo, novo)
+            conn: Conexão com transação já aberta (ex: salvamento em lote do
+                cadastro); quem abriu faz o commit. Sem ela, abre e fecha a própria
+
+        Returns:
+            Diff com Tipo, Item, Antes, Depois e Variação (só o que mudou)
+        """
+        colunas = ['Tipo', 'Item', 'Antes', 'Depois', 'Variação']
+        custos_ponto = custos_ponto or {}
+        nomes = [n for n, (antigo, novo) in insumos.items() if antigo != novo]
+        delta_insumos = np.array([insumos[n][1] - insumos[n][0] for n in nomes], dtype=float)
+        if not nomes and not custos_ponto:
+            return pd.DataFrame(columns=colunas)
+
+        if conn is not None:
+            esp_mudou, prod_mudou = self._recalcular(conn, nomes, delta_insumos, custos_ponto)
+        else:
+            def gravar():
+                conn = self.db._get_connection()
+                try:
+                    with conn:
+                        return self._recalcular(conn, nomes, delta_insumos, custos_ponto)
+                finally:
+                    conn.close()
+            esp_mudou, prod_mudou = FilaEscrita.escrever(self.db, gravar)
+
+        diff = pd.concat([
+            pd.DataFrame({'Tipo': "Espécie (R$/kg)", 'Item': esp_mudou['nome'],
+                          'Antes': esp_mudou['custo_kg_projetado'], 'Depois': esp_mudou['novo']}),
+            pd.DataFrame({'Tipo': "Produto Padrão (R$)", 'Item': prod_mudou['sku'].astype(str) + " - " + prod_mudou['nome'],
+                          'Antes': prod_mudou['custo_padrao'], 'Depois': prod_mudou['novo']}),
+        ], ignore_index=True)
+        diff['Variação'] = diff['Depois'] - diff['Antes']
+        logger.info(f"Custos recalculados: {len(esp_mudou)} espécies, {len(prod_mudou)} produtos")
+        return diff[colunas]
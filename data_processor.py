@@ -6,6 +6,7 @@ Realiza limpeza, transformação e cálculos nos dados
 import pandas as pd
 import logging
 import re  # Biblioteca para identificar padrões de texto
+from datetime import datetime, date
 from typing import List, Dict, Any
 from utils import TextUtils, DataUtils
 
@@ -63,6 +64,70 @@ class DataProcessor:
         # Se não tem número de ecommerce e não caiu nas regras acima
         return 'Venda Direta'
 
+    @staticmethod
+    def gerar_assinatura_venda(venda: Dict[str, Any], valor_float: float) -> str:
+        """
+        Gera o mesmo 'RG' único usado no Dashboard de Vendas.
+        Formato: YYYYMMDD-NomeClienteSemEspaco-ValorCentavos
+        """
+        try:
+            # 1. Data (Tiny envia geralmente como dd/mm/yyyy)
+            data_str = venda.get('data_emissao', '')
+            try:
+                dt = datetime.strptime(data_str, '%d/%m/%Y')
+            except ValueError:
+                # Tenta fallback para formato ISO se mudar
+                try:
+                    dt = datetime.strptime(data_str, '%Y-%m-%d')
+                except:
+                    dt = date.today() # Fallback extremo (raro)
+        
+            d = dt.strftime('%Y%m%d')
+        
+            # 2. Cliente (Remove espaços para evitar erros de digitação)
+            c = str(venda.get('nome', '')).strip().replace(" ", "")
+        
+            # 3. Valor (Em centavos para evitar flutuação de float)
+            v = str(int(valor_float * 100))
+        
+            return f"{d}-{c}-{v}"
+        except Exception:
+            return "erro-geracao-id"
+
+    @staticmethod
+    def identificar_canal_pedido(nota: Dict[str, Any]) -> str:
+        """
+        Identifica o canal de venda baseado no PADRÃO DO PEDIDO (xPed).
+        Regra usada pelo Cockpit (Home) e pelo espelho local de notas.
+        """
+        xPed = str(nota.get('numero_ecommerce', '')).strip()
+        if not xPed:
+            xPed = str(nota.get('numero_ordem_compra', '')).strip()
+    
+        xPed_upper = xPed.upper()
+    
+        # REGRA 1: xPed Vazio -> Tenta achar palavras chave
+        if not xPed or xPed_upper in ['NONE', 'NULL', 'N/A']:
+            texto_fallback = (str(nota.get('obs', '')) + str(nota.get('nome', ''))).lower()
+            if 'shopee' in texto_fallback: return "Shopee"
+            if 'mercado' in texto_fallback or 'ebazar' in texto_fallback: return "Mercado Livre"
+            return "Venda Direta"
+
+        # REGRA 2: Shopee (Letras + Números)
+        tem_letra = any(c.isalpha() for c in xPed)
+        tem_numero = any(c.isdigit() for c in xPed)
+        if tem_letra and tem_numero:
+            return "Shopee"
+
+        # REGRA 3: Numéricos
+        if xPed.isdigit():
+            if len(xPed) > 10:
+                return "Mercado Livre"
+            else:
+                return "Site"
+            
+        return "Shopee" if tem_letra else "Venda Direta"
+
     @staticmethod
     def processar_vendas_raw(vendas_raw: List[Dict[str, Any]]) -> pd.DataFrame:
         """
@@ -0,0 +1,118 @@
+"""
+Registro de Datasets - Dashboard Comercial Tiny ERP
+Guarda DataFrames compartilhados entre sessões, versionados e sem cópias
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Dataset(NamedTuple):
+    """Versão publicada de um dataset. O DataFrame é compartilhado: não alterar."""
+    chave: Hashable
+    versao: int
+    df: pd.DataFrame
+    criado_em: float
+    tamanho_bytes: int
+
+    @property
+    def id(self) -> str:
+        """Identificador estável desta versão (usado como chave de outros caches)."""
+        return f"{self.chave}@v{self.versao}"
+
+
+class DatasetRegistry:
+    """
+    Registro process-wide de datasets imutáveis.
+
+    Cada chave (ex: ("vendas", data_ini, data_fim)) aponta para a versão mais
+    recente publicada. As sessões guardam só a chave no `st.session_state`
+    e leem o DataFrame daqui: sem pickle, sem cópia, uma única instância na
+    memória do servidor por período, não importa quantos usuários abram.
+
+    Limite: MAX_BYTES somados (LRU; o menos usado sai primeiro).
+    """
+
+    MAX_BYTES = 512 * 1024 * 1024
+
+    _lock = threading.RLock()
+    _datasets: "OrderedDict[Hashable, Dataset]" = OrderedDict()
+    _bytes = 0
+    _contador = 0
+
+    @classmethod
+    def publicar(cls, chave: Hashable, df: pd.DataFrame) -> Dataset:
+        """
+        Publica uma nova versão do dataset (substitui a anterior da mesma chave).
+
+        Args:
+            chave: Fonte + intervalo do dataset
+            df: DataFrame já processado. Depois de publicado não deve ser alterado.
+
+        Returns:
+            Dataset publicado
+        """
+        # deep=True: colunas de texto contam o tamanho real das strings (medido uma vez, na publicação)
+        tamanho = int(df.memory_usage(index=True, deep=True).sum()) if not df.empty else 0
+        with cls._lock:
+            cls._contador += 1
+            dataset = Dataset(chave, cls._contador, df, time.time(), tamanho)
+
+            antigo = cls._datasets.pop(chave, None)
+            if antigo is not None:
+                cls._bytes -= antigo.tamanho_bytes
+            cls._datasets[chave] = dataset
+            cls._bytes += tamanho
+
+            while cls._bytes > cls.MAX_BYTES and len(cls._datasets) > 1:
+                chave_removida, removido = cls._datasets.popitem(last=False)
+                cls._bytes -= removido.tamanho_bytes
+                logger.info(f"Dataset {chave_removida} removido do registro (limite de memória)")
+        return dataset
+
+    @classmethod
+    def obter(cls, chave: Hashable) -> Optional[Dataset]:
+        """Versão atual do dataset, ou None se não existir (ou tiver sido descartado)."""
+        with cls._lock:
+            dataset = cls._datasets.get(chave)
+            if dataset is not None:
+                cls._datasets.move_to_end(chave)
+            return dataset
+
+    @classmethod
+    def obter_ou_carregar(cls, chave: Hashable, carregar: Callable[[], pd.DataFrame],
+                          idade_maxima: Optional[float] = None) -> Dataset:
+        """
+        Retorna o dataset publicado ou carrega e publica.
+
+        Args:
+            chave: Fonte + intervalo
+            carregar: Função que produz o DataFrame
+            idade_maxima: Segundos após os quais a versão publicada é recarregada
+
+        Returns:
+            Dataset (existente ou recém-publicado)
+        """
+        dataset = cls.obter(chave)
+        if dataset is not None and (idade_maxima is None or time.time() - dataset.criado_em <= idade_maxima):
+            return dataset
+        return cls.publicar(chave, carregar())
+
+    @classmethod
+    def descartar(cls, chave: Hashable) -> None:
+        with cls._lock:
+            removido = cls._datasets.pop(chave, None)
+            if removido is not None:
+                cls._bytes -= removido.tamanho_bytes
+
+    @classmethod
+    def estatisticas(cls) -> dict:
+        with cls._lock:
+            return {'datasets': len(cls._datasets), 'bytes': cls._bytes}
@@ -0,0 +1,290 @@
+"""
+Fichas Técnicas em PDF - Plante Forte
+Geração em memória (sem arquivos temporários), cache por conteúdo e lote em paralelo num ZIP
+"""
+
+import io
+import os
+import json
+import zipfile
+import hashlib
+import threading
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+from fpdf import FPDF
+
+from custos_engine import CustosEngine, RECEITAS, TAMANHOS_POR_PROCESSO
+from precificacao import TAMANHOS_SACO
+
+logger = logging.getLogger(__name__)
+
+
+class FichaTecnica:
+    """
+    Ficha técnica de produção (PDF) gerada direto em bytes.
+
+    `obter` devolve o PDF de um cache próprio e pequeno (não disputa o
+    ResultCache com o Dashboard) enquanto os dados e a data impressa forem
+    os mesmos; `gerar_zip` renderiza várias fichas num pool de processos
+    de vida longa e devolve um único ZIP.
+    """
+
+    MIN_PARA_PARALELO = 8
+    MAX_CACHE = 16
+
+    _lock = threading.Lock()
+    _cache: "OrderedDict[str, bytes]" = OrderedDict()
+    _pool: Optional[ProcessPoolExecutor] = None
+
+    # ------------------------------------------------------------
+    # PDF
+    # ------------------------------------------------------------
+    @staticmethod
+    def gerar(dados: Dict[str, Any]) -> bytes:
+        """
+        Renderiza a ficha técnica.
+
+        Args:
+            dados: produto, processo, lote, peso_total, custo_kg, itens_batida
+                ([{nome, peso, valor}]), tamanho, custo_base_saco, custo_extras,
+                lista_extras, custo_final e, opcionalmente, data (dd/mm/aaaa)
+
+        Returns:
+            Conteúdo do PDF
+        """
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+
+        # Cabeçalho
+        pdf.set_font("Arial", 'B', 16)
+        pdf.cell(190, 10, txt="FICHA TÉCNICA DE PRODUÇÃO - PLANTE FORTE", ln=True, align='C')
+        pdf.ln(10)
+
+        # Dados Gerais
+        data = dados.get('data') or datetime.now().strftime('%d/%m/%Y')
+        pdf.set_font("Arial", size=12)
+        pdf.cell(190, 8, txt=f"Produto: {dados['produto']}", ln=True)
+        pdf.cell(190, 8, txt=f"Processo: {dados['processo']}", ln=True)
+        pdf.cell(190, 8, txt=f"Lote: {dados['lote']} | Data: {data}", ln=True)
+        pdf.cell(190, 8, txt=f"Volume Total Obtido: {dados['peso_total']:.2f} kg", ln=True)
+        pdf.ln(5)
+
+        # Tabela Batida
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(190, 10, txt="1. COMPOSIÇÃO DA MISTURA (BATIDA)", ln=True)
+        pdf.set_font("Arial", size=10)
+
+        # Cabeçalho Tabela
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(140, 8, "Componente (Peso Aplicado)", 1, 0, 'L', True)
+        pdf.cell(50, 8, "Custo Total (R$)", 1, 1, 'C', True)
+
+        # Itens
+        pdf.set_font("Arial", size=10)
+        for item in dados['itens_batida']:
+            texto_item = item['nome']
+            if item['peso'] > 0:
+                texto_item += f" ({item['peso']:.2f} kg)"
+
+            pdf.cell(140, 8, texto_item, 1)
+            pdf.cell(50, 8, f"R$ {item['valor']:.2f}", 1, 1, 'R')
+
+        pdf.set_font("Arial", 'B', 10)
+        pdf.cell(140, 8, "CUSTO MÉDIO POR KG BENEFICIADO:", 1, 0, 'R')
+        pdf.cell(50, 8, f"R$ {dados['custo_kg']:.2f}", 1, 1, 'R')
+        pdf.ln(10)
+
+        # Embalagem
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(190, 10, txt=f"2. PRODUTO ACABADO (SACO {dados['tamanho']} KG)", ln=True)
+        pdf.set_font("Arial", size=10)
+
+        pdf.cell(140, 8, f"Custo Semente ({dados['tamanho']}kg): R$ {dados['custo_base_saco']:.2f}", ln=True)
+        pdf.cell(140, 8, f"Custo Embalagem/Extras: R$ {dados['custo_extras']:.2f}", ln=True)
+
+        if dados['lista_extras']:
+            pdf.ln(2)
+            pdf.set_font("Arial", 'I', 9)
+            pdf.multi_cell(190, 5, txt="Insumos adicionados: " + ", ".join(dados['lista_extras']))
+
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_text_color(34, 139, 34)  # Verde
+        pdf.cell(190, 10, txt=f"CUSTO FINAL DO PRODUTO: R$ {dados['custo_final']:.2f}", ln=True)
+
+        # fpdf 1.x devolve str (latin-1); fpdf2 devolve bytearray
+        saida = pdf.output(dest='S')
+        return saida.encode('latin-1') if isinstance(saida, str) else bytes(saida)
+
+    @staticmethod
+    def impressao(dados: Dict[str, Any]) -> str:
+        """Hash estável dos dados da ficha (inclui a data impressa)."""
+        conteudo = json.dumps(dados, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.blake2b(conteudo.encode(), digest_size=16).hexdigest()
+
+    @classmethod
+    def obter(cls, dados: Dict[str, Any]) -> bytes:
+        """PDF da ficha, reaproveitado do cache enquanto os dados não mudarem."""
+        dados = {**dados, 'data': dados.get('data') or datetime.now().strftime('%d/%m/%Y')}
+        chave = cls.impressao(dados)
+        with cls._lock:
+            if chave in cls._cache:
+                cls._cache.move_to_end(chave)
+                return cls._cache[chave]
+        pdf = cls.gerar(dados)
+        with cls._lock:
+            cls._cache[chave] = pdf
+            while len(cls._cache) > cls.MAX_CACHE:
+                cls._cache.popitem(last=False)
+        return pdf
+
+    # ------------------------------------------------------------
+    # LOTE (ZIP)
+    # ------------------------------------------------------------
+    @staticmethod
+    def nome_arquivo(dados: Dict[str, Any]) -> str:
+        processo = str(dados['processo']).replace("SEMENTE ", "")[:4]
+        base = f"Ficha_{dados['produto']}_{processo}_{dados['tamanho']}kg"
+        if dados.get('lote') and dados['lote'] != "N/A":
+            base += f"_{dados['lote']}"
+        return "".join(c if c.isalnum() or c in "-_." else "_" for c in base) + ".pdf"
+
+    @classmethod
+    def _executor(cls) -> ProcessPoolExecutor:
+        """
+        Pool criado uma vez por processo, com processos 'spawn'.
+
+        Com 'fork' o filho herdaria a thread de escrita e as conexões SQLite
+        do servidor; com 'spawn' ele começa limpo, e o custo de subir os
+        processos só é pago no primeiro lote.
+        """
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ProcessPoolExecutor(
+                    max_workers=min(4, os.cpu_count() or 1),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return cls._pool
+
+    @classmethod
+    def _descartar_executor(cls) -> None:
+        with cls._lock:
+            pool, cls._pool = cls._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def gerar_zip(cls, fichas: List[Dict[str, Any]]) -> bytes:
+        """
+        Renderiza todas as fichas (em paralelo a partir de MIN_PARA_PARALELO) num ZIP.
+
+        Args:
+            fichas: Lista de dados no formato de `gerar`
+
+        Returns:
+            Conteúdo do arquivo ZIP
+        """
+        data = datetime.now().strftime('%d/%m/%Y')
+        fichas = [{**f, 'data': f.get('data') or data} for f in fichas]
+
+        pdfs: List[bytes] = []
+        if len(fichas) >= cls.MIN_PARA_PARALELO:
+            try:
+                pdfs = list(cls._executor().map(FichaTecnica.gerar, fichas, chunksize=4))
+            except Exception as e:
+                logger.warning(f"Geração paralela de fichas indisponível ({e}); gerando em sequência")
+                cls._descartar_executor()
+                pdfs = []
+        if len(pdfs) != len(fichas):
+            pdfs = [cls.gerar(f) for f in fichas]
+
+        buffer = io.BytesIO()
+        usados: Dict[str, int] = {}
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for dados, pdf in zip(fichas, pdfs):
+                nome = cls.nome_arquivo(dados)
+                usados[nome] = usados.get(nome, 0) + 1
+                if usados[nome] > 1:
+                    nome = nome[:-4] + f"_{usados[nome]}.pdf"
+                zf.writestr(nome, pdf)
+        logger.info(f"{len(fichas)} fichas técnicas geradas em lote")
+        return buffer.getvalue()
+
+    @staticmethod
+    def fichas_lotes(df_lotes: Optional[pd.DataFrame], custo_saco: Callable[[float], float]) -> List[Dict[str, Any]]:
+        """
+        Uma ficha por lote registrado e embalagem do processo do lote.
+
+        Args:
+            df_lotes: Retorno de `listar_lotes_disponiveis`
+            custo_saco: Tamanho (kg) -> custo da embalagem (ex: CadastroCache.custo_saco)
+        """
+        if df_lotes is None or df_lotes.empty:
+            return []
+        fichas = []
+        for lote in df_lotes.to_dict('records'):
+            processo = lote.get('processo') or lote.get('tipo_processo') or ""
+            custo_kg = float(lote.get('custo_kg_final') or 0.0)
+            peso = float(lote.get('peso_total') or lote.get('quantidade_kg') or 0.0)
+            custo_total = float(lote.get('custo_total') or custo_kg * peso)
+            # Sem o peso do lote na listagem, a ficha mostra só o custo por kg
+            if peso > 0:
+                itens = [{"nome": "Custo Total do Lote", "peso": peso, "valor": custo_total}]
+            else:
+                itens = [{"nome": "Custo por kg do Lote", "peso": 0, "valor": custo_kg}]
+            for tamanho in TAMANHOS_POR_PROCESSO.get(processo, TAMANHOS_SACO):
+                extras = custo_saco(tamanho)
+                fichas.append({
+                    "produto": lote.get('produto_nome', ""),
+                    "processo": processo or "N/A",
+                    "lote": lote.get('codigo_lote', "N/A"),
+                    "peso_total": peso,
+                    "custo_kg": custo_kg,
+                    "itens_batida": itens,
+                    "tamanho": tamanho,
+                    "custo_base_saco": custo_kg * tamanho,
+                    "custo_extras": extras,
+                    "lista_extras": [f"Saco {tamanho}kg"] if extras else [],
+                    "custo_final": custo_kg * tamanho + extras,
+                })
+        return fichas
+
+    @staticmethod
+    def fichas_catalogo(df_especies: Optional[pd.DataFrame], preco_insumo: Callable[[str], float],
+                        custo_saco: Callable[[float], float]) -> List[Dict[str, Any]]:
+        """
+        Uma ficha por espécie x processo x embalagem, com a batida de referência
+        e os preços atuais dos insumos.
+        """
+        if df_especies is None or df_especies.empty:
+            return []
+        fichas = []
+        for especie in df_especies.to_dict('records'):
+            for processo in RECEITAS:
+                itens, peso = CustosEngine.batida_referencia(
+                    processo, especie.get('familia') or "", float(especie.get('custo_ponto') or 0.0), preco_insumo
+                )
+                custo_kg = sum(i['valor'] for i in itens) / peso if peso > 0 else 0.0
+                for tamanho in TAMANHOS_POR_PROCESSO[processo]:
+                    extras = custo_saco(tamanho)
+                    fichas.append({
+                        "produto": especie['nome'],
+                        "processo": processo,
+                        "lote": "N/A",
+                        "peso_total": peso,
+                        "custo_kg": custo_kg,
+                        "itens_batida": itens,
+                        "tamanho": tamanho,
+                        "custo_base_saco": custo_kg * tamanho,
+                        "custo_extras": extras,
+                        "lista_extras": [f"Saco {tamanho}kg"] if extras else [],
+                        "custo_final": custo_kg * tamanho + extras,
+                    })
+        return fichas
@@ -0,0 +1,129 @@
+"""
+Cache de Gráficos - Dashboard Comercial Tiny ERP
+Guarda figuras Plotly já construídas, indexadas pela impressão digital dos dados
+"""
+
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class FigureCache:
+    """
+    Cache LRU process-wide de figuras Plotly.
+
+    A chave é o nome do gráfico mais a impressão digital (hash) dos DataFrames
+    agregados e dos parâmetros de layout. Enquanto os dados não mudam, a
+    `go.Figure` não é reconstruída (nada de px.* / traces / layout de novo).
+
+    É só memoização do construtor: a serialização para o navegador continua
+    a cargo do `st.plotly_chart` a cada rerun (ele valida e serializa até um
+    dict de spec, então guardar o JSON não pouparia esse passo).
+
+    A figura devolvida é a mesma para todas as sessões: todo ajuste
+    (update_layout, update_traces...) fica dentro de `construir`; quem
+    precisar alterar depois faz uma cópia (`go.Figure(fig)`).
+
+    Limites: MAX_ITENS figuras e MAX_BYTES estimados (arrays e textos dos traces).
+    """
+
+    MAX_ITENS = 64
+    MAX_BYTES = 64 * 1024 * 1024
+
+    _lock = threading.Lock()
+    # chave -> (figura, tamanho_bytes)
+    _itens: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+    _bytes = 0
+    estatisticas = {'acertos': 0, 'falhas': 0, 'descartes': 0}
+
+    @staticmethod
+    def impressao_digital(frames: Iterable[pd.DataFrame], params: Dict[str, Any]) -> str:
+        """
+        Gera um hash estável do conteúdo dos DataFrames e dos parâmetros.
+
+        Args:
+            frames: DataFrames (ou Series) usados no gráfico
+            params: Parâmetros de layout (altura, zoom, título...)
+
+        Returns:
+            Hash hexadecimal (blake2b, 16 bytes)
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for df in frames:
+            if isinstance(df, pd.Series):
+                df = df.to_frame()
+            h.update(repr((list(df.columns), [str(t) for t in df.dtypes], df.shape)).encode())
+            h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        h.update(repr(sorted(params.items())).encode())
+        return h.hexdigest()
+
+    @classmethod
+    def _tamanho(cls, valor: Any) -> int:
+        """Estimativa em bytes do conteúdo da figura (sem serializar)."""
+        if isinstance(valor, np.ndarray):
+            return int(valor.nbytes)
+        if isinstance(valor, dict):
+            return sum(cls._tamanho(v) for v in valor.values())
+        if isinstance(valor, (list, tuple)):
+            return sum(cls._tamanho(v) for v in valor) + 8 * len(valor)
+        if isinstance(valor, str):
+            return len(valor)
+        return 8
+
+    @classmethod
+    def obter(cls, nome: str, frames: Iterable[pd.DataFrame], params: Dict[str, Any],
+              construir: Callable[[], Any]) -> Any:
+        """
+        Retorna a figura em cache, construindo só em caso de falha.
+
+        Args:
+            nome: Identificador do gráfico (ex: "dashboard_mapa")
+            frames: DataFrames agregados que alimentam o gráfico
+            params: Parâmetros de layout que alteram o resultado
+            construir: Função sem argumentos que devolve a go.Figure
+
+        Returns:
+            go.Figure (pronta para st.plotly_chart). Compartilhada entre sessões: não alterar.
+        """
+        chave = (nome, cls.impressao_digital(frames, params))
+
+        with cls._lock:
+            item = cls._itens.get(chave)
+            if item is not None:
+                cls._itens.move_to_end(chave)
+                cls.estatisticas['acertos'] += 1
+                return item[0]
+
+        fig = construir()
+        tamanho = cls._tamanho(fig.to_plotly_json())
+
+        with cls._lock:
+            cls.estatisticas['falhas'] += 1
+            if tamanho > cls.MAX_BYTES:
+                logger.warning(f"Figura '{nome}' maior que o limite do cache ({tamanho} bytes)")
+                return fig
+
+            antigo = cls._itens.pop(chave, None)
+            if antigo is not None:
+                cls._bytes -= antigo[1]
+            cls._itens[chave] = (fig, tamanho)
+            cls._bytes += tamanho
+
+            while len(cls._itens) > cls.MAX_ITENS or cls._bytes > cls.MAX_BYTES:
+                _, (_, tamanho_removido) = cls._itens.popitem(last=False)
+                cls._bytes -= tamanho_removido
+                cls.estatisticas['descartes'] += 1
+        return fig
+
+    @classmethod
+    def limpar(cls) -> None:
+        with cls._lock:
+            cls._itens.clear()
+            cls._bytes = 0
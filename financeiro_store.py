@@ -0,0 +1,470 @@
+"""
+Consultas Financeiras - Dashboard Comercial Tiny ERP
+Agregações do livro de lançamentos feitas direto no SQLite
+e saldo de caixa materializado (mantido por triggers a cada escrita)
+"""
+
+import sys
+import sqlite3
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class FinanceiroStore:
+    """
+    Agregações sobre a tabela de lançamentos.
+
+    As somas rodam como `SUM ... GROUP BY` no SQLite, apoiadas por um índice
+    de cobertura (tipo_movimento, status, data, valor): o banco responde só
+    pelo índice, sem carregar o livro inteiro em um DataFrame.
+    """
+
+    TABELA = "lancamentos"
+    TOLERANCIA = 0.005
+
+    # Nomes possíveis das colunas de categoria e de parceiro (o esquema vem do DatabaseManager)
+    CANDIDATAS_CATEGORIA = ('categoria_codigo', 'codigo_categoria', 'cod_categoria', 'categoria', 'categoria_id')
+    CANDIDATAS_PARCEIRO = ('cliente_id', 'id_cliente', 'parceiro_id', 'id_parceiro', 'cliente')
+
+    _indices_criados = False
+    _saldos_criados = False
+    # {'categoria': coluna ou None, 'parceiro': coluna ou None, 'clientes': tabela existe}
+    _colunas: Optional[Dict[str, Any]] = None
+
+    def __init__(self, db: Any):
+        self.db = db
+        self.criar_indices()
+        self.criar_saldos()
+
+    def criar_indices(self) -> None:
+        if FinanceiroStore._indices_criados:
+            return
+        conn = self.db._get_connection()
+        try:
+            colunas = self.colunas_extrato(conn)
+            with conn:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_lancamentos_tipo_status_data "
+                    f"ON {self.TABELA} (tipo_movimento, status, data, valor)"
+                )
+                # Extrato paginado: ordem (data, id) e filtros por categoria/parceiro
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_lancamentos_data ON {self.TABELA} (data)")
+                for filtro in ('categoria', 'parceiro'):
+                    if colunas[filtro]:
+                        conn.execute(
+                            f"CREATE INDEX IF NOT EXISTS idx_lancamentos_{filtro}_data "
+                            f"ON {self.TABELA} ({colunas[filtro]}, data)"
+                        )
+            FinanceiroStore._indices_criados = True
+        except sqlite3.Error as e:
+            logger.error(f"Não foi possível criar os índices de lançamentos: {e}")
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------
+    # SALDO MATERIALIZADO
+    # ------------------------------------------------------------
+    @staticmethod
+    def _efeito(linha: str) -> str:
+        """Expressão SQL do efeito de um lançamento (NEW/OLD) no caixa."""
+        return (
+            f"(CASE WHEN {linha}.status = 'Pago' THEN "
+            f"CASE {linha}.tipo_movimento WHEN 'Entrada' THEN {linha}.valor "
+            f"WHEN 'Saída' THEN -{linha}.valor ELSE 0 END ELSE 0 END)"
+        )
+
+    @classmethod
+    def _aplicar(cls, linha: str) -> str:
+        """Comandos de trigger que somam o efeito de NEW/OLD ao saldo (OLD entra subtraindo)."""
+        sinal = "-" if linha == "OLD" else "+"
+        efeito = cls._efeito(linha)
+        dia = f"date({linha}.data)"
+        return f"""
+            INSERT OR IGNORE INTO saldo_diario (data, movimento, saldo)
+            VALUES ({dia}, 0, COALESCE((SELECT saldo FROM saldo_diario WHERE data < {dia} ORDER BY data DESC LIMIT 1), 0));
+            UPDATE saldo_diario SET movimento = movimento {sinal} {efeito} WHERE data = {dia};
+            UPDATE saldo_diario SET saldo = saldo {sinal} {efeito} WHERE data >= {dia};
+            UPDATE saldo_caixa SET saldo = saldo {sinal} {efeito} WHERE id = 1;
+        """
+
+    def criar_saldos(self) -> None:
+        """
+        Cria as tabelas de saldo e os triggers que as mantêm.
+
+        - `saldo_caixa`: uma linha com o saldo atual (leitura O(1))
+        - `saldo_diario`: movimento do dia e saldo ao fim de cada dia com
+          movimento (saldo em uma data = busca pela chave, O(log n))
+
+        Os triggers rodam na mesma transação do INSERT/UPDATE/DELETE em
+        lançamentos, qualquer que seja o caminho da escrita.
+        """
+        if FinanceiroStore._saldos_criados:
+            return
+        conn = self.db._get_connection()
+        try:
+            existia = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'saldo_caixa'"
+            ).fetchone()
+            conn.executescript(f"""
+                BEGIN;
+                CREATE TABLE IF NOT EXISTS saldo_caixa (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    saldo REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS saldo_diario (
+                    data TEXT PRIMARY KEY,
+                    movimento REAL NOT NULL DEFAULT 0,
+                    saldo REAL NOT NULL DEFAULT 0
+                );
+                INSERT OR IGNORE INTO saldo_caixa (id, saldo) VALUES (1, 0);
+
+                CREATE TRIGGER IF NOT EXISTS trg_saldo_lancamento_insert
+                AFTER INSERT ON {self.TABELA}
+                BEGIN {self._aplicar("NEW")} END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_saldo_lancamento_delete
+                AFTER DELETE ON {self.TABELA}
+                BEGIN {self._aplicar("OLD")} END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_saldo_lancamento_update
+                AFTER UPDATE OF data, valor, status, tipo_movimento ON {self.TABELA}
+                BEGIN {self._aplicar("OLD")} {self._aplicar("NEW")} END;
+                COMMIT;
+            """)
+            FinanceiroStore._saldos_criados = True
+        except sqlite3.Error as e:
+            logger.error(f"Não foi possível criar o saldo materializado: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            return
+        finally:
+            conn.close()
+
+        # Primeira vez: carrega o histórico que já existia
+        if not existia:
+            self.reconstruir_saldos()
+
+    def reconstruir_saldos(self) -> None:
+        """Recalcula saldo_caixa e saldo_diario a partir de todos os lançamentos."""
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM saldo_diario")
+                conn.execute(f"""
+                    INSERT INTO saldo_diario (data, movimento, saldo)
+                    SELECT dia, movimento, SUM(movimento) OVER (ORDER BY dia)
+                    FROM (
+                        SELECT date(data) AS dia,
+                               SUM(CASE tipo_movimento WHEN 'Entrada' THEN valor ELSE -valor END) AS movimento
+                        FROM {self.TABELA}
+                        WHERE status = 'Pago' AND tipo_movimento IN ('Entrada', 'Saída')
+                        GROUP BY date(data)
+                    )
+                """)
+                conn.execute(
+                    "INSERT OR REPLACE INTO saldo_caixa (id, saldo) "
+                    "VALUES (1, COALESCE((SELECT saldo FROM saldo_diario ORDER BY data DESC LIMIT 1), 0))"
+                )
+        finally:
+            conn.close()
+        logger.info("Saldo de caixa reconstruído a partir dos lançamentos")
+
+    def verificar_saldos(self) -> Dict[str, Any]:
+        """
+        Compara o saldo materializado com o recalculado do zero.
+
+        Um dia diverge se o movimento dele não bate com os lançamentos ou se
+        o saldo acumulado (o que `saldo_em` lê) não bate com a soma corrente
+        dos movimentos até ele.
+
+        Returns:
+            Dicionário com saldo_materializado, saldo_calculado, diferenca
+            e dias_divergentes (lista de datas)
+        """
+        conn = self.db._get_connection()
+        try:
+            materializado = conn.execute("SELECT saldo FROM saldo_caixa WHERE id = 1").fetchone()
+            calculado = conn.execute(
+                f"SELECT COALESCE(SUM(CASE tipo_movimento WHEN 'Entrada' THEN valor ELSE -valor END), 0) "
+                f"FROM {self.TABELA} WHERE status = 'Pago' AND tipo_movimento IN ('Entrada', 'Saída')"
+            ).fetchone()
+            dias = conn.execute(f"""
+                WITH calc AS (
+                    SELECT date(data) AS dia,
+                           SUM(CASE tipo_movimento WHEN 'Entrada' THEN valor ELSE -valor END) AS movimento
+                    FROM {self.TABELA}
+                    WHERE status = 'Pago' AND tipo_movimento IN ('Entrada', 'Saída')
+                    GROUP BY date(data)
+                )
+                SELECT COALESCE(c.dia, s.data)
+                FROM calc c LEFT JOIN saldo_diario s ON s.data = c.dia
+                WHERE ABS(c.movimento - COALESCE(s.movimento, 0)) > ?
+                UNION
+                SELECT s.data FROM saldo_diario s LEFT JOIN calc c ON c.dia = s.data
+                WHERE c.dia IS NULL AND ABS(s.movimento) > ?
+                UNION
+                SELECT data FROM (
+                    SELECT data, saldo, SUM(movimento) OVER (ORDER BY data) AS acumulado
+                    FROM saldo_diario
+                )
+                WHERE ABS(saldo - acumulado) > ?
+            """, (self.TOLERANCIA, self.TOLERANCIA, self.TOLERANCIA)).fetchall()
+        finally:
+            conn.close()
+
+        saldo_mat = float(materializado[0]) if materializado else 0.0
+        saldo_calc = float(calculado[0] or 0.0)
+        return {
+            'saldo_materializado': saldo_mat,
+            'saldo_calculado': saldo_calc,
+            'diferenca': saldo_mat - saldo_calc,
+            'dias_divergentes': sorted(d[0] for d in dias),
+            'ok': abs(saldo_mat - saldo_calc) <= self.TOLERANCIA and not dias,
+        }
+
+    def saldo_caixa(self) -> float:
+        """Saldo atual (leitura de uma única linha)."""
+        conn = self.db._get_connection()
+        try:
+            row = conn.execute("SELECT saldo FROM saldo_caixa WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+        return float(row[0]) if row else 0.0
+
+    def saldo_em(self, data_ref: date) -> float:
+        """Saldo ao fim do dia `data_ref` (busca pela chave primária de saldo_diario)."""
+        conn = self.db._get_connection()
+        try:
+            row = conn.execute(
+                "SELECT saldo FROM saldo_diario WHERE data <= ? ORDER BY data DESC LIMIT 1",
+                (data_ref.isoformat(),)
+            ).fetchone()
+        finally:
+            conn.close()
+        return float(row[0]) if row else 0.0
+
+    # ------------------------------------------------------------
+    # AGREGAÇÕES
+    # ------------------------------------------------------------
+    def contas_a_pagar(self, data_ini: date, data_fim: date) -> float:
+        """Soma das Saídas pendentes com vencimento no período."""
+        conn = self.db._get_connection()
+        try:
+            row = conn.execute(
+                f"SELECT COALESCE(SUM(valor), 0) FROM {self.TABELA} "
+                f"WHERE tipo_movimento = 'Saída' AND status = 'Pendente' "
+                f"AND data >= ? AND data < ?",
+                (data_ini.isoformat(), (data_fim + timedelta(days=1)).isoformat())
+            ).fetchone()
+        finally:
+            conn.close()
+        return float(row[0] or 0.0)
+
+    def saldo_pago(self) -> float:
+        """Saldo em caixa: Entradas pagas menos Saídas pagas."""
+        conn = self.db._get_connection()
+        try:
+            linhas = conn.execute(
+                f"SELECT tipo_movimento, COALESCE(SUM(valor), 0) FROM {self.TABELA} "
+                f"WHERE tipo_movimento IN ('Entrada', 'Saída') AND status = 'Pago' "
+                f"GROUP BY tipo_movimento"
+            ).fetchall()
+        finally:
+            conn.close()
+        somas = dict(linhas)
+        return float(somas.get('Entrada', 0.0)) - float(somas.get('Saída', 0.0))
+
+    def resumo_home(self, data_ini: date, data_fim: date) -> Tuple[float, float]:
+        """
+        KPIs financeiros do Cockpit.
+
+        Returns:
+            (contas_a_pagar_no_periodo, saldo_caixa_total)
+        """
+        try:
+            saldo = self.saldo_caixa() if FinanceiroStore._saldos_criados else self.saldo_pago()
+            return self.contas_a_pagar(data_ini, data_fim), saldo
+        except sqlite3.Error as e:
+            logger.error(f"Falha na agregação SQL de lançamentos, usando pandas: {e}")
+            return self._resumo_pandas(data_ini, data_fim)
+
+    # ------------------------------------------------------------
+    # EXTRATO PAGINADO
+    # ------------------------------------------------------------
+    @classmethod
+    def colunas_extrato(cls, conn) -> Dict[str, Any]:
+        """Colunas de categoria e parceiro da tabela de lançamentos (lidas uma vez do esquema)."""
+        if cls._colunas is None:
+            existentes = {row[1] for row in conn.execute(f"PRAGMA table_info({cls.TABELA})")}
+            clientes = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clientes'"
+            ).fetchone()
+            cls._colunas = {
+                'categoria': next((c for c in cls.CANDIDATAS_CATEGORIA if c in existentes), None),
+                'parceiro': next((c for c in cls.CANDIDATAS_PARCEIRO if c in existentes), None),
+                'clientes': clientes is not None,
+            }
+            for filtro, candidatas in (('categoria', cls.CANDIDATAS_CATEGORIA), ('parceiro', cls.CANDIDATAS_PARCEIRO)):
+                if cls._colunas[filtro] is None:
+                    logger.warning(
+                        f"Coluna de {filtro} não encontrada em {cls.TABELA} (procuradas: {', '.join(candidatas)}); "
+                        f"filtro por {filtro} desativado"
+                    )
+        return cls._colunas
+
+    def colunas(self) -> Dict[str, Any]:
+        """`colunas_extrato` usando uma conexão do próprio banco."""
+        conn = self.db._get_connection()
+        try:
+            return self.colunas_extrato(conn)
+        finally:
+            conn.close()
+
+    def _filtros_extrato(self, colunas: Dict[str, Any], data_ini: Optional[date] = None,
+                         data_fim: Optional[date] = None, tipos: Iterable[str] = (),
+                         status: Iterable[str] = (), categorias: Iterable[str] = (),
+                         parceiros: Iterable[Any] = ()) -> Tuple[List[str], List[Any]]:
+        condicoes: List[str] = []
+        params: List[Any] = []
+        if data_ini:
+            condicoes.append("l.data >= ?")
+            params.append(data_ini.isoformat())
+        if data_fim:
+            condicoes.append("l.data < ?")
+            params.append((data_fim + timedelta(days=1)).isoformat())
+        por_coluna = [("l.tipo_movimento", tipos), ("l.status", status)]
+        if colunas['categoria']:
+            por_coluna.append((f"l.{colunas['categoria']}", categorias))
+        if colunas['parceiro']:
+            por_coluna.append((f"l.{colunas['parceiro']}", parceiros))
+        for coluna, valores in por_coluna:
+            valores = list(valores)
+            if valores:
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(valores))})")
+                params.extend(valores)
+        return condicoes, params
+
+    def pagina_extrato(self, limite: int = 50, cursor: Optional[Tuple[str, int]] = None,
+                       **filtros) -> Tuple[pd.DataFrame, Optional[Tuple[str, int]]]:
+        """
+        Uma página do extrato, do mais recente para o mais antigo.
+
+        Paginação por chave (keyset): a próxima página começa depois do
+        último (data, id) da atual, então o custo não cresce com o número
+        da página como no OFFSET.
+
+        Args:
+            limite: Linhas por página
+            cursor: (data, id) do último lançamento da página anterior (None = primeira)
+            **filtros: data_ini, data_fim, tipos, status, categorias, parceiros
+
+        Returns:
+            (DataFrame da página, cursor da próxima página ou None se for a última)
+        """
+        conn = self.db._get_connection()
+        try:
+            colunas = self.colunas_extrato(conn)
+            condicoes, params = self._filtros_extrato(colunas, **filtros)
+            if cursor is not None:
+                condicoes.append("(l.data < ? OR (l.data = ? AND l.id < ?))")
+                params.extend([cursor[0], cursor[0], cursor[1]])
+
+            campos = ["l.id", "l.data", "l.tipo_movimento", "l.valor", "l.descricao", "l.status"]
+            juncoes = []
+            if colunas['categoria']:
+                campos.append(f"COALESCE(cat.descricao, l.{colunas['categoria']}) AS categoria")
+                juncoes.append(f"LEFT JOIN categorias cat ON cat.codigo = l.{colunas['categoria']}")
+            if colunas['parceiro'] and colunas['clientes']:
+                campos.append("cli.nome AS parceiro")
+                juncoes.append(f"LEFT JOIN clientes cli ON cli.id = l.{colunas['parceiro']}")
+
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            # Uma linha a mais só para saber se existe próxima página
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(campos)} FROM {self.TABELA} l {' '.join(juncoes)} {where} "
+                f"ORDER BY l.data DESC, l.id DESC LIMIT ?",
+                conn, params=params + [limite + 1]
+            )
+        finally:
+            conn.close()
+
+        if len(df) <= limite:
+            return df, None
+        df = df.iloc[:limite]
+        ultimo = df.iloc[-1]
+        return df, (ultimo['data'], int(ultimo['id']))
+
+    def totais_extrato(self, **filtros) -> Dict[str, float]:
+        """
+        Totais do extrato filtrado, somados no SQLite.
+
+        Returns:
+            Dicionário com quantidade, entradas, saidas, saldo e pendente
+            (entradas/saídas/saldo consideram todos os status)
+        """
+        conn = self.db._get_connection()
+        try:
+            condicoes, params = self._filtros_extrato(self.colunas_extrato(conn), **filtros)
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            row = conn.execute(
+                f"SELECT COUNT(*), "
+                f"COALESCE(SUM(CASE WHEN l.tipo_movimento = 'Entrada' THEN l.valor END), 0), "
+                f"COALESCE(SUM(CASE WHEN l.tipo_movimento = 'Saída' THEN l.valor END), 0), "
+                f"COALESCE(SUM(CASE WHEN l.status = 'Pendente' THEN l.valor END), 0) "
+                f"FROM {self.TABELA} l {where}",
+                params
+            ).fetchone()
+        finally:
+            conn.close()
+        quantidade, entradas, saidas, pendente = row
+        return {
+            'quantidade': int(quantidade),
+            'entradas': float(entradas),
+            'saidas': float(saidas),
+            'saldo': float(entradas) - float(saidas),
+            'pendente': float(pendente),
+        }
+
+    def _resumo_pandas(self, data_ini: date, data_fim: date) -> Tuple[float, float]:
+        """Caminho antigo (carrega todos os lançamentos); só usado se o SQL falhar."""
+        df = self.db.buscar_lancamentos()
+        if df is None or df.empty:
+            return 0.0, 0.0
+
+        datas = pd.to_datetime(df['data']).dt.date
+        mask_pagar = (
+            (df['tipo_movimento'] == 'Saída') &
+            (df['status'] == 'Pendente') &
+            (datas >= data_ini) &
+            (datas <= data_fim)
+        )
+        pagos = df['status'] == 'Pago'
+        entradas = df.loc[(df['tipo_movimento'] == 'Entrada') & pagos, 'valor'].sum()
+        saidas = df.loc[(df['tipo_movimento'] == 'Saída') & pagos, 'valor'].sum()
+        return float(df.loc[mask_pagar, 'valor'].sum()), float(entradas - saidas)
+
+
+if __name__ == "__main__":
+    # Uso: python financeiro_store.py [verificar|reconstruir]
+    from database import DatabaseManager
+
+    comando = sys.argv[1] if len(sys.argv) > 1 else "verificar"
+    store = FinanceiroStore(DatabaseManager())
+
+    if comando == "reconstruir":
+        store.reconstruir_saldos()
+    resultado = store.verificar_saldos()
+    print(f"Saldo materializado: R$ {resultado['saldo_materializado']:,.2f}")
+    print(f"Saldo recalculado:   R$ {resultado['saldo_calculado']:,.2f}")
+    if resultado['ok']:
+        print("OK: sem divergências.")
+    else:
+        print(f"DIVERGÊNCIA de R$ {resultado['diferenca']:,.2f} em {len(resultado['dias_divergentes'])} dia(s): "
+              f"{', '.join(resultado['dias_divergentes'][:20])}")
+        print("Rode 'python financeiro_store.py reconstruir' para corrigir.")
+        sys.exit(1)
@@ -0,0 +1,480 @@
+"""
+Importação de Extratos - Plante Forte
+Lançamentos em lote a partir de CSV, OFX ou XLSX: leitura em blocos, mapeamento automático
+de categorias e parceiros, deduplicação por chave natural e gravação numa única transação
+"""
+
+import io
+import re
+import csv
+import uuid
+import hashlib
+import logging
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+from utils import TextUtils
+from perf_utils import ResultCache
+from conexoes import FilaEscrita
+from clientes_index import ClientesIndex
+from financeiro_store import FinanceiroStore
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalhos aceitos (sem acento, minúsculos) para cada campo do lançamento
+COLUNAS_ARQUIVO = {
+    'data': ('data', 'date', 'dt', 'data lancamento', 'data movimento', 'data mov', 'data do lancamento'),
+    'valor': ('valor', 'valor (r$)', 'valor r$', 'value', 'amount', 'quantia', 'montante'),
+    'descricao': ('descricao', 'historico', 'memo', 'description', 'lancamento', 'detalhe', 'detalhes'),
+    'tipo': ('tipo', 'tipo movimento', 'natureza', 'd/c', 'c/d', 'dc', 'credito/debito'),
+    'categoria': ('categoria', 'plano de contas', 'conta contabil'),
+    'parceiro': ('parceiro', 'cliente', 'fornecedor', 'favorecido', 'interessado'),
+    'status': ('status', 'situacao'),
+}
+
+# Valores aceitos na coluna de tipo (token inteiro, sem acento, minúsculo)
+TIPOS_ENTRADA = frozenset(('c', 'e', 'cr', 'cred', 'credito', 'credit', 'entrada', 'receita'))
+TIPOS_SAIDA = frozenset(('d', 's', 'db', 'deb', 'debito', 'debit', 'saida', 'despesa'))
+
+SITUACAO_NOVO = "Novo"
+SITUACAO_DUPLICADO = "Duplicado"
+SITUACAO_INVALIDO = "Inválido"
+
+
+class ImportadorLancamentos:
+    """
+    Importa extratos bancários e planilhas para a tabela de lançamentos.
+
+    Fluxo em duas etapas:
+
+    1. `preparar` lê o arquivo em blocos, normaliza data/valor/tipo,
+       completa categoria e parceiro (pelo que vier no arquivo ou pelo
+       último lançamento com a mesma descrição) e marca cada linha como
+       Novo, Duplicado ou Inválido. Nada é gravado.
+    2. `gravar` insere as linhas novas com um único `executemany`, numa
+       transação da fila de escrita; os triggers do FinanceiroStore
+       mantêm os saldos.
+
+    Duplicados são detectados por uma chave natural com hash: data, valor,
+    tipo, descrição normalizada e a ordem da ocorrência (duas tarifas
+    idênticas no mesmo dia são duas linhas, não uma repetida).
+    """
+
+    TAMANHO_BLOCO = 5000
+    TIPOS_ARQUIVO = ('csv', 'ofx', 'xlsx')
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    def _colunas_destino(self) -> Dict[str, Any]:
+        """
+        Colunas de categoria e parceiro do livro.
+
+        Raises:
+            ValueError: Se alguma não for encontrada (a importação perderia esses dados)
+        """
+        conn = self.db._get_connection()
+        try:
+            colunas = FinanceiroStore.colunas_extrato(conn)
+        finally:
+            conn.close()
+        faltando = [campo for campo in ('categoria', 'parceiro') if not colunas[campo]]
+        if faltando:
+            raise ValueError(
+                f"a tabela de lançamentos não tem coluna de {' nem de '.join(faltando)} reconhecida; "
+                f"a importação perderia esses dados"
+            )
+        return colunas
+
+    # ------------------------------------------------------------
+    # LEITURA EM BLOCOS
+    # ------------------------------------------------------------
+    @staticmethod
+    def _cabecalho(nome: Any) -> str:
+        return " ".join(TextUtils.remover_acentos(str(nome)).lower().split())
+
+    @classmethod
+    def mapear_colunas(cls, colunas: List[Any]) -> Dict[str, Any]:
+        """Campo do lançamento -> coluna do arquivo (só os campos reconhecidos)."""
+        por_cabecalho = {cls._cabecalho(c): c for c in colunas}
+        mapa = {}
+        for campo, nomes in COLUNAS_ARQUIVO.items():
+            coluna = next((por_cabecalho[n] for n in nomes if n in por_cabecalho), None)
+            if coluna is not None:
+                mapa[campo] = coluna
+        return mapa
+
+    @staticmethod
+    def _codificacao(amostra: bytes) -> str:
+        try:
+            amostra.decode('utf-8')
+            return 'utf-8-sig'
+        except UnicodeDecodeError as e:
+            # Amostra cortada no meio de um caractere UTF-8 não conta como erro
+            return 'utf-8-sig' if e.start >= len(amostra) - 3 else 'cp1252'
+
+    def _blocos_csv(self, arquivo: BinaryIO) -> Iterator[pd.DataFrame]:
+        amostra = arquivo.read(65536)
+        arquivo.seek(0)
+        codificacao = self._codificacao(amostra)
+        texto = amostra.decode(codificacao, errors='ignore')
+        try:
+            separador = csv.Sniffer().sniff(texto.split("\n", 1)[0], delimiters=";,\t|").delimiter
+        except csv.Error:
+            separador = ';'
+        yield from pd.read_csv(
+            arquivo, sep=separador, encoding=codificacao, dtype=str,
+            skipinitialspace=True, chunksize=self.TAMANHO_BLOCO
+        )
+
+    def _blocos_xlsx(self, arquivo: BinaryIO) -> Iterator[pd.DataFrame]:
+        livro = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = livro.active.iter_rows(values_only=True)
+            cabecalho = None
+            for linha in linhas:
+                # Pula o título/linhas em branco antes do cabeçalho
+                if linha and self.mapear_colunas([c for c in linha if c is not None]).keys() >= {'data', 'valor'}:
+                    cabecalho = [str(c) if c is not None else f"coluna_{i}" for i, c in enumerate(linha)]
+                    break
+            if cabecalho is None:
+                return
+            bloco: List[tuple] = []
+            for linha in linhas:
+                if any(c is not None for c in linha):
+                    bloco.append(linha[:len(cabecalho)])
+                if len(bloco) >= self.TAMANHO_BLOCO:
+                    yield pd.DataFrame(bloco, columns=cabecalho)
+                    bloco = []
+            if bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+        finally:
+            livro.close()
+
+    def _blocos_ofx(self, arquivo: BinaryIO) -> Iterator[pd.DataFrame]:
+        """OFX 1.x (SGML) e 2.x (XML): lê as transações <STMTTRN> linha a linha."""
+        tag = re.compile(r"<(/?)(\w+)>([^<\r\n]*)")
+        texto = io.TextIOWrapper(arquivo, encoding='cp1252', errors='ignore', newline='')
+        bloco: List[Dict[str, str]] = []
+        atual: Optional[Dict[str, str]] = None
+        try:
+            for linha in texto:
+                for fechamento, nome, valor in tag.findall(linha):
+                    nome = nome.upper()
+                    if nome == 'STMTTRN':
+                        if fechamento:
+                            if atual is not None:
+                                bloco.append(atual)
+                            atual = None
+                        else:
+                            atual = {}
+                    elif atual is not None and not fechamento and valor.strip():
+                        atual[nome] = valor.strip()
+                if len(bloco) >= self.TAMANHO_BLOCO:
+                    yield self._transacoes_ofx(bloco)
+                    bloco = []
+            if bloco:
+                yield self._transacoes_ofx(bloco)
+        finally:
+            texto.detach()
+
+    @staticmethod
+    def _transacoes_ofx(transacoes: List[Dict[str, str]]) -> pd.DataFrame:
+        df = pd.DataFrame(transacoes)
+        for coluna in ('DTPOSTED', 'TRNAMT', 'MEMO', 'NAME'):
+            if coluna not in df:
+                df[coluna] = None
+        return pd.DataFrame({
+            'data': pd.to_datetime(df['DTPOSTED'].str[:8], format='%Y%m%d', errors='coerce'),
+            'valor': pd.to_numeric(df['TRNAMT'].str.replace(',', '.', regex=False), errors='coerce'),
+            # Sem coluna de tipo: o sinal de TRNAMT decide (TRNTYPE tem dezenas de códigos)
+            'descricao': df['MEMO'].fillna(df['NAME']),
+            'parceiro': df['NAME'],
+        })
+
+    def ler_blocos(self, arquivo: BinaryIO, nome: str) -> Iterator[pd.DataFrame]:
+        """
+        Lê o arquivo em blocos de até TAMANHO_BLOCO linhas.
+
+        Args:
+            arquivo: Arquivo binário (ex: o retorno do st.file_uploader)
+            nome: Nome do arquivo (a extensão define o formato)
+        """
+        extensao = nome.rsplit('.', 1)[-1].lower()
+        if extensao not in self.TIPOS_ARQUIVO:
+            raise ValueError(f"Formato não suportado: .{extensao} (use CSV, OFX ou XLSX)")
+        arquivo.seek(0)
+        leitor = {'csv': self._blocos_csv, 'xlsx': self._blocos_xlsx, 'ofx': self._blocos_ofx}[extensao]
+        yield from leitor(arquivo)
+
+    # ------------------------------------------------------------
+    # NORMALIZAÇÃO
+    # ------------------------------------------------------------
+    @staticmethod
+    def _datas(serie: pd.Series) -> pd.Series:
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie.dt.normalize()
+        texto = serie.astype(str).str.strip().str[:10]
+        iso = pd.to_datetime(texto, format='%Y-%m-%d', errors='coerce')
+        br = pd.to_datetime(texto, format='%d/%m/%Y', errors='coerce')
+        curta = pd.to_datetime(texto.str[:8], format='%d/%m/%y', errors='coerce')
+        return iso.fillna(br).fillna(curta)
+
+    @staticmethod
+    def _valores(serie: pd.Series) -> pd.Series:
+        """Aceita números e textos como '1.234,56', 'R$ -10,00', '(10,00)' ou '10,00-'."""
+        if pd.api.types.is_numeric_dtype(serie):
+            return serie.astype(float)
+        texto = serie.astype(str).str.strip().str.replace(r"[R$\s]", "", regex=True)
+        negativo = texto.str.startswith('(') | texto.str.endswith('-') | texto.str.startswith('-')
+        texto = texto.str.strip("()-+")
+        virgula = texto.str.contains(',', regex=False)
+        texto = texto.where(~virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+        valores = pd.to_numeric(texto, errors='coerce')
+        return valores.where(~negativo, -valores)
+
+    @classmethod
+    def _tipos(cls, serie: Optional[pd.Series], valores: pd.Series) -> np.ndarray:
+        """
+        'Entrada'/'Saída' pela coluna de tipo ou pelo sinal do valor.
+
+        A coluna só decide quando o valor inteiro é um dos tokens de
+        TIPOS_ENTRADA/TIPOS_SAIDA (C, D, Crédito, Débito...); qualquer
+        outro texto ("Compra cartão", "PIX") fica com o sinal.
+        """
+        pelo_sinal = np.where(valores < 0, "Saída", "Entrada")
+        if serie is None:
+            return pelo_sinal
+        texto = serie.map(lambda v: cls._cabecalho(v).strip(" .") if v is not None and not pd.isna(v) else "")
+        return np.where(texto.isin(TIPOS_ENTRADA), "Entrada", np.where(texto.isin(TIPOS_SAIDA), "Saída", pelo_sinal))
+
+    def normalizar_bloco(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converte um bloco do arquivo para as colunas do lançamento.
+
+        Returns:
+            DataFrame com data, valor (positivo), tipo_movimento, descricao,
+            categoria_arquivo, parceiro_arquivo e status_arquivo
+        """
+        mapa = self.mapear_colunas(list(df.columns))
+        faltando = {'data', 'valor'} - mapa.keys()
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias não encontradas no arquivo: {', '.join(sorted(faltando))}")
+
+        valores = self._valores(df[mapa['valor']])
+        vazio = pd.Series([None] * len(df), index=df.index, dtype=object)
+        texto = lambda campo: df[mapa[campo]].where(df[mapa[campo]].notna(), None) if campo in mapa else vazio
+        return pd.DataFrame({
+            'data': self._datas(df[mapa['data']]),
+            'valor': valores.abs(),
+            'tipo_movimento': self._tipos(df[mapa['tipo']] if 'tipo' in mapa else None, valores),
+            'descricao': texto('descricao').fillna("").astype(str).str.strip(),
+            'categoria_arquivo': texto('categoria'),
+            'parceiro_arquivo': texto('parceiro'),
+            'status_arquivo': texto('status'),
+        }, index=df.index)
+
+    # ------------------------------------------------------------
+    # MAPEAMENTO AUTOMÁTICO (lookups em cache)
+    # ------------------------------------------------------------
+    @staticmethod
+    def _texto_chave(serie: pd.Series) -> pd.Series:
+        return serie.fillna("").astype(str).map(ClientesIndex.normalizar)
+
+    def _mapas(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Lookups de categoria e parceiro, em cache até o livro ou os cadastros mudarem.
+
+        - categorias: código ou descrição normalizada -> código
+        - parceiros: nome normalizado -> id do cliente
+        - historico: descrição normalizada -> (categoria, parceiro) do último lançamento
+        """
+        conn = self.db._get_connection()
+        try:
+            colunas = FinanceiroStore.colunas_extrato(conn)
+            impressao = conn.execute(
+                f"SELECT (SELECT COUNT(*) FROM {FinanceiroStore.TABELA}), (SELECT MAX(id) FROM {FinanceiroStore.TABELA}), "
+                f"(SELECT COUNT(*) FROM categorias)"
+                + (", (SELECT COUNT(*) FROM clientes), (SELECT MAX(id) FROM clientes)" if colunas['clientes'] else "")
+            ).fetchone()
+        finally:
+            conn.close()
+        return ResultCache.obter(("importacao_mapas",) + tuple(impressao), lambda: self._carregar_mapas(colunas))
+
+    def _carregar_mapas(self, colunas: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        conn = self.db._get_connection()
+        try:
+            cats = pd.read_sql_query("SELECT codigo, descricao FROM categorias", conn)
+            clis = (pd.read_sql_query("SELECT id, nome FROM clientes", conn)
+                    if colunas['clientes'] else pd.DataFrame(columns=['id', 'nome']))
+            campos = [c for c in (colunas['categoria'], colunas['parceiro']) if c]
+            hist = pd.read_sql_query(
+                f"SELECT descricao{''.join(', ' + c for c in campos)} FROM {FinanceiroStore.TABELA} ORDER BY data, id",
+                conn
+            )
+        finally:
+            conn.close()
+
+        categorias = dict(zip(self._texto_chave(cats['descricao']), cats['codigo']))
+        categorias.update(zip(self._texto_chave(cats['codigo']), cats['codigo']))
+        parceiros = dict(zip(self._texto_chave(clis['nome']), clis['id']))
+        # Última ocorrência de cada descrição vence
+        hist['chave'] = self._texto_chave(hist['descricao'])
+        hist = hist[hist['chave'] != ""].drop_duplicates('chave', keep='last')
+        historico = {
+            chave: (getattr(linha, colunas['categoria'], None) if colunas['categoria'] else None,
+                    getattr(linha, colunas['parceiro'], None) if colunas['parceiro'] else None)
+            for chave, linha in zip(hist['chave'], hist.itertuples(index=False))
+        }
+        return {
+            'categorias': categorias,
+            'parceiros': parceiros,
+            'nomes_parceiros': dict(zip(clis['id'], clis['nome'])),
+            'historico': historico,
+        }
+
+    # ------------------------------------------------------------
+    # DEDUPLICAÇÃO
+    # ------------------------------------------------------------
+    @classmethod
+    def chaves_naturais(cls, df: pd.DataFrame) -> pd.Series:
+        """
+        Hash de (data, valor, tipo, descrição normalizada, ocorrência).
+
+        A ocorrência numera linhas idênticas na ordem em que aparecem, então
+        reimportar o mesmo extrato casa linha a linha com o que já foi gravado.
+        """
+        base = (
+            pd.to_datetime(df['data']).dt.strftime('%Y-%m-%d') + "|"
+            + df['valor'].astype(float).round(2).map("{:.2f}".format) + "|"
+            + df['tipo_movimento'].astype(str) + "|"
+            + cls._texto_chave(df['descricao'])
+        )
+        ocorrencia = base.groupby(base).cumcount().astype(str)
+        return (base + "|" + ocorrencia).map(lambda s: hashlib.blake2b(s.encode(), digest_size=12).hexdigest())
+
+    def _chaves_existentes(self, data_ini: pd.Timestamp, data_fim: pd.Timestamp) -> set:
+        conn = self.db._get_connection()
+        try:
+            existentes = pd.read_sql_query(
+                f"SELECT date(data) AS data, valor, tipo_movimento, descricao FROM {FinanceiroStore.TABELA} "
+                f"WHERE data >= ? AND data < ? ORDER BY data, id",
+                conn, params=(data_ini.strftime('%Y-%m-%d'), (data_fim + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+            )
+        finally:
+            conn.close()
+        return set(self.chaves_naturais(existentes)) if not existentes.empty else set()
+
+    # ------------------------------------------------------------
+    # PRÉVIA E GRAVAÇÃO
+    # ------------------------------------------------------------
+    def preparar(self, arquivo: BinaryIO, nome: str, status_padrao: str = "Pago",
+                 categoria_entrada: Optional[str] = None, categoria_saida: Optional[str] = None) -> pd.DataFrame:
+        """
+        Prévia da importação (não grava nada).
+
+        Args:
+            arquivo: Arquivo binário
+            nome: Nome do arquivo (define o formato)
+            status_padrao: Status das linhas sem status no arquivo
+            categoria_entrada / categoria_saida: Código usado quando a categoria
+                não vem no arquivo nem no histórico
+
+        Returns:
+            DataFrame com data, tipo_movimento, valor, descricao, categoria,
+            parceiro, parceiro_nome, status, chave e situacao
+        """
+        self._colunas_destino()
+        blocos = [self.normalizar_bloco(b) for b in self.ler_blocos(arquivo, nome)]
+        if not blocos:
+            return pd.DataFrame(columns=['data', 'tipo_movimento', 'valor', 'descricao', 'categoria',
+                                         'parceiro', 'parceiro_nome', 'status', 'chave', 'situacao'])
+        df = pd.concat(blocos, ignore_index=True)
+        mapas = self._mapas()
+
+        # Categoria: arquivo -> histórico da descrição -> padrão do tipo
+        chave_desc = self._texto_chave(df['descricao'])
+        historico = chave_desc.map(mapas['historico'])
+        hist_cat = historico.map(lambda h: h[0] if isinstance(h, tuple) else None)
+        hist_parc = historico.map(lambda h: h[1] if isinstance(h, tuple) else None)
+        padrao = pd.Series(np.where(df['tipo_movimento'] == "Entrada", categoria_entrada, categoria_saida), index=df.index)
+        df['categoria'] = (self._texto_chave(df['categoria_arquivo']).map(mapas['categorias'])
+                           .fillna(hist_cat).fillna(padrao))
+        df['parceiro'] = (self._texto_chave(df['parceiro_arquivo']).map(mapas['parceiros'])
+                          .fillna(hist_parc).astype('Int64'))
+        df['parceiro_nome'] = df['parceiro'].map(mapas['nomes_parceiros'])
+
+        status = df['status_arquivo'].fillna("").astype(str).str.strip().str.capitalize()
+        df['status'] = status.where(status.isin(["Pago", "Pendente"]), status_padrao)
+
+        invalido = df['data'].isna() | df['valor'].isna() | (df['valor'] == 0)
+        df['chave'] = None
+        df['situacao'] = SITUACAO_INVALIDO
+        validos = df.loc[~invalido]
+        if not validos.empty:
+            chaves = self.chaves_naturais(validos)
+            existentes = self._chaves_existentes(validos['data'].min(), validos['data'].max())
+            df.loc[validos.index, 'chave'] = chaves
+            df.loc[validos.index, 'situacao'] = np.where(chaves.isin(existentes), SITUACAO_DUPLICADO, SITUACAO_NOVO)
+
+        logger.info(f"Prévia de importação '{nome}': {df['situacao'].value_counts().to_dict()}")
+        previa = df[['data', 'tipo_movimento', 'valor', 'descricao', 'categoria',
+                     'parceiro', 'parceiro_nome', 'status', 'chave', 'situacao']]
+        # Identifica esta prévia: a chave de idempotência da gravação
+        previa.attrs['lote'] = uuid.uuid4().hex
+        return previa
+
+    def gravar(self, previa: pd.DataFrame) -> int:
+        """
+        Insere as linhas novas da prévia numa única transação.
+
+        Reenviar a mesma prévia (clique duplo, rerun) não duplica: a gravação
+        usa como chave de idempotência o identificador da prévia. Uma nova
+        prévia do mesmo arquivo (ex: depois de excluir os lançamentos) grava
+        normalmente.
+
+        Returns:
+            Quantidade de lançamentos inseridos
+        """
+        novos = previa[previa['situacao'] == SITUACAO_NOVO]
+        if novos.empty:
+            return 0
+
+        colunas = self._colunas_destino()
+        campos = ['data', 'valor', 'descricao', 'tipo_movimento', 'status']
+        extras: List[Tuple[str, str]] = [(colunas[f], f) for f in ('categoria', 'parceiro')]
+        nomes = campos + [coluna for coluna, _ in extras]
+
+        def nativo(valor):
+            if valor is None or pd.isna(valor):
+                return None
+            return valor.item() if isinstance(valor, np.generic) else valor
+
+        linhas = [
+            (d.strftime('%Y-%m-%d'), round(float(v), 2), desc, tipo, status, *(nativo(x) for x in resto))
+            for d, v, desc, tipo, status, *resto in zip(
+                novos['data'], novos['valor'], novos['descricao'], novos['tipo_movimento'], novos['status'],
+                *(novos[campo] for _, campo in extras)
+            )
+        ]
+
+        def inserir():
+            conn = self.db._get_connection()
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO {FinanceiroStore.TABELA} ({', '.join(nomes)}) "
+                        f"VALUES ({', '.join('?' * len(nomes))})",
+                        linhas
+                    )
+                return len(linhas)
+            finally:
+                conn.close()
+
+        lote = previa.attrs.get('lote') or uuid.uuid4().hex
+        inseridos = FilaEscrita.escrever(self.db, inserir, chave=f"importacao:{lote}")
+        logger.info(f"Importação em lote: {inseridos} lançamentos gravados")
+        return inseridos
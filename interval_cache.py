@@ -0,0 +1,189 @@
+"""
+Cache por Intervalo - Dashboard Comercial Tiny ERP
+Responde períodos de vendas a partir de períodos já baixados e só busca as lacunas
+"""
+
+import time
+import hashlib
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple, Union
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalCache:
+    """
+    Cache de notas do Tiny indexado por dia.
+
+    Guarda as notas agrupadas por data de emissão e a lista de intervalos já
+    cobertos. Um pedido [a, b] é respondido fatiando os dias em cache; só as
+    lacunas (dias ainda não cobertos) vão para a API. "Este Mês" dentro de
+    "Este Ano", ou uma data final movida um dia, viram acerto ou acerto parcial.
+
+    O trecho a partir de hoje expira em TTL_HOJE; os dias fechados em TTL
+    (uma lacuna que termina hoje vira duas entradas de cobertura).
+
+    As lacunas são buscadas em modo estrito: uma busca que falha não entra na
+    cobertura (o erro sobe para a página) e não deixa lista parcial em cache.
+    """
+
+    TTL = Config.CACHE_TTL
+    TTL_HOJE = 60
+    MAX_NOTAS = 500_000
+
+    _lock = threading.Lock()
+    # token_hash -> {'dias': {date: [notas]}, 'cobertura': [(ini, fim, expira_em)], 'total': int}
+    _caches: Dict[str, Dict[str, Any]] = {}
+    estatisticas = {'acertos': 0, 'parciais': 0, 'falhas': 0, 'dias_buscados': 0}
+
+    @staticmethod
+    def _chave_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _dia_nota(nota: Dict[str, Any]):
+        v = nota.get('nota_fiscal', nota)
+        data_str = v.get('data_emissao', '')
+        for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(data_str, formato).date()
+            except (ValueError, TypeError):
+                continue
+        return None
+
+    @staticmethod
+    def _como_data(valor: Union[date, datetime]) -> date:
+        return valor.date() if isinstance(valor, datetime) else valor
+
+    @staticmethod
+    def _lacunas(ini: date, fim: date, cobertura: List[Tuple[date, date, float]]) -> List[Tuple[date, date]]:
+        """Partes de [ini, fim] que não estão em nenhum intervalo coberto."""
+        lacunas = []
+        atual = ini
+        for c_ini, c_fim, _ in sorted(cobertura):
+            if c_fim < atual:
+                continue
+            if c_ini > fim:
+                break
+            if c_ini > atual:
+                lacunas.append((atual, c_ini - timedelta(days=1)))
+            atual = max(atual, c_fim + timedelta(days=1))
+            if atual > fim:
+                break
+        if atual <= fim:
+            lacunas.append((atual, fim))
+        return lacunas
+
+    @classmethod
+    def _expirar(cls, cache: Dict[str, Any], agora: float) -> None:
+        """Remove intervalos vencidos e os dias que só eles cobriam."""
+        vencidos = [c for c in cache['cobertura'] if c[2] <= agora]
+        if not vencidos:
+            return
+        cache['cobertura'] = [c for c in cache['cobertura'] if c[2] > agora]
+        for c_ini, c_fim, _ in vencidos:
+            # Dias ainda dentro de um intervalo vivo (sessões sobrepostas) ficam
+            for l_ini, l_fim in cls._lacunas(c_ini, c_fim, cache['cobertura']):
+                dia = l_ini
+                while dia <= l_fim:
+                    cache['total'] -= len(cache['dias'].pop(dia, []))
+                    dia += timedelta(days=1)
+
+    @classmethod
+    def buscar_vendas(cls, client: Any, data_ini: Union[date, datetime],
+                      data_fim: Union[date, datetime]) -> List[Dict[str, Any]]:
+        """
+        Mesmo contrato de TinyAPIClient.buscar_vendas, servindo o que já estiver em cache.
+
+        Args:
+            client: TinyAPIClient
+            data_ini: Data inicial
+            data_fim: Data final
+
+        Returns:
+            Lista de notas do período (ordenadas por dia)
+
+        Raises:
+            TinyAPIError: se a busca de alguma lacuna falhar
+        """
+        ini, fim = cls._como_data(data_ini), cls._como_data(data_fim)
+        chave = cls._chave_token(client.token)
+        agora = time.time()
+        hoje = date.today()
+
+        with cls._lock:
+            cache = cls._caches.setdefault(chave, {'dias': {}, 'cobertura': [], 'total': 0})
+            cls._expirar(cache, agora)
+            lacunas = cls._lacunas(ini, fim, cache['cobertura'])
+
+        if not lacunas:
+            cls.estatisticas['acertos'] += 1
+        elif lacunas == [(ini, fim)]:
+            cls.estatisticas['falhas'] += 1
+        else:
+            cls.estatisticas['parciais'] += 1
+
+        novos: Dict[date, List[Dict[str, Any]]] = {}
+        for l_ini, l_fim in lacunas:
+            notas = client.buscar_vendas(l_ini, l_fim, estrito=True)
+            por_dia: Dict[date, List[Dict[str, Any]]] = {}
+            for nota in notas or []:
+                # Nota sem data legível fica no primeiro dia da lacuna
+                dia = cls._dia_nota(nota) or l_ini
+                # Dias fora da lacuna já estão em cache (ou não foram pedidos): não sobrescreve
+                if l_ini <= dia <= l_fim:
+                    por_dia.setdefault(dia, []).append(nota)
+            novos.update(por_dia)
+
+            # Só o trecho a partir de hoje expira rápido; os dias fechados ficam o TTL normal
+            if l_fim < hoje:
+                entradas = [(l_ini, l_fim, agora + cls.TTL)]
+            elif l_ini >= hoje:
+                entradas = [(l_ini, l_fim, agora + cls.TTL_HOJE)]
+            else:
+                entradas = [(l_ini, hoje - timedelta(days=1), agora + cls.TTL),
+                            (hoje, l_fim, agora + cls.TTL_HOJE)]
+            with cls._lock:
+                cache = cls._caches.setdefault(chave, {'dias': {}, 'cobertura': [], 'total': 0})
+                for dia, lista in por_dia.items():
+                    cache['total'] += len(lista) - len(cache['dias'].get(dia, []))
+                    cache['dias'][dia] = lista
+                cache['cobertura'].extend(entradas)
+                cls.estatisticas['dias_buscados'] += (l_fim - l_ini).days + 1
+                if cache['total'] > cls.MAX_NOTAS:
+                    logger.info("Cache por intervalo passou do limite de notas; reiniciando")
+                    cls._caches[chave] = {'dias': {}, 'cobertura': [], 'total': 0}
+
+            if l_ini <= ini and l_fim >= fim:
+                return notas or []
+
+        with cls._lock:
+            cache = cls._caches.get(chave, {'dias': {}})
+            resultado = []
+            dia = ini
+            while dia <= fim:
+                lista = novos.get(dia)
+                resultado.extend(lista if lista is not None else cache['dias'].get(dia, ()))
+                dia += timedelta(days=1)
+        return resultado
+
+    @classmethod
+    def resumo_estatisticas(cls) -> str:
+        e = cls.estatisticas
+        total = e['acertos'] + e['parciais'] + e['falhas']
+        if not total:
+            return "Cache por intervalo: sem consultas ainda."
+        return (
+            f"Cache por intervalo: {e['acertos']} acertos, {e['parciais']} parciais, "
+            f"{e['falhas']} falhas ({e['acertos'] / total:.0%} de acerto); "
+            f"{e['dias_buscados']} dias buscados na API."
+        )
+
+    @classmethod
+    def limpar(cls) -> None:
+        with cls._lock:
+            cls._caches.clear()
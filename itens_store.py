@@ -0,0 +1,272 @@
+"""
+Itens de Venda - Dashboard Comercial Tiny ERP
+Tabela fato de itens das notas (produto, quantidade, valor) para rankings e Curva ABC
+"""
+
+import time
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import DataUtils
+
+logger = logging.getLogger(__name__)
+
+CLASSES_ABC = ['A (Vital)', 'B (Importante)', 'C (Complementar)']
+
+
+class ItensStore:
+    """
+    Itens das notas fiscais, lidos uma única vez do Tiny e guardados no SQLite.
+
+    - `vendas_itens`: uma linha por item (id_nota, seq, data, sku, descrição, qtd, valor, canal)
+    - `vendas_itens_notas`: notas cujos detalhes já foram lidos (inclusive as sem itens)
+
+    As notas vêm do espelho local (`vendas_notas`, ver VendasStore). Como o
+    detalhe de uma nota emitida não muda, cada nota é aberta na API no máximo
+    uma vez; rankings e Curva ABC de qualquer período saem de um GROUP BY.
+    """
+
+    _tabelas_criadas = False
+
+    def __init__(self, db: Any):
+        self.db = db
+        self.criar_tabelas()
+
+    # ------------------------------------------------------------
+    # ESQUEMA
+    # ------------------------------------------------------------
+    def criar_tabelas(self) -> None:
+        if ItensStore._tabelas_criadas:
+            return
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS vendas_itens (
+                        id_nota TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        data TEXT NOT NULL,
+                        sku TEXT NOT NULL,
+                        descricao TEXT,
+                        qtd REAL NOT NULL DEFAULT 0,
+                        valor REAL NOT NULL DEFAULT 0,
+                        canal TEXT,
+                        PRIMARY KEY (id_nota, seq)
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_vendas_itens_data ON vendas_itens(data, sku);
+
+                    CREATE TABLE IF NOT EXISTS vendas_itens_notas (
+                        id_nota TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        itens INTEGER NOT NULL DEFAULT 0,
+                        lido_em REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_vendas_itens_notas_data ON vendas_itens_notas(data);
+                """)
+            ItensStore._tabelas_criadas = True
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------
+    # CARGA
+    # ------------------------------------------------------------
+    @staticmethod
+    def converter_itens(detalhes: Dict[str, Any]) -> List[Tuple[int, str, str, float, float]]:
+        """
+        Extrai os itens do retorno de `obter_detalhes_nota`.
+
+        Returns:
+            Lista de (seq, sku, descricao, qtd, valor)
+        """
+        # Procura itens (compatibilidade com versões diferentes da API)
+        itens = []
+        if 'itens' in detalhes:
+            itens = detalhes['itens']
+        elif 'nota_fiscal' in detalhes and 'itens' in detalhes['nota_fiscal']:
+            itens = detalhes['nota_fiscal']['itens']
+
+        linhas = []
+        for seq, item_wrapper in enumerate(itens or []):
+            item = item_wrapper.get('item', item_wrapper)
+            linhas.append((
+                seq,
+                str(item.get('codigo') or 'SEM-COD'),
+                item.get('descricao') or 'Produto Sem Nome',
+                DataUtils.converter_valor(item.get('quantidade')),
+                DataUtils.converter_valor(item.get('valor_total')),
+            ))
+        return linhas
+
+    def gravar_nota(self, id_nota: str, data_nota: str, canal: str, detalhes: Dict[str, Any]) -> int:
+        """
+        Grava os itens de uma nota e a marca como lida (numa transação).
+
+        Args:
+            id_nota: ID da nota no Tiny
+            data_nota: Data de emissão (ISO)
+            canal: Canal de venda da nota
+            detalhes: Retorno de `obter_detalhes_nota`
+
+        Returns:
+            Quantidade de itens gravados
+        """
+        itens = self.converter_itens(detalhes)
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM vendas_itens WHERE id_nota = ?", (id_nota,))
+                conn.executemany(
+                    "INSERT INTO vendas_itens (id_nota, seq, data, sku, descricao, qtd, valor, canal) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(id_nota, seq, data_nota, sku, desc, qtd, valor, canal) for seq, sku, desc, qtd, valor in itens]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO vendas_itens_notas (id_nota, data, itens, lido_em) VALUES (?, ?, ?, ?)",
+                    (id_nota, data_nota, len(itens), time.time())
+                )
+        finally:
+            conn.close()
+        return len(itens)
+
+    def notas_pendentes(self, data_ini: date, data_fim: date, limite: Optional[int] = None,
+                        por_valor: bool = False) -> pd.DataFrame:
+        """
+        Notas do período (no espelho local) cujos itens ainda não foram lidos.
+
+        Args:
+            data_ini: Data inicial
+            data_fim: Data final
+            limite: Máximo de notas
+            por_valor: Maiores notas primeiro (cobrem mais faturamento por chamada
+                à API); senão, as mais recentes primeiro
+
+        Returns:
+            DataFrame com id_nota, numero, data, canal, valor
+        """
+        ordem = "n.valor DESC" if por_valor else "n.data DESC, n.numero DESC"
+        sql = (
+            "SELECT n.id_nota, n.numero, n.data, n.canal, n.valor FROM vendas_notas n "
+            "LEFT JOIN vendas_itens_notas l ON l.id_nota = n.id_nota "
+            "WHERE n.data BETWEEN ? AND ? AND n.excluida = 0 AND l.id_nota IS NULL "
+            f"ORDER BY {ordem}"
+        )
+        params: List[Any] = [data_ini.isoformat(), data_fim.isoformat()]
+        if limite:
+            sql += " LIMIT ?"
+            params.append(int(limite))
+        conn = self.db._get_connection()
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    def populacao(self, data_ini: date, data_fim: date) -> pd.DataFrame:
+        """
+        Todas as notas do período no espelho, com a marca de itens já lidos.
+
+        Returns:
+            DataFrame com id_nota, numero, data, canal, valor, lida
+        """
+        conn = self.db._get_connection()
+        try:
+            df = pd.read_sql_query(
+                "SELECT n.id_nota, n.numero, n.data, n.canal, n.valor, l.id_nota IS NOT NULL AS lida "
+                "FROM vendas_notas n LEFT JOIN vendas_itens_notas l ON l.id_nota = n.id_nota "
+                "WHERE n.data BETWEEN ? AND ? AND n.excluida = 0",
+                conn, params=(data_ini.isoformat(), data_fim.isoformat())
+            )
+        finally:
+            conn.close()
+        df['lida'] = df['lida'].astype(bool)
+        return df
+
+    def itens_das_notas(self, ids_notas) -> pd.DataFrame:
+        """
+        Itens já gravados das notas informadas.
+
+        Returns:
+            DataFrame com id_nota, SKU, Nome_Limpo, Qtd, Valor_Total
+        """
+        ids = list(dict.fromkeys(ids_notas))
+        partes = []
+        conn = self.db._get_connection()
+        try:
+            for i in range(0, len(ids), 500):
+                lote = ids[i:i + 500]
+                marcas = ",".join("?" * len(lote))
+                partes.append(pd.read_sql_query(
+                    "SELECT id_nota, sku AS SKU, descricao AS Nome_Limpo, qtd AS Qtd, valor AS Valor_Total "
+                    f"FROM vendas_itens WHERE id_nota IN ({marcas})",
+                    conn, params=lote
+                ))
+        finally:
+            conn.close()
+        if not partes:
+            return pd.DataFrame(columns=['id_nota', 'SKU', 'Nome_Limpo', 'Qtd', 'Valor_Total'])
+        return pd.concat(partes, ignore_index=True)
+
+    def cobertura(self, data_ini: date, data_fim: date) -> Tuple[int, int, float, float]:
+        """
+        Returns:
+            (notas com itens já lidos, total de notas do período no espelho,
+            faturamento das notas lidas, faturamento total do período)
+        """
+        conn = self.db._get_connection()
+        try:
+            lidas, total, valor_lido, valor_total = conn.execute(
+                "SELECT COUNT(l.id_nota), COUNT(*), "
+                "TOTAL(CASE WHEN l.id_nota IS NOT NULL THEN n.valor END), TOTAL(n.valor) "
+                "FROM vendas_notas n "
+                "LEFT JOIN vendas_itens_notas l ON l.id_nota = n.id_nota "
+                "WHERE n.data BETWEEN ? AND ? AND n.excluida = 0",
+                (data_ini.isoformat(), data_fim.isoformat())
+            ).fetchone()
+        finally:
+            conn.close()
+        return lidas or 0, total or 0, valor_lido, valor_total
+
+    # ------------------------------------------------------------
+    # RANKINGS
+    # ------------------------------------------------------------
+    @staticmethod
+    def classificar_abc(percentual_acumulado: pd.Series) -> np.ndarray:
+        """Classe ABC pela % acumulada do faturamento (até 80% = A, até 95% = B, resto = C)."""
+        return np.select(
+            [percentual_acumulado <= 80, percentual_acumulado <= 95],
+            CLASSES_ABC[:2],
+            default=CLASSES_ABC[2]
+        )
+
+    def ranking_produtos(self, data_ini: date, data_fim: date) -> pd.DataFrame:
+        """
+        Volume e faturamento por produto no período, com a Curva ABC.
+
+        Returns:
+            DataFrame ordenado por faturamento com SKU, Nome_Completo, Nome_Limpo,
+            Qtd, Valor_Total, % Acumulada e Curva ABC
+        """
+        conn = self.db._get_connection()
+        try:
+            df = pd.read_sql_query(
+                "SELECT i.sku AS SKU, i.descricao AS Nome_Limpo, SUM(i.qtd) AS Qtd, SUM(i.valor) AS Valor_Total "
+                "FROM vendas_itens i JOIN vendas_notas n ON n.id_nota = i.id_nota "
+                "WHERE i.data BETWEEN ? AND ? AND n.excluida = 0 "
+                "GROUP BY i.sku, i.descricao "
+                "ORDER BY Valor_Total DESC",
+                conn, params=(data_ini.isoformat(), data_fim.isoformat())
+            )
+        finally:
+            conn.close()
+
+        df['Nome_Completo'] = df['SKU'] + " - " + df['Nome_Limpo']
+        total_faturamento = df['Valor_Total'].sum()
+        if total_faturamento > 0:
+            df['% Acumulada'] = df['Valor_Total'].cumsum() / total_faturamento * 100
+        else:
+            df['% Acumulada'] = 100.0
+        df['Curva ABC'] = self.classificar_abc(df['% Acumulada'])
+        return df
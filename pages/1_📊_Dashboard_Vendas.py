@@ -20,7 +20,13 @@ from api_client import TinyAPIClient, TinyAPIError
 from ibge_client import IBGEClient
 from data_processor import DataProcessor
 from utils import ValidationUtils
-from database import DatabaseManager
+from conexoes import BancoCompartilhado
+from blacklist_cache import BlacklistCache
+from search_index import SearchIndexCache
+from perf_utils import ResultCache, SectionTimer
+from figure_cache import FigureCache
+from dataset_registry import DatasetRegistry
+from interval_cache import IntervalCache
 
 # ============================================================
 # CONFIGURAÇÃO INICIAL
@@ -33,14 +39,14 @@ st.set_page_config(
 )
 
 # Inicializa Banco de Dados
-db = DatabaseManager()
-db.inicializar_banco()
+db = BancoCompartilhado.obter()
 
 # Inicializa Variáveis de Memória
-if "dados_carregados" not in st.session_state:
-    st.session_state["dados_carregados"] = None
-if "mapa_carregado" not in st.session_state:
-    st.session_state["mapa_carregado"] = None
+# A sessão guarda só a chave do dataset; o DataFrame fica no DatasetRegistry
+if "dados_chave" not in st.session_state:
+    st.session_state["dados_chave"] = None
+if "tempos_secoes" not in st.session_state:
+    st.session_state["tempos_secoes"] = {}
 
 st.markdown("""
 <style>
@@ -71,12 +77,19 @@ with col_titulo:
 # FUNÇÕES
 # ============================================================
 
-@st.cache_data(ttl=Config.CACHE_TTL, show_spinner=False)
 def carregar_coordenadas_ibge():
-    try:
-        return IBGEClient.carregar_municipios()
-    except Exception as e:
-        return pd.DataFrame()
+    """Tabela do IBGE compartilhada por todas as sessões (uma cópia por processo)."""
+    def carregar():
+        try:
+            return IBGEClient.carregar_municipios()
+        except Exception as e:
+            return pd.DataFrame()
+
+    dataset = DatasetRegistry.obter_ou_carregar(("ibge_municipios",), carregar, idade_maxima=Config.CACHE_TTL)
+    if dataset.df.empty:
+        # Não segura a falha por uma hora: tenta de novo na próxima carga
+        DatasetRegistry.descartar(("ibge_municipios",))
+    return dataset.df
 
 def gerar_id_unico(row):
     """Cria uma assinatura única para a venda: Data-Cliente-Valor"""
@@ -95,7 +108,7 @@ def buscar_vendas_tiny_paginado(token: str, data_ini: datetime, data_fim: dateti
         barra = st.progress(0)
         
         texto_status.text("Buscando vendas...")
-        vendas_raw = client.buscar_vendas(data_ini, data_fim)
+        vendas_raw = IntervalCache.buscar_vendas(client, data_ini, data_fim)
         texto_status.text("Processando...")
         barra.progress(50)
         
@@ -110,6 +123,159 @@ def buscar_vendas_tiny_paginado(token: str, data_ini: datetime, data_fim: dateti
         st.error(f"Erro: {str(e)}")
         return pd.DataFrame()
 
+def exibir_tempo(nome: str):
+    """Mostra o tempo da última execução da seção (se o modo de medição estiver ligado)."""
+    if st.session_state.get("mostrar_tempos"):
+        st.caption(f"⏱️ {nome}: {st.session_state['tempos_secoes'].get(nome, 0):.0f} ms")
+
+def secao_kpis(df_vis: pd.DataFrame, chave_secao: tuple):
+    with SectionTimer.medir("Indicadores", st.session_state["tempos_secoes"]):
+        kpis = ResultCache.obter(("kpis",) + chave_secao, lambda: DataProcessor.calcular_kpis(df_vis))
+        
+        st.markdown("---")
+        st.subheader("📊 Indicadores Principais")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("💰 Faturamento", f"R$ {kpis['total_vendas']:,.2f}")
+        c2.metric("🎫 Ticket Médio", f"R$ {kpis['ticket_medio']:,.2f}")
+        c3.metric("📄 Notas", f"{kpis['notas_emitidas']:,}")
+        c4.metric("🏙️ Cidades", f"{kpis['cidades_atendidas']}")
+    exibir_tempo("Indicadores")
+
+@st.fragment
+def secao_mapa(df_vis: pd.DataFrame, chave_secao: tuple):
+    """Mapa como fragmento: o botão 'Ampliar Mapa' só redesenha o mapa."""
+    with SectionTimer.medir("Mapa", st.session_state["tempos_secoes"]):
+        st.markdown("---")
+        col_titulo_mapa, col_botao = st.columns([3, 1])
+        with col_titulo_mapa:
+            st.subheader("🗺️ Mapa de Vendas")
+        with col_botao:
+            modo_tela_cheia = st.toggle("🔭 Ampliar Mapa", value=False, key="ampliar_mapa")
+        
+        altura_mapa = 900 if modo_tela_cheia else 600
+        zoom_inicial = 3.5
+        
+        df_agrupado = ResultCache.obter(("mapa",) + chave_secao, lambda: df_vis.groupby(
+            ['chave_cidade', 'Cidade_Original', 'Estado', 'latitude', 'longitude', 'Canal']
+        ).agg(Valor=('Valor', 'sum'), Qtd_Vendas=('Valor', 'count')).reset_index())
+        
+        cores_canais = {"Mercado Livre": "#FFE600", "Shopee": "#FF5722", "Site": "#2E7D32", "Venda Direta": "#111111"}
+
+        def construir_mapa():
+            # --- AJUSTE MAPA: Tamanho Médio (30) ---
+            fig_mapa = px.scatter_mapbox(
+                df_agrupado, lat="latitude", lon="longitude", size="Valor", color="Canal",
+                color_discrete_map=cores_canais,
+                hover_name="Cidade_Original",
+                hover_data={"Estado": True, "Valor": ":.2f", "Qtd_Vendas": True, "latitude": False, "longitude": False, "Canal": True},
+                size_max=30, # Reduzido para ficar elegante
+                zoom=zoom_inicial, center={"lat": -14.2, "lon": -51.9},
+                mapbox_style="carto-positron",
+            )
+            fig_mapa.update_traces(marker=dict(opacity=0.8, sizemin=4))
+            fig_mapa.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, height=altura_mapa)
+            return fig_mapa
+        
+        fig_mapa = FigureCache.obter("dashboard_mapa", [df_agrupado], {"altura": altura_mapa, "zoom": zoom_inicial}, construir_mapa)
+        st.plotly_chart(fig_mapa, use_container_width=True)
+    exibir_tempo("Mapa")
+
+def secao_graficos(df_vis: pd.DataFrame, chave_secao: tuple):
+    with SectionTimer.medir("Gráficos", st.session_state["tempos_secoes"]):
+        st.markdown("---")
+        df_tempo = ResultCache.obter(("tempo",) + chave_secao, lambda: DataProcessor.agrupar_por_data(df_vis))
+        def construir_tempo():
+            fig_tempo = px.line(df_tempo, x='Data_Obj', y='Valor', markers=True, title="Tendência Diária")
+            fig_tempo.update_traces(line_color='#17a2b8', line_width=3)
+            return fig_tempo
+        st.plotly_chart(FigureCache.obter("dashboard_tempo", [df_tempo], {}, construir_tempo), use_container_width=True)
+        
+        c_uf, c_cid = st.columns(2)
+        with c_uf:
+            df_uf = ResultCache.obter(("uf",) + chave_secao, lambda: DataProcessor.agrupar_por_estado(df_vis, top_n=10))
+            fig_uf = FigureCache.obter("dashboard_uf", [df_uf], {}, lambda: px.bar(df_uf, x='Estado', y='Valor', color='Valor', text_auto='.2s', title="Top Estados"))
+            st.plotly_chart(fig_uf, use_container_width=True)
+        with c_cid:
+            df_city = ResultCache.obter(("cidade",) + chave_secao, lambda: DataProcessor.agrupar_por_cidade(df_vis, top_n=10))
+            def construir_cidades():
+                fig_city = px.bar(df_city, x='Valor', y='Cidade_Original', orientation='h', text_auto='.2s', title="Top Cidades")
+                fig_city.update_layout(yaxis={'categoryorder': 'total ascending'})
+                return fig_city
+            st.plotly_chart(FigureCache.obter("dashboard_cidades", [df_city], {}, construir_cidades), use_container_width=True)
+    exibir_tempo("Gráficos")
+
+@st.fragment
+def renderizar_lista_exclusao(df_base: pd.DataFrame, chave_dataset: str):
+    """
+    Lista paginada de vendas com busca e exclusão.
+    Roda como fragmento: buscar, paginar ou excluir só redesenha a lista.
+    """
+    with SectionTimer.medir("Lista de Vendas", st.session_state["tempos_secoes"]):
+        corpo_lista_exclusao(df_base, chave_dataset)
+    exibir_tempo("Lista de Vendas")
+
+def corpo_lista_exclusao(df_base: pd.DataFrame, chave_dataset: str):
+    indice = SearchIndexCache.obter(chave_dataset, df_base)
+
+    col_busca, col_tamanho = st.columns([4, 1])
+    texto_busca = col_busca.text_input("🔍 Buscar venda por Cliente ou Cidade:", placeholder="Digite para filtrar...", key="busca_vendas")
+    tamanho_pagina = col_tamanho.selectbox("Por página", [10, 20, 50, 100], index=1, key="tamanho_pagina_vendas")
+
+    # Busca ou tamanho de página novos reiniciam a paginação
+    estado_lista = (texto_busca, tamanho_pagina, chave_dataset)
+    if st.session_state.get("lista_estado") != estado_lista:
+        st.session_state["lista_estado"] = estado_lista
+        st.session_state["lista_cursores"] = [-1]
+    cursores = st.session_state["lista_cursores"]
+
+    visiveis = BlacklistCache.mascara_visivel(db, chave_dataset, df_base['id_unico'])
+    ranks = indice.buscar(texto_busca, visiveis)
+    posicoes, proximo_cursor = indice.pagina(ranks, cursores[-1], tamanho_pagina)
+    df_lista = df_base.iloc[posicoes]
+
+    total_encontrado = len(ranks)
+    if total_encontrado == 0:
+        st.info("Nenhuma venda encontrada com esse termo.")
+        return
+    st.caption(f"Página {len(cursores)} · {total_encontrado} vendas encontradas (mais recentes primeiro).")
+
+    # Cabeçalho da Tabela
+    c1, c2, c3, c4, c5 = st.columns([1, 2, 2, 2, 1])
+    c1.markdown("**Data**")
+    c2.markdown("**Cliente**")
+    c3.markdown("**Cidade**")
+    c4.markdown("**Valor**")
+    c5.markdown("**Ação**")
+    st.divider()
+
+    for pos, row in zip(posicoes, df_lista.itertuples(index=False)):
+        c1, c2, c3, c4, c5 = st.columns([1, 2, 2, 2, 1])
+
+        c1.text(row.Data_Obj.strftime('%d/%m') if pd.notna(row.Data_Obj) else "-")
+        c2.text(row.Cliente)
+        c3.text(f"{row.Cidade_Original}-{row.Estado}")
+        c4.text(f"R$ {row.Valor:,.2f}")
+
+        # Chave com a posição da linha: vendas idênticas geram o mesmo id_unico
+        if c5.button("🗑️", key=f"del_{row.id_unico}_{pos}"):
+            if BlacklistCache.adicionar(db, row.id_unico):
+                st.toast("Removido!")
+                st.rerun(scope="fragment")
+            else:
+                st.error("Erro.")
+
+        st.markdown("<hr style='margin: 5px 0'>", unsafe_allow_html=True)
+
+    # Navegação por cursor
+    col_ant, col_info, col_prox = st.columns([1, 3, 1])
+    if col_ant.button("◀ Anterior", disabled=len(cursores) == 1, key="lista_anterior"):
+        cursores.pop()
+        st.rerun(scope="fragment")
+    if col_prox.button("Próxima ▶", disabled=proximo_cursor is None, key="lista_proxima"):
+        cursores.append(proximo_cursor)
+        st.rerun(scope="fragment")
+    col_info.caption("Exclusões atualizam esta lista na hora; indicadores e gráficos são recalculados na próxima interação com a página.")
+
 # ============================================================
 # BARRA LATERAL
 # ============================================================
@@ -124,166 +290,68 @@ except KeyError:
 d_ini = st.sidebar.date_input("Data Inicial", Config.DATA_INICIO_PADRAO, format="DD/MM/YYYY")
 d_fim = st.sidebar.date_input("Data Final", Config.DATA_FIM_PADRAO, format="DD/MM/YYYY")
 
+st.sidebar.toggle("⏱️ Mostrar tempo por seção", value=False, key="mostrar_tempos")
+if st.session_state.get("mostrar_tempos"):
+    st.sidebar.caption(IntervalCache.resumo_estatisticas())
+
 if st.sidebar.button("🔄 Atualizar Dashboard", type="primary", use_container_width=True):
     if not token:
         st.error("Token não configurado.")
     else:
         with st.spinner("⏳ Carregando..."):
-            if st.session_state["mapa_carregado"] is None:
-                st.session_state["mapa_carregado"] = carregar_coordenadas_ibge()
+            df_mapa = carregar_coordenadas_ibge()
             
             df_vendas = buscar_vendas_tiny_paginado(token, d_ini, d_fim)
+            chave_dataset = ("vendas_dashboard", str(d_ini), str(d_fim))
             
-            if not df_vendas.empty and not st.session_state["mapa_carregado"].empty:
-                df_final = DataProcessor.enriquecer_com_coordenadas(df_vendas, st.session_state["mapa_carregado"])
+            if not df_vendas.empty and not df_mapa.empty:
+                df_final = DataProcessor.enriquecer_com_coordenadas(df_vendas, df_mapa)
                 
                 # Gera ID único para controle de exclusão
                 df_final['id_unico'] = df_final.apply(gerar_id_unico, axis=1)
                 
-                st.session_state["dados_carregados"] = df_final
+                DatasetRegistry.publicar(chave_dataset, df_final)
             else:
                 st.warning("Sem dados para exibir.")
-                st.session_state["dados_carregados"] = pd.DataFrame()
+                DatasetRegistry.publicar(chave_dataset, pd.DataFrame())
+            st.session_state["dados_chave"] = chave_dataset
 
 # ============================================================
 # DASHBOARD
 # ============================================================
 
-if st.session_state["dados_carregados"] is not None and not st.session_state["dados_carregados"].empty:
-    
-    # 1. Aplica o Blacklist
-    blacklist = db.obter_blacklist()
-    df_visualizacao = st.session_state["dados_carregados"].copy()
+dataset = DatasetRegistry.obter(st.session_state["dados_chave"]) if st.session_state["dados_chave"] else None
+
+if dataset is not None and not dataset.df.empty:
     
-    if blacklist:
-        df_visualizacao = df_visualizacao[~df_visualizacao['id_unico'].isin(blacklist)]
+    # Cada seção é cacheada pelas entradas de que depende:
+    # versão do dataset + versão da blacklist
+    chave_secao = (dataset.id, BlacklistCache.versao())
+
+    # 1. Aplica o Blacklist (máscara em cache por dataset + versão da blacklist)
+    df_visualizacao = ResultCache.obter(
+        ("visualizacao",) + chave_secao,
+        lambda: BlacklistCache.filtrar(db, dataset.id, dataset.df)
+    )
 
     if df_visualizacao.empty:
         st.warning("Todos os dados foram excluídos ou filtrados.")
     else:
-        # KPIs
-        kpis = DataProcessor.calcular_kpis(df_visualizacao)
-        
-        st.markdown("---")
-        st.subheader("📊 Indicadores Principais")
-        c1, c2, c3, c4 = st.columns(4)
-        c1.metric("💰 Faturamento", f"R$ {kpis['total_vendas']:,.2f}")
-        c2.metric("🎫 Ticket Médio", f"R$ {kpis['ticket_medio']:,.2f}")
-        c3.metric("📄 Notas", f"{kpis['notas_emitidas']:,}")
-        c4.metric("🏙️ Cidades", f"{kpis['cidades_atendidas']}")
-        
-        # MAPA
-        st.markdown("---")
-        col_titulo_mapa, col_botao = st.columns([3, 1])
-        with col_titulo_mapa:
-            st.subheader("🗺️ Mapa de Vendas")
-        with col_botao:
-            modo_tela_cheia = st.toggle("🔭 Ampliar Mapa", value=False)
-        
-        altura_mapa = 900 if modo_tela_cheia else 600
-        zoom_inicial = 3.5
-        
-        df_agrupado = df_visualizacao.groupby(
-            ['chave_cidade', 'Cidade_Original', 'Estado', 'latitude', 'longitude', 'Canal']
-        ).agg(Valor=('Valor', 'sum'), Qtd_Vendas=('Valor', 'count')).reset_index()
-        
-        cores_canais = {"Mercado Livre": "#FFE600", "Shopee": "#FF5722", "Site": "#2E7D32", "Venda Direta": "#111111"}
+        secao_kpis(df_visualizacao, chave_secao)
+        secao_mapa(df_visualizacao, chave_secao)
+        secao_graficos(df_visualizacao, chave_secao)
 
-        # --- AJUSTE MAPA: Tamanho Médio (30) ---
-        fig_mapa = px.scatter_mapbox(
-            df_agrupado, lat="latitude", lon="longitude", size="Valor", color="Canal",
-            color_discrete_map=cores_canais,
-            hover_name="Cidade_Original",
-            hover_data={"Estado": True, "Valor": ":.2f", "Qtd_Vendas": True, "latitude": False, "longitude": False, "Canal": True},
-            size_max=30, # Reduzido para ficar elegante
-            zoom=zoom_inicial, center={"lat": -14.2, "lon": -51.9},
-            mapbox_style="carto-positron",
-        )
-        fig_mapa.update_traces(marker=dict(opacity=0.8, sizemin=4))
-        fig_mapa.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, height=altura_mapa)
-        
-        st.plotly_chart(fig_mapa, use_container_width=True)
+        # --- ÁREA DE GERENCIAMENTO (COM BUSCA e FIX DE CHAVE) ---
+        st.markdown("---")
+        st.subheader("🗑️ Gerenciar / Excluir Vendas")
         
-        if modo_tela_cheia:
-            st.info("👆 Desative 'Ampliar Mapa' para ver os gráficos.")
+        with st.expander("Ver Lista de Vendas para Exclusão", expanded=True):
+            renderizar_lista_exclusao(dataset.df, dataset.id)
 
-        if not modo_tela_cheia:
-            st.markdown("---")
-            # Gráficos
-            df_tempo = DataProcessor.agrupar_por_data(df_visualizacao)
-            fig_tempo = px.line(df_tempo, x='Data_Obj', y='Valor', markers=True, title="Tendência Diária")
-            fig_tempo.update_traces(line_color='#17a2b8', line_width=3)
-            st.plotly_chart(fig_tempo, use_container_width=True)
-            
-            c_uf, c_cid = st.columns(2)
-            with c_uf:
-                df_uf = DataProcessor.agrupar_por_estado(df_visualizacao, top_n=10)
-                st.plotly_chart(px.bar(df_uf, x='Estado', y='Valor', color='Valor', text_auto='.2s', title="Top Estados"), use_container_width=True)
-            with c_cid:
-                df_city = DataProcessor.agrupar_por_cidade(df_visualizacao, top_n=10)
-                fig_city = px.bar(df_city, x='Valor', y='Cidade_Original', orientation='h', text_auto='.2s', title="Top Cidades")
-                fig_city.update_layout(yaxis={'categoryorder': 'total ascending'})
-                st.plotly_chart(fig_city, use_container_width=True)
-            
-            # --- ÁREA DE GERENCIAMENTO (COM BUSCA e FIX DE CHAVE) ---
-            st.markdown("---")
-            st.subheader("🗑️ Gerenciar / Excluir Vendas")
-            
-            with st.expander("Ver Lista de Vendas para Exclusão", expanded=True):
-                # Campo de Busca
-                texto_busca = st.text_input("🔍 Buscar venda por Cliente ou Cidade:", placeholder="Digite para filtrar...")
-
-                # Cabeçalho da Tabela
-                c1, c2, c3, c4, c5 = st.columns([1, 2, 2, 2, 1])
-                c1.markdown("**Data**")
-                c2.markdown("**Cliente**")
-                c3.markdown("**Cidade**")
-                c4.markdown("**Valor**")
-                c5.markdown("**Ação**")
-                st.divider()
-
-                # Prepara a lista
-                df_lista = df_visualizacao.sort_values(by='Data_Obj', ascending=False)
-                
-                # Aplica o Filtro de Texto
-                if texto_busca:
-                    termo = texto_busca.lower()
-                    df_lista = df_lista[
-                        df_lista['Cliente'].str.lower().str.contains(termo, na=False) | 
-                        df_lista['Cidade_Original'].str.lower().str.contains(termo, na=False)
-                    ]
-
-                # Limita a 50 APÓS filtrar
-                total_encontrado = len(df_lista)
-                if total_encontrado > 50:
-                    st.caption(f"Mostrando as últimas 50 de {total_encontrado} vendas encontradas.")
-                    df_lista = df_lista.head(50)
-                elif total_encontrado == 0:
-                    st.info("Nenhuma venda encontrada com esse termo.")
-
-                # Loop de exibição COM INDICE para garantir chave única
-                for i, (idx, row) in enumerate(df_lista.iterrows()):
-                    c1, c2, c3, c4, c5 = st.columns([1, 2, 2, 2, 1])
-                    
-                    c1.text(row['Data_Obj'].strftime('%d/%m'))
-                    c2.text(row['Cliente'])
-                    c3.text(f"{row['Cidade_Original']}-{row['Estado']}")
-                    c4.text(f"R$ {row['Valor']:,.2f}")
-                    
-                    # Botão com chave única combinando ID da venda + índice da lista
-                    # Isso resolve o erro StreamlitDuplicateElementKey
-                    if c5.button("🗑️", key=f"del_{row['id_unico']}_{i}"):
-                        if db.adicionar_blacklist(row['id_unico']):
-                            st.success("Removido!")
-                            time.sleep(0.5)
-                            st.rerun()
-                        else:
-                            st.error("Erro.")
-                    
-                    st.markdown("<hr style='margin: 5px 0'>", unsafe_allow_html=True)
-
-elif st.session_state["dados_carregados"] is None:
+elif st.session_state["dados_chave"] is None:
     st.info("👈 Clique em **'Atualizar Dashboard'** para carregar os dados.")
+elif dataset is None:
+    st.info("Os dados deste período saíram da memória do servidor. Clique em **'Atualizar Dashboard'**.")
 
 # ============================================================
 # RODAPÉ
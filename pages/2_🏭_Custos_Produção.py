@@ -1,100 +1,27 @@
 import streamlit as st
 import pandas as pd
-from database import DatabaseManager
-from datetime import datetime
-from fpdf import FPDF
-import tempfile
+import uuid
+from conexoes import BancoCompartilhado, FilaEscrita
+from custos_engine import CustosEngine
+from cadastro_cache import CadastroCache
+from fichas_pdf import FichaTecnica
+from perf_utils import ResultCache
 
 # ============================================================
 # CONFIGURAÇÃO E BANCO
 # ============================================================
 st.set_page_config(page_title="Custos de Produção", layout="wide", page_icon="🏭")
-db = DatabaseManager()
-db.inicializar_banco()
+db = BancoCompartilhado.obter()
 
 st.title("🏭 Custos de Produção Industrial")
 st.markdown("Cálculo de custo da batida e registro de lotes para precificação de venda.")
 
-# Carregar Dados
-df_insumos = db.listar_insumos()
-df_especies = db.listar_especies()
+# Carregar Dados (cache versionado: só relê o banco depois de uma edição)
+df_insumos = CadastroCache.insumos(db)
+df_especies = CadastroCache.especies(db)
 
 def get_custo_insumo(nome):
-    try:
-        if df_insumos is not None and not df_insumos.empty:
-            linha = df_insumos[df_insumos['nome'] == nome]
-            if not linha.empty: return float(linha.iloc[0]['custo_unitario'])
-    except: pass
-    return 0.0
-
-# ============================================================
-# FUNÇÃO GERADORA DE PDF
-# ============================================================
-def gerar_pdf_custo(dados):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    
-    # Cabeçalho
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(190, 10, txt="FICHA TÉCNICA DE PRODUÇÃO - PLANTE FORTE", ln=True, align='C')
-    pdf.ln(10)
-    
-    # Dados Gerais
-    pdf.set_font("Arial", size=12)
-    pdf.cell(190, 8, txt=f"Produto: {dados['produto']}", ln=True)
-    pdf.cell(190, 8, txt=f"Processo: {dados['processo']}", ln=True)
-    pdf.cell(190, 8, txt=f"Lote: {dados['lote']} | Data: {datetime.now().strftime('%d/%m/%Y')}", ln=True)
-    pdf.cell(190, 8, txt=f"Volume Total Obtido: {dados['peso_total']:.2f} kg", ln=True)
-    pdf.ln(5)
-    
-    # Tabela Batida
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(190, 10, txt="1. COMPOSIÇÃO DA MISTURA (BATIDA)", ln=True)
-    pdf.set_font("Arial", size=10)
-    
-    # Cabeçalho Tabela
-    pdf.set_fill_color(240, 240, 240)
-    pdf.cell(140, 8, "Componente (Peso Aplicado)", 1, 0, 'L', True)
-    pdf.cell(50, 8, "Custo Total (R$)", 1, 1, 'C', True)
-    
-    # Itens
-    pdf.set_font("Arial", size=10)
-    for item in dados['itens_batida']:
-        texto_item = item['nome']
-        if item['peso'] > 0:
-            texto_item += f" ({item['peso']:.2f} kg)"
-            
-        pdf.cell(140, 8, texto_item, 1)
-        pdf.cell(50, 8, f"R$ {item['valor']:.2f}", 1, 1, 'R')
-        
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(140, 8, "CUSTO MÉDIO POR KG BENEFICIADO:", 1, 0, 'R')
-    pdf.cell(50, 8, f"R$ {dados['custo_kg']:.2f}", 1, 1, 'R')
-    pdf.ln(10)
-    
-    # Embalagem
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(190, 10, txt=f"2. PRODUTO ACABADO (SACO {dados['tamanho']} KG)", ln=True)
-    pdf.set_font("Arial", size=10)
-    
-    pdf.cell(140, 8, f"Custo Semente ({dados['tamanho']}kg): R$ {dados['custo_base_saco']:.2f}", ln=True)
-    pdf.cell(140, 8, f"Custo Embalagem/Extras: R$ {dados['custo_extras']:.2f}", ln=True)
-    
-    if dados['lista_extras']:
-        pdf.ln(2)
-        pdf.set_font("Arial", 'I', 9)
-        pdf.multi_cell(190, 5, txt="Insumos adicionados: " + ", ".join(dados['lista_extras']))
-    
-    pdf.ln(5)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(34, 139, 34) # Verde
-    pdf.cell(190, 10, txt=f"CUSTO FINAL DO PRODUTO: R$ {dados['custo_final']:.2f}", ln=True)
-    
-    # Salva em memória
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf.output(temp_file.name)
-    return temp_file.name
+    return CadastroCache.custo_insumo(db, nome)
 
 # ============================================================
 # INTERFACE
@@ -121,7 +48,7 @@ with tab_fabrica:
             especie_sel = col_esp.selectbox("Selecione a Semente:", lista_especies)
             
             # Dados Técnicos
-            dados_especie = df_especies[df_especies['nome'] == especie_sel].iloc[0]
+            dados_especie = CadastroCache.especie(db, especie_sel)
             familia = dados_especie['familia']
             custo_ponto = dados_especie['custo_ponto']
             
@@ -268,7 +195,15 @@ with tab_fabrica:
             if not lote_input:
                 st.error("⚠️ Digite o Número do Lote para salvar.")
             else:
-                if db.registrar_lote_producao(lote_input, especie_sel, tipo_processo, peso_final_total, custo_total_batida, custo_kg_final):
+                # Mesma chave até gravar: clique duplo não registra o lote duas vezes
+                token = st.session_state.setdefault('token_lote', uuid.uuid4().hex)
+                if FilaEscrita.escrever(
+                    db, lambda: db.registrar_lote_producao(lote_input, especie_sel, tipo_processo, peso_final_total, custo_total_batida, custo_kg_final),
+                    chave=f"lote:{lote_input}:{token}"
+                ):
+                    del st.session_state['token_lote']
+                    # "Último Custo Ind." das espécies vem do cache do cadastro
+                    CadastroCache.invalidar()
                     st.success(f"✅ Lote **{lote_input}** registrado com sucesso! Custo: R$ {custo_kg_final:.2f}/kg.")
                     # Opcional: st.rerun() para limpar, mas pode ser ruim se quiser gerar PDF logo em seguida
                 else:
@@ -341,19 +276,25 @@ with tab_fabrica:
                 "custo_final": custo_final_produto
             }
             
-            if st.button("🖨️ Gerar Ficha Técnica (PDF)", type="primary", use_container_width=True):
+            # PDF gerado em memória só no clique; o download vale enquanto os dados não mudarem
+            chave_ficha = FichaTecnica.impressao(dados_pdf)
+            if st.button("🖨️ Gerar Ficha Técnica (PDF)", use_container_width=True, key="btn_pdf"):
                 try:
-                    pdf_path = gerar_pdf_custo(dados_pdf)
-                    with open(pdf_path, "rb") as f:
-                        st.download_button(
-                            label="📥 Baixar PDF Agora",
-                            data=f,
-                            file_name=f"Ficha_{especie_sel}_{tipo_processo[:4]}_{tamanho_sc}kg.pdf",
-                            mime="application/pdf",
-                            key="dl_pdf"
-                        )
+                    st.session_state['ficha_pdf'] = (chave_ficha, FichaTecnica.obter(dados_pdf))
                 except Exception as e:
                     st.error(f"Erro ao gerar PDF: {e}. Verifique se instalou 'fpdf' (pip install fpdf).")
+            
+            ficha_pdf = st.session_state.get('ficha_pdf')
+            if ficha_pdf is not None and ficha_pdf[0] == chave_ficha:
+                st.download_button(
+                    label="📥 Baixar Ficha Técnica (PDF)",
+                    data=ficha_pdf[1],
+                    file_name=f"Ficha_{especie_sel}_{tipo_processo[:4]}_{tamanho_sc}kg.pdf",
+                    mime="application/pdf",
+                    type="primary",
+                    use_container_width=True,
+                    key="dl_pdf"
+                )
 
 # ------------------------------------------------------------------------------
 # ABA 2: CONFIGURAÇÕES (GERENCIAMENTO DE INSUMOS)
@@ -362,6 +303,18 @@ with tab_config:
     st.subheader("Gestão de Preços e Insumos")
     st.info("Aqui você pode editar preços, criar novos insumos e excluir itens obsoletos.")
     
+    # Resultado do último recálculo em cascata (sobrevive ao st.rerun do salvamento)
+    diff_custos = st.session_state.pop('diff_custos', None)
+    if diff_custos is not None:
+        if diff_custos.empty:
+            st.info("♻️ Nenhum custo projetado depende dos valores alterados.")
+        else:
+            st.success(f"♻️ {len(diff_custos)} custos projetados recalculados automaticamente:")
+            st.dataframe(
+                diff_custos.style.format({'Antes': 'R$ {:,.2f}', 'Depois': 'R$ {:,.2f}', 'Variação': '{:+,.2f}'}),
+                use_container_width=True, hide_index=True
+            )
+    
     col_ins, col_esp = st.columns([2, 1])
     
     # 1. TABELA DE INSUMOS (EDITÁVEL)
@@ -390,28 +343,30 @@ with tab_config:
             
             # LÓGICA DE ATUALIZAÇÃO (SALVAR EDIÇÕES)
             if st.button("💾 Salvar Alterações e Exclusões", type="primary"):
-                changes_count = 0
-                
                 # 1. Detectar Exclusões
-                excluir_ids = edited_insumos[edited_insumos['Excluir'] == True]['id'].tolist()
-                for eid in excluir_ids:
-                    db.excluir_insumo(eid)
-                    changes_count += 1
+                excluir_ids = edited_insumos.loc[edited_insumos['Excluir'] == True, 'id'].tolist()
                 
-                # 2. Detectar Edições (Preço/Nome)
-                # Comparamos o DF editado com o original
-                for index, row in edited_insumos.iterrows():
-                    original = df_insumos[df_insumos['id'] == row['id']].iloc[0]
-                    
-                    if row['custo_unitario'] != original['custo_unitario']:
-                        db.atualizar_insumo(row['id'], 'custo_unitario', row['custo_unitario'])
-                        changes_count += 1
-                    
-                    if row['nome'] != original['nome']:
-                        db.atualizar_insumo(row['id'], 'nome', row['nome'])
-                        changes_count += 1
-
+                # 2. Detectar Edições (diff vetorizado entre o DF original e o editado)
+                alteracoes = CadastroCache.diferencas(df_edit, edited_insumos, list(CadastroCache.CAMPOS_EDITAVEIS['insumos']))
+                alteracoes = alteracoes[~alteracoes['id'].isin(excluir_ids)]
+                
+                # 3. Preços alterados -> recálculo em cascata de espécies e produtos padrão
+                nomes_originais = df_edit.set_index('id')['nome']
+                precos = alteracoes[alteracoes['campo'] == 'custo_unitario']
+                precos_alterados = {
+                    nomes_originais[i]: (float(antes), float(depois))
+                    for i, antes, depois in zip(precos['id'], precos['antes'], precos['depois'])
+                }
+                
+                # Tudo numa única transação (edições, exclusões e cascata)
+                changes_count = len(alteracoes) + len(excluir_ids)
                 if changes_count > 0:
+                    diff_custos = CadastroCache.aplicar_lote(
+                        db, 'insumos', alteracoes, excluir_ids,
+                        cascata=(lambda conn: CustosEngine(db).propagar(precos_alterados, conn=conn)) if precos_alterados else None
+                    )
+                    if diff_custos is not None:
+                        st.session_state['diff_custos'] = diff_custos
                     st.success(f"{changes_count} alterações realizadas!")
                     st.rerun()
                 else:
@@ -430,7 +385,7 @@ with tab_config:
                     
                     if st.form_submit_button("Adicionar"):
                         if novo_nome and nova_und:
-                            db.adicionar_insumo(novo_nome, nova_und, novo_custo, nova_cat)
+                            CadastroCache.adicionar_insumo(db, novo_nome, nova_und, novo_custo, nova_cat)
                             st.success(f"{novo_nome} adicionado!")
                             st.rerun()
                         else:
@@ -458,15 +413,61 @@ with tab_config:
             )
 
             if st.button("💾 Salvar Custos de Ponto", type="primary"):
-                changes_count = 0
-                for index, row in edited_especies.iterrows():
-                    original = df_especies[df_especies['id'] == row['id']].iloc[0]
-                    if row['custo_ponto'] != original['custo_ponto']:
-                        db.atualizar_especie_campo(row['id'], 'custo_ponto', row['custo_ponto'])
-                        changes_count += 1
+                alteracoes = CadastroCache.diferencas(df_esp_edit, edited_especies, ['custo_ponto'])
+                pontos_alterados = {
+                    int(i): (float(antes), float(depois))
+                    for i, antes, depois in zip(alteracoes['id'], alteracoes['antes'], alteracoes['depois'])
+                }
                 
+                changes_count = len(alteracoes)
                 if changes_count > 0:
+                    st.session_state['diff_custos'] = CadastroCache.aplicar_lote(
+                        db, 'especies', alteracoes,
+                        cascata=lambda conn: CustosEngine(db).propagar({}, pontos_alterados, conn=conn)
+                    )
                     st.success(f"{changes_count} custos de ponto atualizados!")
                     st.rerun()
                 else:
-                    st.info("Nenhuma alteração no custo do ponto.")
\ No newline at end of file
+                    st.info("Nenhuma alteração no custo do ponto.")
+
+    # 3. DEPENDÊNCIAS DE CUSTO (CONFERÊNCIA DO RECÁLCULO EM CASCATA)
+    with st.expander("🔗 Dependências de Custo (Espécies e Produtos Padrão)"):
+        st.caption("Quanto cada item varia para R$ 1,00 de variação no insumo ou no custo do ponto (batidas de referência da calculadora).")
+        # Expander sempre executa: a tabela só é refeita quando o cadastro muda
+        df_dependencias = ResultCache.obter(
+            ("custos_dependencias", CadastroCache.versao()), lambda: CustosEngine(db).dependencias()
+        )
+        st.dataframe(df_dependencias, use_container_width=True, hide_index=True)
+
+    # 4. FICHAS TÉCNICAS EM LOTE (ZIP)
+    with st.expander("📦 Fichas Técnicas em Lote (ZIP)"):
+        escopo_fichas = st.radio(
+            "Gerar fichas de:",
+            ["Lotes registrados", "Catálogo (espécie x processo x saco)"],
+            horizontal=True, key="escopo_fichas"
+        )
+        if st.button("⚙️ Gerar Fichas", key="btn_fichas_lote"):
+            if escopo_fichas == "Lotes registrados":
+                fichas = FichaTecnica.fichas_lotes(db.listar_lotes_disponiveis(), lambda t: CadastroCache.custo_saco(db, t))
+            else:
+                fichas = FichaTecnica.fichas_catalogo(
+                    df_especies, lambda nome: CadastroCache.custo_insumo(db, nome), lambda t: CadastroCache.custo_saco(db, t)
+                )
+            if not fichas:
+                st.warning("Nada para gerar.")
+            else:
+                with st.spinner(f"Gerando {len(fichas)} fichas..."):
+                    try:
+                        st.session_state['zip_fichas'] = (escopo_fichas, len(fichas), FichaTecnica.gerar_zip(fichas))
+                    except Exception as e:
+                        st.error(f"Erro ao gerar PDF: {e}. Verifique se instalou 'fpdf' (pip install fpdf).")
+        
+        if 'zip_fichas' in st.session_state:
+            escopo_zip, qtd_zip, conteudo_zip = st.session_state['zip_fichas']
+            st.download_button(
+                label=f"📥 Baixar ZIP ({qtd_zip} fichas - {escopo_zip})",
+                data=conteudo_zip,
+                file_name=f"Fichas_Tecnicas_{'Lotes' if escopo_zip == 'Lotes registrados' else 'Catalogo'}.zip",
+                mime="application/zip",
+                key="dl_zip_fichas"
+            )
@@ -1,13 +1,18 @@
 import streamlit as st
 import pandas as pd
-from database import DatabaseManager
+import numpy as np
+import plotly.express as px
+from conexoes import BancoCompartilhado
+from precificacao import MotorPrecos, EIXOS_SENSIBILIDADE, TAMANHOS_SACO
+from cadastro_cache import CadastroCache
+from perf_utils import ResultCache
+from figure_cache import FigureCache
 
 # ============================================================
 # CONFIGURAÇÃO
 # ============================================================
 st.set_page_config(page_title="Precificação de Venda", layout="wide", page_icon="💰")
-db = DatabaseManager()
-db.inicializar_banco()
+db = BancoCompartilhado.obter()
 
 st.title("💰 Precificação Comercial & Margens")
 st.markdown("Definição de preço de venda (SKU) para todos os canais.")
@@ -15,7 +20,6 @@ st.markdown("Definição de preço de venda (SKU) para todos os canais.")
 # ============================================================
 # 1. CARREGAR DADOS (MOTOR)
 # ============================================================
-df_insumos = db.listar_insumos()
 df_lotes = db.listar_lotes_disponiveis()
 df_padrao = db.listar_produtos_padrao()
 
@@ -58,12 +62,7 @@ else:
         st.sidebar.markdown("---")
         tamanho_saco = st.sidebar.radio("Embalagem:", [5, 10, 20], horizontal=True, format_func=lambda x: f"{x} kg")
         
-        custo_saco_estimado = 0.0
-        if df_insumos is not None:
-            try:
-                row_saco = df_insumos[df_insumos['nome'].str.contains(f"Saco {tamanho_saco}kg", case=False)]
-                if not row_saco.empty: custo_saco_estimado = float(row_saco.iloc[0]['custo_unitario'])
-            except: pass
+        custo_saco_estimado = CadastroCache.custo_saco(db, tamanho_saco)
 
         c_emb = st.sidebar.number_input(f"Custo Saco (R$)", value=custo_saco_estimado, step=0.10)
         c_ext = st.sidebar.number_input("Outros (R$)", value=0.20, step=0.05)
@@ -111,14 +110,12 @@ with row1_col1:
         divisor_ml = 1 - ((ml_comissao + ml_imposto + ml_margem + ml_antecipacao) / 100)
         
         if divisor_ml > 0:
-            taxa_fixa_ml = 6.00
-            preco_teste = (custo_final_saco + taxa_fixa_ml) / divisor_ml
+            taxas_ml = ml_comissao + ml_imposto + ml_antecipacao
+            pv_ml = float(MotorPrecos.preco(custo_final_saco, taxas_ml, ml_margem, 6.00, ml_frete, 79.00))
             
-            if preco_teste >= 79.00:
-                pv_ml = (custo_final_saco + ml_frete) / divisor_ml
+            if MotorPrecos.acima_limiar(custo_final_saco, taxas_ml, ml_margem, 6.00, 79.00):
                 msg_ml = "Preço >= 79 (Considera Frete S4)"
             else:
-                pv_ml = preco_teste
                 msg_ml = "Preço < 79 (Considera Taxa Fixa R$ 6)"
                 
             st.divider()
@@ -145,7 +142,7 @@ with row1_col2:
         divisor_sh = 1 - ((sh_aliquota + sh_imposto + sh_margem + sh_antecipacao) / 100)
         
         if divisor_sh > 0:
-            pv_sh = (custo_final_saco + sh_fixa) / divisor_sh
+            pv_sh = float(MotorPrecos.preco(custo_final_saco, sh_aliquota + sh_imposto + sh_antecipacao, sh_margem, sh_fixa))
             st.divider()
             st.markdown(f"""<div style="text-align: center;"><h2 style="color: #e65100; margin:0;">R$ {pv_sh:.2f}</h2><small>Markup Shopee</small></div>""", unsafe_allow_html=True)
         else:
@@ -170,7 +167,7 @@ with row2_col1:
         divisor_si = 1 - ((si_margem + si_imposto + si_comissao + si_outras) / 100)
         
         if divisor_si > 0:
-            pv_si = (custo_final_saco + si_frete) / divisor_si
+            pv_si = float(MotorPrecos.preco(custo_final_saco, si_imposto + si_comissao + si_outras, si_margem, si_frete))
             st.divider()
             st.markdown(f"""<div style="text-align: center;"><h2 style="color: #2e7d32; margin:0;">R$ {pv_si:.2f}</h2><small>Markup Site</small></div>""", unsafe_allow_html=True)
         else:
@@ -197,8 +194,9 @@ with row2_col2:
         divisor_vd = 1 - ((vd_margem + vd_imposto + vd_comissao + vd_outras) / 100)
         
         if divisor_vd > 0:
-            pv_fob = custo_final_saco / divisor_vd
-            pv_cif = (custo_final_saco + vd_frete) / divisor_vd
+            taxas_vd = vd_imposto + vd_comissao + vd_outras
+            pv_fob = float(MotorPrecos.preco(custo_final_saco, taxas_vd, vd_margem, 0.0))
+            pv_cif = float(MotorPrecos.preco(custo_final_saco, taxas_vd, vd_margem, vd_frete))
             
             st.divider()
             col_fob, col_cif = st.columns(2)
@@ -222,4 +220,118 @@ with row2_col2:
                 """, unsafe_allow_html=True)
                 
         else:
-            st.error("Taxas Venda Direta > 100%")
\ No newline at end of file
+            st.error("Taxas Venda Direta > 100%")
+
+# ============================================================
+# 4. TABELA DE PREÇOS DO CATÁLOGO (TODOS OS PRODUTOS x CANAIS)
+# ============================================================
+st.markdown("---")
+st.subheader("3. Tabela de Preços do Catálogo")
+st.markdown("Reprecifica todos os produtos da tabela padrão e todos os lotes (5, 10 e 20 kg) com as taxas e fretes configurados acima.")
+
+# Campos atuais dos cards, por canal (também usados no modo sensibilidade)
+componentes_canais = {
+    "Mercado Livre": {"margem": ml_margem, "comissao": ml_comissao, "imposto": ml_imposto, "antecipacao": ml_antecipacao,
+                      "taxa_fixa": 6.00, "frete": ml_frete, "limiar": 79.00},
+    "Shopee": {"margem": sh_margem, "comissao": sh_aliquota, "imposto": sh_imposto, "antecipacao": sh_antecipacao,
+               "taxa_fixa": sh_fixa},
+    "Site": {"margem": si_margem, "comissao": si_comissao, "imposto": si_imposto, "outras": si_outras, "frete": si_frete},
+    "Venda Direta FOB": {"margem": vd_margem, "comissao": vd_comissao, "imposto": vd_imposto, "outras": vd_outras},
+    "Venda Direta CIF": {"margem": vd_margem, "comissao": vd_comissao, "imposto": vd_imposto, "outras": vd_outras,
+                         "frete": vd_frete},
+}
+# Na tabela a margem vem da varredura abaixo
+canais_simulador = {nome: MotorPrecos.parametros(comp) for nome, comp in componentes_canais.items()}
+
+with st.container(border=True):
+    c1, c2, c3 = st.columns([2, 1, 2])
+    faixa_margem = c1.slider("Faixa de Margem (%)", min_value=0, max_value=60, value=(20, 40), step=1)
+    passo_margem = c2.number_input("Passo (%)", min_value=1, max_value=20, value=5, step=1)
+    canais_tabela = c3.multiselect("Canais", options=list(canais_simulador), default=list(canais_simulador))
+    outros_lote = st.number_input("Outros por saco nos lotes (R$)", value=0.20, step=0.05, key="tab_outros")
+
+margens_tabela = np.arange(faixa_margem[0], faixa_margem[1] + 0.001, passo_margem)
+custos_saco = {t: CadastroCache.custo_saco(db, t) for t in TAMANHOS_SACO}
+catalogo = MotorPrecos.custos_catalogo(df_padrao, df_lotes, custos_saco, outros=outros_lote)
+df_tabela = MotorPrecos.tabela_precos(
+    catalogo, {nome: canais_simulador[nome] for nome in canais_tabela}, margens_tabela
+)
+
+if df_tabela.empty:
+    st.info("Nenhum produto ou canal para precificar.")
+else:
+    st.caption(f"{len(catalogo)} produtos x {len(canais_tabela)} canais x {len(margens_tabela)} margens. Células vazias: taxas + margem >= 100%.")
+    formato = {nome: 'R$ {:,.2f}' for nome in canais_tabela}
+    formato.update({'Custo': 'R$ {:,.2f}', 'Margem (%)': '{:.0f}%'})
+    st.dataframe(df_tabela.style.format(formato, na_rep="-"), use_container_width=True, hide_index=True, height=450)
+
+    st.download_button(
+        label="📥 Baixar Tabela de Preços (CSV)",
+        data=df_tabela.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig'),
+        file_name="Tabela_Precos_Catalogo.csv",
+        mime="text/csv",
+        key="dl_tabela_precos"
+    )
+
+# ============================================================
+# 5. MODO SENSIBILIDADE (GRADES 2-D DE PARÂMETROS)
+# ============================================================
+st.markdown("---")
+st.subheader("4. Sensibilidade do Preço")
+modo_sensibilidade = st.toggle("🔬 Ativar modo sensibilidade", help="Mostra como o preço varia quando dois parâmetros do canal mudam ao mesmo tempo.")
+
+if modo_sensibilidade:
+    # Base de custo do produto selecionado (lote permite variar o tamanho do saco)
+    if origem_custo == "Lote Produzido (Fábrica)":
+        base_custo = {"custo_kg": float(custo_kg_semente), "tamanho": float(tamanho_saco),
+                      "embalagem": float(c_emb), "outros": float(c_ext)}
+        eixos_disponiveis = list(EIXOS_SENSIBILIDADE)
+    else:
+        base_custo = {"custo": float(custo_final_saco)}
+        eixos_disponiveis = [e for e in EIXOS_SENSIBILIDADE if e != 'tamanho']
+
+    rotulo_eixo = lambda e: EIXOS_SENSIBILIDADE[e][0]
+    with st.container(border=True):
+        c1, c2, c3 = st.columns([2, 2, 1])
+        eixo_x = c1.selectbox("Eixo X", eixos_disponiveis, index=eixos_disponiveis.index('margem'), format_func=rotulo_eixo)
+        opcoes_y = [e for e in eixos_disponiveis if e != eixo_x]
+        eixo_y = c2.selectbox("Eixo Y", opcoes_y, index=opcoes_y.index('comissao') if 'comissao' in opcoes_y else 0, format_func=rotulo_eixo)
+        resolucao = c3.select_slider("Pontos por eixo", options=[25, 50, 100, 200], value=100)
+
+        c4, c5 = st.columns(2)
+        faixa_x = c4.slider(f"Faixa {rotulo_eixo(eixo_x)}", 0.0, EIXOS_SENSIBILIDADE[eixo_x][1][1] * 2,
+                            EIXOS_SENSIBILIDADE[eixo_x][1], key=f"faixa_x_{eixo_x}")
+        faixa_y = c5.slider(f"Faixa {rotulo_eixo(eixo_y)}", 0.0, EIXOS_SENSIBILIDADE[eixo_y][1][1] * 2,
+                            EIXOS_SENSIBILIDADE[eixo_y][1], key=f"faixa_y_{eixo_y}")
+
+    valores_x = np.linspace(faixa_x[0], faixa_x[1], resolucao)
+    valores_y = np.linspace(faixa_y[0], faixa_y[1], resolucao)
+    chave_base = tuple(sorted(base_custo.items()))
+
+    abas_canais = st.tabs(list(componentes_canais))
+    for aba, (nome_canal, comp) in zip(abas_canais, componentes_canais.items()):
+        with aba:
+            componentes = {**comp, **base_custo}
+            # Grade em cache por base de custo + parâmetros do canal + eixos
+            grade = ResultCache.obter(
+                ("precificacao_sensibilidade", nome_canal, chave_base, tuple(sorted(comp.items())),
+                 eixo_x, faixa_x, eixo_y, faixa_y, resolucao),
+                lambda: pd.DataFrame(
+                    MotorPrecos.grade(componentes, eixo_x, valores_x, eixo_y, valores_y),
+                    index=np.round(valores_y, 2), columns=np.round(valores_x, 2)
+                )
+            )
+            fig = FigureCache.obter(
+                "precificacao_sensibilidade", [grade],
+                {"canal": nome_canal, "x": eixo_x, "y": eixo_y},
+                lambda: px.imshow(
+                    grade,
+                    labels=dict(x=rotulo_eixo(eixo_x), y=rotulo_eixo(eixo_y), color="Preço (R$)"),
+                    color_continuous_scale='RdYlGn_r',
+                    origin='lower',
+                    aspect="auto"
+                )
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            if grade.isna().to_numpy().any():
+                st.caption("Áreas em branco: taxas + margem >= 100% (preço impossível).")
@@ -2,9 +2,14 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import Config
 from api_client import TinyAPIClient
+from conexoes import BancoCompartilhado
+from vendas_store import VendasStore
+from itens_store import ItensStore
+from amostragem import AmostragemProdutos
+from blacklist_cache import BlacklistCache
 
 # ============================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -14,15 +19,69 @@ st.set_page_config(page_title="Análise de Produtos", layout="wide", page_icon="
 st.title("📦 Análise de Produtos Vendidos")
 st.markdown("Visão detalhada de volume (Sacos) e faturamento (Curva ABC).")
 
+db = BancoCompartilhado.obter()
+store = VendasStore(db)
+itens_store = ItensStore(db)
+
 # ============================================================
 # GERENCIAMENTO DE ESTADO (MEMÓRIA)
 # ============================================================
 # Aqui verificamos se já existe algo salvo na "mochila" do usuário
-if 'analise_produtos_df' not in st.session_state:
-    st.session_state['analise_produtos_df'] = None
+# (só o período e o tamanho da amostra: os itens ficam na tabela `vendas_itens` do banco local)
+if 'analise_produtos_chave' not in st.session_state:
+    st.session_state['analise_produtos_chave'] = None
 if 'analise_produtos_meta' not in st.session_state:
     st.session_state['analise_produtos_meta'] = None
 
+# Define cores fixas para os gráficos
+CORES_ABC = {
+    'A (Vital)': '#2E7D32',      # Verde
+    'B (Importante)': '#FBC02D', # Amarelo Ouro
+    'C (Complementar)': '#C62828' # Vermelho
+}
+TAMANHO_LOTE = 10  # notas lidas entre atualizações do gráfico no modo progressivo
+
+def figura_curva_abc(df_abc: pd.DataFrame):
+    """Top 15 por faturamento, colorido pela classe ABC."""
+    df_fin = df_abc.sort_values('Valor_Total', ascending=False).head(15)
+    fig_fin = px.bar(
+        df_fin,
+        x='Valor_Total',
+        y='Nome_Limpo',
+        orientation='h',
+        color='Curva ABC',
+        text_auto='.2s',
+        color_discrete_map=CORES_ABC,
+        title="Top 15 - Faturamento (Curva ABC)",
+        labels={'Valor_Total': 'Faturamento (R$)', 'Nome_Limpo': 'Produto'}
+    )
+    fig_fin.update_layout(yaxis={'categoryorder': 'total ascending'}, height=500)
+    return fig_fin
+
+def montar_amostra(data_ini, data_fim, tamanho: int):
+    """Sorteio estratificado (mês x canal, PPS) das notas do período. Mesmo período e tamanho = mesma amostra."""
+    populacao = itens_store.populacao(data_ini, data_fim)
+    semente = AmostragemProdutos.semente(data_ini, data_fim, tamanho)
+    return populacao, AmostragemProdutos.sortear(populacao, tamanho, semente)
+
+def registrar_analise(data_ini, data_fim, tamanho_amostra=None) -> bool:
+    """Guarda só o período na sessão (o ranking sai do banco local). Retorna False se não há notas."""
+    lidas, total_notas, valor_lido, valor_total = itens_store.cobertura(data_ini, data_fim)
+    if total_notas == 0:
+        return False
+    st.session_state['analise_produtos_chave'] = (data_ini, data_fim, tamanho_amostra)
+    if tamanho_amostra is None:
+        st.session_state['analise_produtos_meta'] = (
+            f"Análise gerada em {datetime.now().strftime('%H:%M')} com {lidas} de {total_notas} notas, "
+            f"{valor_lido / valor_total if valor_total else 0:.0%} do faturamento do período."
+        )
+    else:
+        st.session_state['analise_produtos_meta'] = (
+            f"Estimativa gerada em {datetime.now().strftime('%H:%M')} a partir de uma amostra de "
+            f"{tamanho_amostra} sorteios entre {total_notas} notas do período."
+        )
+    return True
+
 # ============================================================
 # FILTROS LATERAIS
 # ============================================================
@@ -38,146 +97,150 @@ except KeyError:
 data_ini = st.sidebar.date_input("Data Inicial", datetime(2024, 1, 1))
 data_fim = st.sidebar.date_input("Data Final", datetime.now())
 
-limite_notas = st.sidebar.slider(
-    "Amostra de Notas", 
-    min_value=10, 
-    max_value=300, 
-    value=50,
-    help="Define quantas vendas recentes serão abertas para ler os itens."
+modo_leitura = st.sidebar.radio(
+    "Modo de leitura",
+    ["⚡ Período completo", "🎯 Amostra estratificada"],
+    help=(
+        "Completo: abre as notas em ordem de valor (maiores primeiro) e atualiza a Curva ABC a cada lote. "
+        "Amostra: sorteia notas por mês e canal, proporcional ao valor, e estima o período inteiro com intervalo de confiança."
+    )
 )
+modo_amostra = modo_leitura == "🎯 Amostra estratificada"
+
+if modo_amostra:
+    tamanho_amostra = st.sidebar.number_input("Tamanho da amostra (sorteios)", min_value=50, max_value=5000, value=300, step=50)
+    erro_alvo = st.sidebar.slider("Erro alvo (± % nos produtos A)", min_value=1, max_value=20, value=5)
+    limite_notas, meta_cobertura = None, 100
+else:
+    tamanho_amostra, erro_alvo = None, 5
+    limite_notas = st.sidebar.slider(
+        "Notas novas por análise", 
+        min_value=10, 
+        max_value=300, 
+        value=50,
+        help="Quantas notas ainda não lidas serão abertas no Tiny nesta análise. As já lidas ficam salvas e entram sempre no cálculo."
+    )
+    meta_cobertura = st.sidebar.slider(
+        "Parar ao cobrir (% do faturamento)",
+        min_value=50,
+        max_value=100,
+        value=95
+    )
 
 col_btn1, col_btn2 = st.sidebar.columns(2)
 btn_analisar = col_btn1.button("🔎 Analisar", type="primary")
 
 # Botão para limpar a memória se o usuário quiser
 if col_btn2.button("🗑️ Limpar"):
-    st.session_state['analise_produtos_df'] = None
+    st.session_state['analise_produtos_chave'] = None
     st.rerun()
 
+# Leitura interrompida pelo botão "Parar": os itens já lidos estão salvos, só exibe
+if st.session_state.get('parar_leitura'):
+    registrar_analise(data_ini, data_fim, tamanho_amostra)
+
 # ============================================================
 # LÓGICA DE PROCESSAMENTO (SÓ RODA SE CLICAR NO BOTÃO)
 # ============================================================
 if btn_analisar:
     client = TinyAPIClient(token)
     
-    # 1. Busca Cabeçalhos
-    with st.spinner("Buscando lista de vendas..."):
-        todas_vendas = client.buscar_vendas(data_ini, data_fim)
+    # 1. Garante as notas do período no espelho local (só baixa os dias que faltam)
+    hoje = datetime.now().date()
+    desde, ate = store.cobertura()
+    if (desde is None or desde > data_ini
+            or ate is None or ate < min(data_fim, hoje - timedelta(days=1))
+            or data_fim >= hoje):
+        blacklist_ids = BlacklistCache.obter_ids(db)
+        store.aplicar_blacklist(blacklist_ids, BlacklistCache.versao())
+        with st.spinner("Buscando lista de vendas..."):
+            try:
+                store.sincronizar(client, data_ini, blacklist_ids)
+            except Exception as e:
+                st.warning(f"Não foi possível atualizar as vendas do Tiny agora ({e}). Usando a última sincronização.")
     
-    if not todas_vendas:
-        st.warning("Nenhuma venda encontrada no período.")
+    # 2. Lê os itens só das notas que ainda não foram abertas
+    if modo_amostra:
+        populacao, amostra = montar_amostra(data_ini, data_fim, tamanho_amostra)
+        ja_lidas = populacao.loc[populacao['lida'], 'id_nota']
+        pendentes = amostra[~amostra['id_nota'].isin(ja_lidas)].drop_duplicates('id_nota')
     else:
-        # Filtra as últimas X notas
-        vendas_analise = todas_vendas[-limite_notas:]
-        qtd_analise = len(vendas_analise)
-        
-        st.info(f"Analisando itens das últimas {qtd_analise} vendas (de um total de {len(todas_vendas)})...")
+        pendentes = itens_store.notas_pendentes(data_ini, data_fim, limite_notas, por_valor=True)
+    qtd_analise = len(pendentes)
+    _, _, valor_lido, valor_total = itens_store.cobertura(data_ini, data_fim)
+    cobertura = valor_lido / valor_total if valor_total else 1.0
+    
+    if qtd_analise and cobertura * 100 < meta_cobertura:
+        st.info(f"Lendo itens de até {qtd_analise} notas novas...")
+        st.button("⏹️ Parar e ver resultado", key="parar_leitura")
         
         # Barra de Progresso
         progress_bar = st.progress(0)
         status_text = st.empty()
+        grafico_parcial = st.empty()
         
-        lista_produtos = []
-        
-        # 2. Busca Itens de cada Nota
-        for i, venda_wrapper in enumerate(vendas_analise):
-            # Desembrulha (Nota Fiscal vs Wrapper direto)
-            venda = venda_wrapper.get('nota_fiscal', venda_wrapper)
-            id_nota = venda.get('id')
-            numero = venda.get('numero')
+        for i, nota in enumerate(pendentes.itertuples(index=False)):
+            detalhes = client.obter_detalhes_nota(nota.id_nota)
+            # Retorno vazio = falha na API: a nota continua pendente para a próxima análise
+            if detalhes:
+                itens_store.gravar_nota(nota.id_nota, nota.data, nota.canal, detalhes)
+                valor_lido += nota.valor
+            cobertura = valor_lido / valor_total if valor_total else 1.0
             
             # Atualiza visual
             progress_bar.progress((i + 1) / qtd_analise)
-            status_text.caption(f"Lendo Nota {numero}...")
+            status_text.caption(f"Lendo Nota {nota.numero}... {cobertura:.0%} do faturamento do período coberto")
             
-            if id_nota:
-                detalhes = client.obter_detalhes_nota(id_nota)
-                
-                # Procura itens (compatibilidade com versões diferentes da API)
-                itens = []
-                if 'itens' in detalhes:
-                    itens = detalhes['itens']
-                elif 'nota_fiscal' in detalhes and 'itens' in detalhes['nota_fiscal']:
-                    itens = detalhes['nota_fiscal']['itens']
-                
-                for item_wrapper in itens:
-                    item = item_wrapper.get('item', {})
-                    
-                    # Tratamento de dados
-                    sku = item.get('codigo', 'SEM-COD')
-                    nome = item.get('descricao', 'Produto Sem Nome')
-                    qtd = float(item.get('quantidade', 0))
-                    valor = float(item.get('valor_total', 0))
-                    
-                    lista_produtos.append({
-                        'SKU': sku,
-                        'Nome_Completo': f"{sku} - {nome}",
-                        'Nome_Limpo': nome, 
-                        'Qtd': qtd,
-                        'Valor_Total': valor
-                    })
+            if not modo_amostra and ((i + 1) % TAMANHO_LOTE == 0 or i + 1 == qtd_analise):
+                df_parcial = itens_store.ranking_produtos(data_ini, data_fim)
+                if not df_parcial.empty:
+                    grafico_parcial.plotly_chart(figura_curva_abc(df_parcial), use_container_width=True, key=f"abc_parcial_{i}")
+                if cobertura * 100 >= meta_cobertura:
+                    break
             
             # Pausa para não bloquear API
             time.sleep(0.3)
             
         progress_bar.empty()
         status_text.empty()
-        
-        # 3. Agregação e Cálculos
-        if lista_produtos:
-            df = pd.DataFrame(lista_produtos)
-            
-            # Agrupa por Produto
-            df_agrupado = df.groupby(['SKU', 'Nome_Completo', 'Nome_Limpo']).agg({
-                'Qtd': 'sum',
-                'Valor_Total': 'sum'
-            }).reset_index()
-            
-            # --- CÁLCULO DA CURVA ABC ---
-            # 1. Ordena por Valor
-            df_abc = df_agrupado.sort_values('Valor_Total', ascending=False).copy()
-            
-            # 2. Calcula % acumulada
-            total_faturamento = df_abc['Valor_Total'].sum()
-            df_abc['% Acumulada'] = (df_abc['Valor_Total'] / total_faturamento).cumsum() * 100
-            
-            # 3. Classifica
-            def classificar(perc):
-                if perc <= 80: return 'A (Vital)'
-                elif perc <= 95: return 'B (Importante)'
-                else: return 'C (Complementar)'
-            
-            df_abc['Curva ABC'] = df_abc['% Acumulada'].apply(classificar)
-            
-            # SALVA NA MEMÓRIA DO STREAMLIT (SESSION STATE)
-            st.session_state['analise_produtos_df'] = df_abc
-            st.session_state['analise_produtos_meta'] = f"Análise gerada em {datetime.now().strftime('%H:%M')} com {qtd_analise} notas."
-            
-            st.rerun() # Recarrega a página para exibir os dados salvos
-            
-        else:
-            st.error("A leitura das notas não retornou itens.")
+        grafico_parcial.empty()
+    
+    if not registrar_analise(data_ini, data_fim, tamanho_amostra):
+        st.warning("Nenhuma venda encontrada no período.")
+    else:
+        st.rerun() # Recarrega a página para exibir os dados salvos
 
 # ============================================================
 # EXIBIÇÃO DOS DADOS (SE HOUVER DADOS NA MEMÓRIA)
 # ============================================================
 
-if st.session_state['analise_produtos_df'] is not None:
-    # Recupera os dados da memória
-    df_abc = st.session_state['analise_produtos_df']
+df_abc = None
+n_necessario = None
+if st.session_state['analise_produtos_chave'] is not None:
+    periodo_ini, periodo_fim, tamanho_chave = st.session_state['analise_produtos_chave']
+    if tamanho_chave is None:
+        df_abc = itens_store.ranking_produtos(periodo_ini, periodo_fim)
+    else:
+        # Estimativa: só os sorteios cujas notas já foram lidas entram no cálculo
+        populacao, amostra = montar_amostra(periodo_ini, periodo_fim, tamanho_chave)
+        sorteios_lidos = amostra[amostra['id_nota'].isin(populacao.loc[populacao['lida'], 'id_nota'])]
+        df_abc = AmostragemProdutos.estimar(sorteios_lidos, itens_store.itens_das_notas(sorteios_lidos['id_nota']))
+        n_necessario = AmostragemProdutos.tamanho_necessario(df_abc, len(sorteios_lidos), erro_alvo / 100)
+
+if df_abc is not None and df_abc.empty:
+    st.error("A leitura das notas não retornou itens.")
+elif df_abc is not None:
     msg_meta = st.session_state['analise_produtos_meta']
     
-    st.success(f"✅ {msg_meta} (Dados salvos na memória)")
+    st.success(f"✅ {msg_meta} (Itens salvos no banco local)")
+    if n_necessario is not None:
+        st.info(
+            f"🎯 Valores estimados para o período inteiro (IC 95% na tabela). "
+            f"Para ±{erro_alvo}% no faturamento dos produtos classe A: ~{n_necessario:,} sorteios."
+        )
     
     total_faturamento = df_abc['Valor_Total'].sum()
     
-    # Define cores fixas para o gráfico
-    cores_abc = {
-        'A (Vital)': '#2E7D32',      # Verde
-        'B (Importante)': '#FBC02D', # Amarelo Ouro
-        'C (Complementar)': '#C62828' # Vermelho
-    }
-
     # Destaque do Campeão (Por Volume)
     campeao_qtd = df_abc.sort_values('Qtd', ascending=False).iloc[0]
     
@@ -196,8 +259,8 @@ if st.session_state['analise_produtos_df'] is not None:
         )
     
     with col_metricas:
-        st.metric("📦 Total de Sacos na Amostra", f"{df_abc['Qtd'].sum():,.0f}")
-        st.metric("💰 Faturamento da Amostra", f"R$ {total_faturamento:,.2f}")
+        st.metric("📦 Total de Sacos no Período", f"{df_abc['Qtd'].sum():,.0f}")
+        st.metric("💰 Faturamento dos Itens", f"R$ {total_faturamento:,.2f}")
 
     st.divider()
 
@@ -216,7 +279,7 @@ if st.session_state['analise_produtos_df'] is not None:
             orientation='h',
             color='Curva ABC',
             text_auto='.0f',
-            color_discrete_map=cores_abc,
+            color_discrete_map=CORES_ABC,
             title="Top 15 - Volume de Vendas",
             labels={'Qtd': 'Quantidade (Sacos)', 'Nome_Limpo': 'Produto'}
         )
@@ -225,32 +288,23 @@ if st.session_state['analise_produtos_df'] is not None:
         
     with tab_fin:
         st.caption("Ordenado pelo VALOR (R$). Curva ABC Clássica.")
-        # Ordena por Valor
-        df_fin = df_abc.sort_values('Valor_Total', ascending=False).head(15)
-        
-        fig_fin = px.bar(
-            df_fin,
-            x='Valor_Total',
-            y='Nome_Limpo',
-            orientation='h',
-            color='Curva ABC',
-            text_auto='.2s',
-            color_discrete_map=cores_abc,
-            title="Top 15 - Faturamento (Curva ABC)",
-            labels={'Valor_Total': 'Faturamento (R$)', 'Nome_Limpo': 'Produto'}
-        )
-        fig_fin.update_layout(yaxis={'categoryorder': 'total ascending'}, height=500)
-        st.plotly_chart(fig_fin, use_container_width=True)
+        st.plotly_chart(figura_curva_abc(df_abc), use_container_width=True)
 
     # Tabela Detalhada
     with st.expander("📋 Ver Tabela Completa"):
-        df_display = df_abc[['SKU', 'Nome_Limpo', 'Qtd', 'Valor_Total', 'Curva ABC']].copy()
-        df_display.columns = ['SKU', 'Produto', 'Sacos', 'Faturamento', 'Classe']
+        if 'Valor_IC' in df_abc.columns:
+            df_display = df_abc[['SKU', 'Nome_Limpo', 'Qtd', 'Qtd_IC', 'Valor_Total', 'Valor_IC', 'Curva ABC']].copy()
+            df_display.columns = ['SKU', 'Produto', 'Sacos', '± Sacos', 'Faturamento', '± Faturamento', 'Classe']
+        else:
+            df_display = df_abc[['SKU', 'Nome_Limpo', 'Qtd', 'Valor_Total', 'Curva ABC']].copy()
+            df_display.columns = ['SKU', 'Produto', 'Sacos', 'Faturamento', 'Classe']
         
         st.dataframe(
             df_display.style.format({
                 'Sacos': '{:,.0f}',
-                'Faturamento': 'R$ {:,.2f}'
+                '± Sacos': '{:,.0f}',
+                'Faturamento': 'R$ {:,.2f}',
+                '± Faturamento': 'R$ {:,.2f}'
             }),
             use_container_width=True
         )
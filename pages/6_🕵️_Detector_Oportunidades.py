@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-import time
-from datetime import datetime, date
-from config import Config
+import plotly.express as px
+from datetime import date, timedelta
 from api_client import TinyAPIClient
-from data_processor import DataProcessor
+from conexoes import BancoCompartilhado
+from vendas_store import VendasStore
+from clientes_index import ClientesIndex
+from blacklist_cache import BlacklistCache
+from figure_cache import FigureCache
 
 # ============================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -14,6 +17,10 @@ st.set_page_config(page_title="Detector de Oportunidades", layout="wide", page_i
 st.title("🕵️ Detector de Oportunidades (Churn & Retenção)")
 st.markdown("Identifique quem parou de comprar, quem é novo e a performance por canal.")
 
+db = BancoCompartilhado.obter()
+store = VendasStore(db)
+indice_clientes = ClientesIndex(db)
+
 # ============================================================
 # FILTROS LATERAIS
 # ============================================================
@@ -52,96 +59,56 @@ btn_comparar = st.sidebar.button("⚔️ Cruzar Dados", type="primary")
 # LÓGICA DE PROCESSAMENTO
 # ============================================================
 if btn_comparar:
-    client = TinyAPIClient(token)
-    
-    # 1. Buscar Vendas
-    with st.spinner("Buscando vendas e identificando canais..."):
-        vendas_p1 = client.buscar_vendas(data_ini_1, data_fim_1)
-        vendas_p2 = client.buscar_vendas(data_ini_2, data_fim_2)
+    # 1. Garante que o espelho local cobre os dois períodos (só baixa os dias que faltam)
+    inicio = min(data_ini_1, data_ini_2)
+    fim = max(data_fim_1, data_fim_2)
+    desde, ate = store.cobertura()
+    if (desde is None or desde > inicio
+            or ate is None or ate < min(fim, date.today() - timedelta(days=1))
+            or fim >= date.today()):
+        blacklist_ids = BlacklistCache.obter_ids(db)
+        store.aplicar_blacklist(blacklist_ids, BlacklistCache.versao())
+        with st.spinner("Sincronizando vendas com o Tiny..."):
+            try:
+                store.sincronizar(TinyAPIClient(token), inicio, blacklist_ids)
+            except Exception as e:
+                st.warning(f"Não foi possível atualizar as vendas do Tiny agora ({e}). Usando a última sincronização.")
+
+    # 2. Atividade de cada cliente nos dois períodos (consulta agregada no índice local)
+    df_clientes = indice_clientes.comparar(data_ini_1, data_fim_1, data_ini_2, data_fim_2)
         
-    if not vendas_p1 and not vendas_p2:
+    if df_clientes.empty:
         st.warning("Nenhum dado encontrado nos períodos selecionados.")
     else:
-        
-        # Função Auxiliar
-        def processar_clientes(lista_vendas):
-            clientes = {} 
-            for v in lista_vendas:
-                nota = v.get('nota_fiscal', v)
-                cliente_node = nota.get('cliente', {})
-                
-                nome = nota.get('nome') or cliente_node.get('nome')
-                valor = float(nota.get('valor_nota', 0))
-                
-                canal_identificado = DataProcessor.identificar_canal(nota)
-                
-                if nome:
-                    nome = nome.strip().upper() 
-                    
-                    if nome not in clientes:
-                        clientes[nome] = {
-                            'total': 0.0, 
-                            'pedidos': 0,
-                            'canais': set()
-                        }
-                    
-                    clientes[nome]['total'] += valor
-                    clientes[nome]['pedidos'] += 1
-                    clientes[nome]['canais'].add(canal_identificado)
-            return clientes
-
-        # Processa os dois períodos
-        dict_p1 = processar_clientes(vendas_p1)
-        dict_p2 = processar_clientes(vendas_p2)
-        
-        # Conjuntos de Nomes
-        nomes_p1 = set(dict_p1.keys())
-        nomes_p2 = set(dict_p2.keys())
-        
-        # Matemática de Conjuntos
-        nomes_perdidos = nomes_p1 - nomes_p2
-        nomes_novos = nomes_p2 - nomes_p1
-        nomes_recorrentes = nomes_p1 & nomes_p2
+        em_p1 = df_clientes['pedidos_1'] > 0
+        em_p2 = df_clientes['pedidos_2'] > 0
+        bits_filtro = ClientesIndex.bits_canais(filtro_canal)
         
         # --- FUNÇÃO DE TABELA (AJUSTADA: SEM VALORES PARA RECORRENTES) ---
-        def criar_tabela(lista_nomes, dict_dados_principal, mostrar_valor=True):
-            linhas = []
+        def criar_tabela(mascara, periodo, mostrar_valor=True, mostrar_ultima=False):
+            canais = df_clientes[f'canais_{periodo}']
+            sel = df_clientes[mascara & ((canais & bits_filtro) != 0)]
             
-            for nome in lista_nomes:
-                dados = dict_dados_principal[nome]
-                
-                # Filtro de Canal
-                if not dados['canais'].intersection(set(filtro_canal)):
-                    continue
-
-                canais_str = ", ".join(list(dados['canais']))
-
-                item = {
-                    'Cliente': nome,
-                    'Canal': canais_str,
-                    'Pedidos (Frequência)': dados['pedidos']
-                }
-                
-                if mostrar_valor:
-                    item['Total Acumulado'] = dados['total']
-
-                linhas.append(item)
+            df = pd.DataFrame({
+                'Cliente': sel['nome'],
+                'Canal': sel[f'canais_{periodo}'].map(ClientesIndex.NOMES_MASCARA),
+                'Pedidos (Frequência)': sel[f'pedidos_{periodo}'],
+            })
+            if mostrar_valor:
+                df['Total Acumulado'] = sel[f'total_{periodo}']
+            if mostrar_ultima:
+                df['Última Compra'] = pd.to_datetime(sel['ultima_compra']).dt.strftime('%d/%m/%Y')
             
-            df = pd.DataFrame(linhas)
-            if not df.empty and mostrar_valor:
-                df = df.sort_values('Total Acumulado', ascending=False)
-            elif not df.empty:
-                df = df.sort_values('Pedidos (Frequência)', ascending=False)
-                
-            return df
+            coluna_ordem = 'Total Acumulado' if mostrar_valor else 'Pedidos (Frequência)'
+            return df.sort_values(coluna_ordem, ascending=False).reset_index(drop=True)
 
         # Gera as tabelas
         # Para perdidos e novos, mantemos o valor (para saber quem priorizar)
-        df_perdidos = criar_tabela(nomes_perdidos, dict_p1, mostrar_valor=True)
-        df_novos = criar_tabela(nomes_novos, dict_p2, mostrar_valor=True)
+        df_perdidos = criar_tabela(em_p1 & ~em_p2, 1, mostrar_valor=True, mostrar_ultima=True)
+        df_novos = criar_tabela(em_p2 & ~em_p1, 2, mostrar_valor=True)
         
         # Para recorrentes, REMOVEMOS o valor por enquanto, focando na fidelidade
-        df_recorrentes = criar_tabela(nomes_recorrentes, dict_p2, mostrar_valor=False)
+        df_recorrentes = criar_tabela(em_p1 & em_p2, 2, mostrar_valor=False)
 
         # ============================================================
         # VISUALIZAÇÃO DOS RESULTADOS
@@ -150,8 +117,8 @@ if btn_comparar:
         st.divider()
         
         # Cálculo da Taxa de Retenção
-        total_base_p1 = len(nomes_p1)
-        total_retidos = len(nomes_recorrentes)
+        total_base_p1 = int(em_p1.sum())
+        total_retidos = int((em_p1 & em_p2).sum())
         taxa_retencao = (total_retidos / total_base_p1 * 100) if total_base_p1 > 0 else 0
         
         col1, col2, col3, col4 = st.columns(4)
@@ -204,4 +171,43 @@ if btn_comparar:
                 st.info("Nenhum cliente recorrente encontrado.")
 
 elif not btn_comparar:
-    st.info("👈 Configure as datas e os canais na barra lateral e clique em 'Cruzar Dados'.")
\ No newline at end of file
+    st.info("👈 Configure as datas e os canais na barra lateral e clique em 'Cruzar Dados'.")
+
+# ============================================================
+# COORTES DE RETENÇÃO (direto do índice local, sem chamar a API)
+# ============================================================
+st.divider()
+st.subheader("📈 Coortes de Retenção")
+st.markdown("Cada linha é o mês em que o cliente comprou pela primeira vez; as colunas mostram quantos voltaram nos meses seguintes.")
+
+col_meses, col_metrica = st.columns([1, 2])
+qtd_meses = col_meses.slider("Meses analisados", min_value=6, max_value=36, value=12, step=1)
+metrica = col_metrica.radio("Métrica", ["Clientes (%)", "Receita (%)"], horizontal=True)
+
+mes_fim = pd.Timestamp(date.today()).to_period('M')
+mes_ini = mes_fim - (qtd_meses - 1)
+coortes = indice_clientes.matriz_coortes(str(mes_ini), str(mes_fim))
+
+if coortes['clientes'].empty:
+    st.info("Ainda não há vendas no índice local para o período. Use 'Cruzar Dados' para sincronizar.")
+else:
+    matriz = coortes['retencao'] if metrica == "Clientes (%)" else coortes['retencao_receita']
+    
+    fig_coortes = FigureCache.obter("detector_coortes", [matriz], {}, lambda: px.imshow(
+        matriz,
+        labels=dict(x="Meses após a primeira compra", y="Coorte", color="%"),
+        color_continuous_scale='Blues',
+        text_auto='.0f',
+        aspect="auto"
+    ))
+    st.plotly_chart(fig_coortes, use_container_width=True)
+    
+    with st.expander("Ver Números Detalhados"):
+        tabela = matriz.copy()
+        tabela.insert(0, 'Clientes Novos', coortes['clientes']['M+0'])
+        st.dataframe(
+            tabela.style.format("{:.1f}%", subset=list(matriz.columns), na_rep="").format({'Clientes Novos': '{:.0f}'}),
+            use_container_width=True
+        )
+        st.markdown("**Canal de aquisição (% da coorte)**")
+        st.dataframe(coortes['canais'].style.format("{:.1f}%"), use_container_width=True)
@@ -1,21 +1,25 @@
 import streamlit as st
 import pandas as pd
+import uuid
 from datetime import date
-from database import DatabaseManager
+from conexoes import BancoCompartilhado, FilaEscrita
+from financeiro_store import FinanceiroStore
+from importacao_lancamentos import ImportadorLancamentos, SITUACAO_NOVO, SITUACAO_DUPLICADO, SITUACAO_INVALIDO
 
 # Configuração
 st.set_page_config(page_title="Lançamentos Financeiros", layout="wide", page_icon="📝")
 st.title("📝 Central de Lançamentos")
 
 # Conexão
-db = DatabaseManager()
-db.inicializar_banco()
+db = BancoCompartilhado.obter()
+financeiro = FinanceiroStore(db)
 
 # Abas
-tab_lancamento, tab_cadastro, tab_extrato = st.tabs([
+tab_lancamento, tab_cadastro, tab_extrato, tab_importar = st.tabs([
     "💸 Novo Lançamento", 
     "👥 Cadastro de Parceiros", 
-    "📋 Extrato & Gestão"
+    "📋 Extrato & Gestão",
+    "📥 Importar Extrato"
 ])
 
 # ------------------------------------------------------------------------------
@@ -60,7 +64,13 @@ with tab_lancamento:
             status_db = "Pago" if "Pago" in status else "Pendente"
             tipo_db = "Saída" if "Saída" in tipo_mov else "Entrada"
             
-            if db.adicionar_lancamento(data_mov, valor, descricao, cat_codigo, cli_id, tipo_db, status_db):
+            # Mesma chave até gravar: reenvio do formulário não duplica o lançamento
+            token = st.session_state.setdefault('token_lancamento', uuid.uuid4().hex)
+            if FilaEscrita.escrever(
+                db, lambda: db.adicionar_lancamento(data_mov, valor, descricao, cat_codigo, cli_id, tipo_db, status_db),
+                chave=f"lancamento:{token}"
+            ):
+                del st.session_state['token_lancamento']
                 st.success("✅ Lançamento registrado!")
                 st.rerun()
             else:
@@ -110,7 +120,62 @@ with tab_cadastro:
 with tab_extrato:
     st.subheader("Gerenciar Lançamentos")
     
-    df = db.buscar_lancamentos()
+    # Filtros (aplicados no SQL)
+    f1, f2, f3, f4 = st.columns([2, 1, 1, 1])
+    with f1:
+        periodo = st.date_input("Período", value=(), format="DD/MM/YYYY", key="extrato_periodo")
+    with f2:
+        filtro_tipos = st.multiselect("Tipo", ["Entrada", "Saída"], key="extrato_tipos")
+    with f3:
+        filtro_status = st.multiselect("Status", ["Pago", "Pendente"], key="extrato_status")
+    with f4:
+        tamanho_pagina = st.selectbox("Por página", [25, 50, 100], index=1, key="extrato_tamanho")
+    # Sem a coluna no banco o filtro não teria efeito: fica desativado
+    colunas_livro = financeiro.colunas()
+    f5, f6 = st.columns(2)
+    with f5:
+        mapa_categorias = dict(zip(lista_categorias, df_cats['codigo']))
+        filtro_categorias = st.multiselect(
+            "Categoria", lista_categorias, key="extrato_categorias",
+            disabled=colunas_livro['categoria'] is None,
+            help=None if colunas_livro['categoria'] else "Coluna de categoria não encontrada na tabela de lançamentos."
+        )
+    with f6:
+        filtro_parceiros = st.multiselect(
+            "Parceiro", list(lista_clientes.keys()), key="extrato_parceiros",
+            disabled=colunas_livro['parceiro'] is None,
+            help=None if colunas_livro['parceiro'] else "Coluna de parceiro não encontrada na tabela de lançamentos."
+        )
+    
+    periodo = tuple(periodo) if isinstance(periodo, (list, tuple)) else (periodo,)
+    filtros = {
+        'data_ini': periodo[0] if len(periodo) > 0 else None,
+        'data_fim': periodo[1] if len(periodo) > 1 else (periodo[0] if periodo else None),
+        'tipos': filtro_tipos,
+        'status': filtro_status,
+        'categorias': [mapa_categorias[c] for c in filtro_categorias] if colunas_livro['categoria'] else [],
+        'parceiros': [lista_clientes[p] for p in filtro_parceiros] if colunas_livro['parceiro'] else [],
+    }
+    
+    # Paginação por chave: pilha de cursores, reiniciada quando os filtros mudam
+    chave_filtros = (repr(filtros), tamanho_pagina)
+    if st.session_state.get('extrato_filtros') != chave_filtros:
+        st.session_state['extrato_filtros'] = chave_filtros
+        st.session_state['extrato_cursores'] = [None]
+    cursores = st.session_state['extrato_cursores']
+    
+    totais = financeiro.totais_extrato(**filtros)
+    df, proximo = financeiro.pagina_extrato(tamanho_pagina, cursores[-1], **filtros)
+    if df.empty and len(cursores) > 1:
+        # A página ficou vazia (ex: exclusões): volta para a anterior
+        cursores.pop()
+        st.rerun()
+    
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Lançamentos", f"{totais['quantidade']:,}".replace(",", "."))
+    k2.metric("Entradas", f"R$ {totais['entradas']:,.2f}")
+    k3.metric("Saídas", f"R$ {totais['saidas']:,.2f}")
+    k4.metric("Saldo (Entradas - Saídas)", f"R$ {totais['saldo']:,.2f}", help=f"Pendente no filtro: R$ {totais['pendente']:,.2f}")
     
     if df is not None and not df.empty:
         # Cabeçalho da Tabela Manual
@@ -149,6 +214,80 @@ with tab_extrato:
                     st.error("Erro ao excluir.")
             
             st.markdown("<hr style='margin: 5px 0'>", unsafe_allow_html=True)
+        
+        # Navegação
+        n1, n2, n3 = st.columns([1, 2, 1])
+        if n1.button("⬅️ Anterior", disabled=len(cursores) == 1, use_container_width=True):
+            cursores.pop()
+            st.rerun()
+        total_paginas = max(1, -(-totais['quantidade'] // tamanho_pagina))
+        n2.markdown(f"<div style='text-align: center'>Página {len(cursores)} de {total_paginas}</div>", unsafe_allow_html=True)
+        if n3.button("Próxima ➡️", disabled=proximo is None, use_container_width=True):
+            cursores.append(proximo)
+            st.rerun()
             
     else:
-        st.info("Nenhum lançamento para exibir.")
\ No newline at end of file
+        st.info("Nenhum lançamento para exibir.")
+
+# ------------------------------------------------------------------------------
+# ABA 4: IMPORTAÇÃO EM LOTE (CSV / OFX / XLSX)
+# ------------------------------------------------------------------------------
+with tab_importar:
+    st.subheader("Importar Extrato Bancário ou Planilha")
+    st.caption("Colunas reconhecidas: Data, Valor, Descrição/Histórico e, opcionalmente, Tipo (C/D), Categoria, Parceiro e Status. "
+               "Valores negativos sem coluna de tipo viram Saída.")
+    
+    arquivo = st.file_uploader("Arquivo", type=list(ImportadorLancamentos.TIPOS_ARQUIVO), key="importar_arquivo")
+    i1, i2, i3 = st.columns(3)
+    with i1:
+        cat_entrada = st.selectbox("Categoria padrão (Entradas)", lista_categorias, key="importar_cat_entrada")
+    with i2:
+        cat_saida = st.selectbox("Categoria padrão (Saídas)", lista_categorias, key="importar_cat_saida")
+    with i3:
+        status_padrao = st.selectbox("Status padrão", ["Pago", "Pendente"], key="importar_status")
+    st.caption("A categoria padrão só é usada quando o arquivo não traz categoria e não há lançamento anterior com a mesma descrição.")
+    
+    importador = ImportadorLancamentos(db)
+    
+    if arquivo is not None and st.button("🔍 Pré-visualizar", type="secondary"):
+        try:
+            st.session_state['importacao_previa'] = importador.preparar(
+                arquivo, arquivo.name, status_padrao,
+                categoria_entrada=cat_entrada.split(" - ")[0] if cat_entrada else None,
+                categoria_saida=cat_saida.split(" - ")[0] if cat_saida else None,
+            )
+            st.session_state['importacao_arquivo'] = arquivo.name
+        except ValueError as e:
+            st.error(f"Não foi possível importar o arquivo: {e}")
+    
+    previa = st.session_state.get('importacao_previa')
+    if previa is not None and arquivo is not None and st.session_state.get('importacao_arquivo') == arquivo.name:
+        contagem = previa['situacao'].value_counts()
+        p1, p2, p3 = st.columns(3)
+        p1.metric("Novos", int(contagem.get(SITUACAO_NOVO, 0)))
+        p2.metric("Já lançados (ignorados)", int(contagem.get(SITUACAO_DUPLICADO, 0)))
+        p3.metric("Inválidos (sem data/valor)", int(contagem.get(SITUACAO_INVALIDO, 0)))
+        
+        nomes_categorias = dict(zip(df_cats['codigo'], df_cats['descricao']))
+        df_show = previa.assign(categoria=previa['categoria'].map(nomes_categorias).fillna(previa['categoria']))
+        st.dataframe(
+            df_show[['situacao', 'data', 'tipo_movimento', 'valor', 'descricao', 'categoria', 'parceiro_nome', 'status']],
+            column_config={
+                "situacao": "Situação",
+                "data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                "tipo_movimento": "Tipo",
+                "valor": st.column_config.NumberColumn("Valor", format="R$ %.2f"),
+                "descricao": "Descrição",
+                "categoria": "Categoria",
+                "parceiro_nome": "Parceiro",
+                "status": "Status",
+            },
+            use_container_width=True, hide_index=True, height=400
+        )
+        
+        novos = int(contagem.get(SITUACAO_NOVO, 0))
+        if st.button(f"💾 Importar {novos} lançamentos", type="primary", disabled=novos == 0):
+            inseridos = importador.gravar(previa)
+            del st.session_state['importacao_previa']
+            st.success(f"✅ {inseridos} lançamentos importados!")
+            st.rerun()
@@ -0,0 +1,81 @@
+"""
+Utilitários de Desempenho - Dashboard Comercial Tiny ERP
+Cache de resultados por chave e medição de tempo por seção da página
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Cache LRU process-wide de resultados calculados.
+
+    A chave deve conter tudo de que o resultado depende (ex: chave do
+    dataset, versão da blacklist, filtros). Diferente do `st.cache_data`,
+    os valores não são serializados nem copiados a cada leitura.
+    """
+
+    MAX_ITENS = 128
+
+    _lock = threading.Lock()
+    _itens: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    @classmethod
+    def obter(cls, chave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """
+        Retorna o valor em cache para a chave ou calcula e guarda.
+
+        Args:
+            chave: Tupla com as entradas do cálculo
+            calcular: Função sem argumentos que produz o valor
+
+        Returns:
+            Valor calculado (compartilhado: não deve ser alterado)
+        """
+        with cls._lock:
+            if chave in cls._itens:
+                cls._itens.move_to_end(chave)
+                return cls._itens[chave]
+
+        valor = calcular()
+
+        with cls._lock:
+            cls._itens[chave] = valor
+            cls._itens.move_to_end(chave)
+            while len(cls._itens) > cls.MAX_ITENS:
+                cls._itens.popitem(last=False)
+        return valor
+
+    @classmethod
+    def limpar(cls) -> None:
+        with cls._lock:
+            cls._itens.clear()
+
+
+class SectionTimer:
+    """Mede o tempo de execução de cada seção de uma página."""
+
+    @staticmethod
+    @contextmanager
+    def medir(nome: str, registro: Dict[str, float]):
+        """
+        Mede o bloco e grava o tempo (ms) em `registro[nome]`.
+
+        Exemplo:
+            >>> tempos = {}
+            >>> with SectionTimer.medir("Mapa", tempos):
+            ...     pass
+        """
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            registro[nome] = (time.perf_counter() - inicio) * 1000
+            logger.debug(f"Seção '{nome}' executada em {registro[nome]:.1f} ms")
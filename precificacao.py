@@ -0,0 +1,232 @@
+"""
+Motor de Precificação - Plante Forte
+Preço de venda de todo o catálogo em todos os canais, calculado em lote com NumPy
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TAMANHOS_SACO = [5, 10, 20]
+
+# Parâmetros padrão de cada canal (mesmos valores iniciais do simulador)
+# taxas: soma dos percentuais que incidem sobre o preço, exceto a margem
+# fixo / fixo_acima: valor somado ao custo abaixo / a partir do limiar de preço
+CANAIS_PADRAO: Dict[str, Dict[str, float]] = {
+    "Mercado Livre": {"margem": 30.0, "taxas": 16.5 + 5.2 + 3.5, "fixo": 6.00, "fixo_acima": 22.45, "limiar": 79.00},
+    "Shopee": {"margem": 21.0, "taxas": 20.0 + 6.0 + 3.5, "fixo": 4.00, "fixo_acima": 4.00, "limiar": np.inf},
+    "Site": {"margem": 20.0, "taxas": 5.7 + 2.0 + 12.0, "fixo": 80.00, "fixo_acima": 80.00, "limiar": np.inf},
+    "Venda Direta FOB": {"margem": 30.0, "taxas": 5.7 + 10.0 + 5.0, "fixo": 0.0, "fixo_acima": 0.0, "limiar": np.inf},
+    "Venda Direta CIF": {"margem": 30.0, "taxas": 5.7 + 10.0 + 5.0, "fixo": 50.00, "fixo_acima": 50.00, "limiar": np.inf},
+}
+
+# Componentes percentuais que somam nas taxas do canal
+COMPONENTES_TAXAS = ('comissao', 'imposto', 'antecipacao', 'outras')
+
+# Parâmetros que podem virar eixo de uma grade de sensibilidade -> (rótulo, faixa padrão)
+EIXOS_SENSIBILIDADE: Dict[str, Tuple[str, Tuple[float, float]]] = {
+    'margem': ("Margem (%)", (0.0, 60.0)),
+    'comissao': ("Comissão (%)", (0.0, 30.0)),
+    'imposto': ("Imposto (%)", (0.0, 20.0)),
+    'antecipacao': ("Antecipação (%)", (0.0, 10.0)),
+    'frete': ("Frete (R$)", (0.0, 150.0)),
+    'tamanho': ("Tamanho do Saco (kg)", (1.0, 50.0)),
+    'custo': ("Custo Base (R$)", (0.0, 200.0)),
+}
+
+
+class MotorPrecos:
+    """
+    Fórmulas de preço dos canais em forma vetorizada.
+
+    Todos os canais seguem PV = (Custo + Fixo) / (1 - (Taxas + Margem) / 100).
+    O Mercado Livre é por partes: calcula-se primeiro com a taxa fixa (R$ 6);
+    se esse preço chega ao limiar (R$ 79), o frete (S4) substitui a taxa fixa.
+    Nos demais canais o limiar é infinito e `fixo_acima` nunca é usado.
+
+    Os argumentos aceitam escalares ou arrays e seguem o broadcasting do
+    NumPy, então a mesma função preenche um card, o catálogo inteiro
+    (produto x canal x margem) ou uma grade de sensibilidade.
+    """
+
+    # ------------------------------------------------------------
+    # FÓRMULA
+    # ------------------------------------------------------------
+    @staticmethod
+    def divisor(taxas: Any, margem: Any) -> np.ndarray:
+        """1 - (taxas + margem) / 100; preço só existe onde é positivo."""
+        return 1 - (np.asarray(taxas, dtype=float) + np.asarray(margem, dtype=float)) / 100
+
+    @classmethod
+    def preco(cls, custo: Any, taxas: Any, margem: Any, fixo: Any,
+              fixo_acima: Any = 0.0, limiar: Any = np.inf) -> np.ndarray:
+        """
+        Preço de venda com a regra por partes.
+
+        Args:
+            custo: Custo base do produto (B4/C4), em R$
+            taxas: Soma dos percentuais do canal (comissão, imposto, antecipação...)
+            margem: Margem desejada, em %
+            fixo: Valor fixo somado ao custo abaixo do limiar (R$)
+            fixo_acima: Valor fixo a partir do limiar (R$)
+            limiar: Preço a partir do qual vale `fixo_acima`
+
+        Returns:
+            Array de preços (NaN onde taxas + margem >= 100%)
+        """
+        div = cls.divisor(taxas, margem)
+        div = np.where(div > 0, div, np.nan)
+        custo = np.asarray(custo, dtype=float)
+        preco_base = (custo + fixo) / div
+        return np.where(preco_base >= limiar, (custo + fixo_acima) / div, preco_base)
+
+    @classmethod
+    def acima_limiar(cls, custo: Any, taxas: Any, margem: Any, fixo: Any, limiar: Any = np.inf) -> np.ndarray:
+        """Onde o preço calculado com a taxa fixa atinge o limiar (ML: usa o frete)."""
+        with np.errstate(invalid='ignore'):
+            return cls.preco(custo, taxas, margem, fixo) >= limiar
+
+    @staticmethod
+    def parametros(componentes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Converte os campos de um card (comissão, imposto, taxa fixa, frete...)
+        nos argumentos de `preco` (taxas, fixo, fixo_acima, limiar).
+
+        Sem limiar, taxa fixa e frete entram sempre. Com limiar (ML), abaixo
+        dele vale só a taxa fixa e a partir dele só o frete. Os valores
+        podem ser arrays.
+        """
+        limiar = componentes.get('limiar', np.inf)
+        taxa_fixa = componentes.get('taxa_fixa', 0.0)
+        frete = componentes.get('frete', 0.0)
+        return {
+            'taxas': sum(componentes.get(c, 0.0) for c in COMPONENTES_TAXAS),
+            'fixo': taxa_fixa if np.isfinite(limiar) else np.add(taxa_fixa, frete),
+            'fixo_acima': frete,
+            'limiar': limiar,
+        }
+
+    # ------------------------------------------------------------
+    # SENSIBILIDADE
+    # ------------------------------------------------------------
+    @classmethod
+    def grade(cls, componentes: Dict[str, Any], eixo_x: str, valores_x: Any,
+              eixo_y: str, valores_y: Any) -> np.ndarray:
+        """
+        Preço do canal sobre uma grade 2-D de dois parâmetros.
+
+        Args:
+            componentes: Campos do card mais a base de custo: 'custo' ou
+                'custo_kg', 'tamanho', 'embalagem' e 'outros' (lote de fábrica)
+            eixo_x / eixo_y: Chaves de EIXOS_SENSIBILIDADE
+            valores_x / valores_y: Valores de cada eixo
+
+        Returns:
+            Array (len(valores_y), len(valores_x)); NaN onde taxas + margem >= 100%
+        """
+        comp = dict(componentes)
+        comp[eixo_x] = np.asarray(valores_x, dtype=float)[None, :]
+        comp[eixo_y] = np.asarray(valores_y, dtype=float)[:, None]
+        if 'custo_kg' in comp and eixo_x != 'custo' and eixo_y != 'custo':
+            custo = comp['custo_kg'] * comp.get('tamanho', 1.0) + comp.get('embalagem', 0.0) + comp.get('outros', 0.0)
+        else:
+            custo = comp.get('custo', 0.0)
+        p = cls.parametros(comp)
+        precos = cls.preco(custo, p['taxas'], comp.get('margem', 0.0), p['fixo'], p['fixo_acima'], p['limiar'])
+        return np.broadcast_to(precos, (len(valores_y), len(valores_x)))
+
+    # ------------------------------------------------------------
+    # CATÁLOGO
+    # ------------------------------------------------------------
+    @staticmethod
+    def custos_catalogo(df_padrao: Optional[pd.DataFrame], df_lotes: Optional[pd.DataFrame],
+                        custos_saco: Optional[Dict[int, float]] = None, outros: float = 0.20,
+                        tamanhos: Iterable[int] = TAMANHOS_SACO) -> pd.DataFrame:
+        """
+        Custo base de todo o catálogo: produtos da tabela padrão e lotes
+        produzidos em cada embalagem (custo/kg x tamanho + saco + outros).
+
+        Args:
+            custos_saco: Tamanho (kg) -> custo da embalagem (ver CadastroCache.custo_saco)
+
+        Returns:
+            DataFrame com Origem, Codigo, Produto e Custo
+        """
+        partes = []
+        if df_padrao is not None and not df_padrao.empty:
+            partes.append(pd.DataFrame({
+                'Origem': "Tabela Padrão",
+                'Codigo': df_padrao['sku'].astype(str),
+                'Produto': df_padrao['nome'].astype(str) + " - " + df_padrao['descricao'].astype(str),
+                'Custo': pd.to_numeric(df_padrao['custo_padrao'], errors='coerce').fillna(0.0),
+            }))
+        if df_lotes is not None and not df_lotes.empty:
+            custo_kg = pd.to_numeric(df_lotes['custo_kg_final'], errors='coerce').fillna(0.0)
+            for tamanho in tamanhos:
+                partes.append(pd.DataFrame({
+                    'Origem': "Lote Produzido",
+                    'Codigo': df_lotes['codigo_lote'].astype(str),
+                    'Produto': df_lotes['produto_nome'].astype(str) + f" - {tamanho}kg",
+                    'Custo': custo_kg * tamanho + (custos_saco or {}).get(tamanho, 0.0) + outros,
+                }))
+        if not partes:
+            return pd.DataFrame(columns=['Origem', 'Codigo', 'Produto', 'Custo'])
+        return pd.concat(partes, ignore_index=True)
+
+    @classmethod
+    def matriz(cls, custos: Any, canais: Dict[str, Dict[str, float]], margens: Any) -> np.ndarray:
+        """
+        Preços de N produtos x C canais x M margens numa única passada.
+
+        Args:
+            custos: Array (N,) de custos base
+            canais: Nome -> parâmetros (taxas, fixo, fixo_acima, limiar), como em CANAIS_PADRAO
+            margens: Array (M,) de margens em %
+
+        Returns:
+            Array (N, C, M), canais na ordem do dicionário
+        """
+        params = list(canais.values())
+
+        def coluna(valores: List[float]) -> np.ndarray:
+            return np.array(valores, dtype=float)[None, :, None]
+
+        return cls.preco(
+            np.asarray(custos, dtype=float)[:, None, None],
+            coluna([p.get('taxas', 0.0) for p in params]),
+            np.asarray(margens, dtype=float)[None, None, :],
+            coluna([p.get('fixo', 0.0) for p in params]),
+            coluna([p.get('fixo_acima', p.get('fixo', 0.0)) for p in params]),
+            coluna([p.get('limiar', np.inf) for p in params]),
+        )
+
+    @classmethod
+    def tabela_precos(cls, catalogo: pd.DataFrame, canais: Dict[str, Dict[str, float]],
+                      margens: Iterable[float]) -> pd.DataFrame:
+        """
+        Tabela de preços exportável: uma linha por produto e margem, uma coluna por canal.
+
+        Args:
+            catalogo: Retorno de `custos_catalogo`
+            canais: Parâmetros dos canais
+            margens: Margens da varredura, em %
+
+        Returns:
+            DataFrame com Origem, Codigo, Produto, Custo, Margem (%) e o preço por canal
+        """
+        margens = np.asarray(list(margens), dtype=float)
+        nomes: List[str] = list(canais)
+        if catalogo.empty or not len(margens) or not nomes:
+            return pd.DataFrame(columns=['Origem', 'Codigo', 'Produto', 'Custo', 'Margem (%)'] + nomes)
+
+        precos = cls.matriz(catalogo['Custo'].to_numpy(), canais, margens)
+        n, c, m = precos.shape
+        # (N, C, M) -> (N * M, C): cada produto repetido para cada margem
+        tabela = catalogo.loc[np.repeat(np.arange(n), m)].reset_index(drop=True)
+        tabela['Margem (%)'] = np.tile(margens, n)
+        valores = precos.transpose(0, 2, 1).reshape(n * m, c)
+        return pd.concat([tabela, pd.DataFrame(np.round(valores, 2), columns=nomes)], axis=1)
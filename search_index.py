@@ -0,0 +1,166 @@
+"""
+Índice de Busca - Dashboard Comercial Tiny ERP
+Índice de tokens/prefixos para busca textual rápida na lista de vendas
+"""
+
+import re
+import threading
+import logging
+from collections import OrderedDict
+from typing import Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import TextUtils
+
+logger = logging.getLogger(__name__)
+
+_SEPARADORES = re.compile(r"[^0-9A-Z]+")
+
+
+class VendasSearchIndex:
+    """
+    Índice invertido (token -> linhas) sobre colunas de texto de um DataFrame.
+
+    Os tokens ficam ordenados e as listas de linhas são armazenadas de forma
+    contígua (formato CSR), então todos os tokens com um mesmo prefixo ocupam
+    um único intervalo do array: a busca por prefixo é um `searchsorted`
+    seguido de uma fatia, sem varrer o DataFrame.
+
+    As posições retornadas são posicionais (iloc) no DataFrame indexado e já
+    vêm ordenadas pela coluna de ordenação (mais recente primeiro).
+    """
+
+    def __init__(self, df: pd.DataFrame, colunas: Iterable[str] = ('Cliente', 'Cidade_Original'),
+                 coluna_ordem: str = 'Data_Obj'):
+        self.total = len(df)
+
+        # Rank de cada linha na ordenação (0 = mais recente)
+        if coluna_ordem in df.columns and self.total:
+            chaves = df[coluna_ordem].values.astype('datetime64[ns]').astype(np.int64)
+            # Datas inválidas (NaT) vão para o fim da lista
+            chaves[chaves == np.iinfo(np.int64).min] = np.iinfo(np.int64).min + 1
+            ordem = np.argsort(-chaves, kind='stable')
+        else:
+            ordem = np.arange(self.total)
+        self.ordem = ordem
+        self.rank = np.empty(self.total, dtype=np.int64)
+        self.rank[ordem] = np.arange(self.total)
+
+        tokens_linhas = {}
+        for coluna in colunas:
+            if coluna not in df.columns:
+                continue
+            # Normaliza cada valor distinto uma única vez
+            valores = df[coluna].fillna('').astype(str)
+            codigos, distintos = pd.factorize(valores)
+            tokens_por_codigo = [self.tokenizar(v) for v in distintos]
+            for pos, codigo in enumerate(codigos):
+                if codigo < 0:
+                    continue
+                for token in tokens_por_codigo[codigo]:
+                    tokens_linhas.setdefault(token, []).append(pos)
+
+        self.tokens = np.array(sorted(tokens_linhas), dtype=str)
+        offsets = [0]
+        linhas = []
+        for token in self.tokens:
+            # Guarda as linhas de cada token já na ordem de rank
+            ranks = np.unique(self.rank[np.array(tokens_linhas[token], dtype=np.int64)])
+            linhas.append(ranks)
+            offsets.append(offsets[-1] + len(ranks))
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.postings = np.concatenate(linhas) if linhas else np.array([], dtype=np.int64)
+
+        logger.info(f"Índice de busca criado: {self.total} linhas, {len(self.tokens)} tokens")
+
+    @staticmethod
+    def tokenizar(texto: str) -> List[str]:
+        """
+        Quebra o texto em tokens normalizados (sem acento, maiúsculos).
+
+        Exemplo:
+            >>> VendasSearchIndex.tokenizar("São José do Rio Preto")
+            ['SAO', 'JOSE', 'DO', 'RIO', 'PRETO']
+        """
+        return [t for t in _SEPARADORES.split(TextUtils.remover_acentos(texto)) if t]
+
+    def _ranks_prefixo(self, prefixo: str) -> np.ndarray:
+        """Ranks (ordenados) de todas as linhas com algum token iniciando em `prefixo`."""
+        ini = np.searchsorted(self.tokens, prefixo, side='left')
+        fim = np.searchsorted(self.tokens, prefixo + '\uffff', side='left')
+        if ini >= fim:
+            return np.array([], dtype=np.int64)
+        fatia = self.postings[self.offsets[ini]:self.offsets[fim]]
+        if fim - ini == 1:
+            return fatia
+        return np.unique(fatia)
+
+    def buscar(self, termo: str, visiveis: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Busca linhas cujo texto contém palavras iniciadas por cada termo digitado.
+
+        Args:
+            termo: Texto digitado (vários termos = todos devem casar)
+            visiveis: Máscara booleana posicional das linhas visíveis (opcional)
+
+        Returns:
+            Ranks das linhas encontradas, em ordem (mais recente primeiro)
+        """
+        termos = self.tokenizar(termo or '')
+        if not termos:
+            ranks = np.arange(self.total, dtype=np.int64)
+        else:
+            ranks = None
+            for t in termos:
+                encontrados = self._ranks_prefixo(t)
+                ranks = encontrados if ranks is None else np.intersect1d(ranks, encontrados, assume_unique=True)
+                if len(ranks) == 0:
+                    break
+
+        if visiveis is not None and len(ranks):
+            ranks = ranks[visiveis[self.ordem[ranks]]]
+        return ranks
+
+    def pagina(self, ranks: np.ndarray, cursor: int = -1, tamanho: int = 20) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Paginação por cursor sobre o resultado de `buscar`.
+
+        Args:
+            ranks: Resultado de `buscar`
+            cursor: Rank do último item da página anterior (-1 = início)
+            tamanho: Itens por página
+
+        Returns:
+            (posições iloc da página, cursor da próxima página ou None)
+        """
+        ini = np.searchsorted(ranks, cursor, side='right')
+        fatia = ranks[ini:ini + tamanho]
+        proximo = int(fatia[-1]) if ini + tamanho < len(ranks) and len(fatia) else None
+        return self.ordem[fatia], proximo
+
+
+class SearchIndexCache:
+    """Cache process-wide de índices por chave de dataset (LRU pequeno)."""
+
+    MAX_INDICES = 8
+
+    _lock = threading.Lock()
+    _indices: "OrderedDict[Hashable, VendasSearchIndex]" = OrderedDict()
+
+    @classmethod
+    def obter(cls, chave_dataset: Hashable, df: pd.DataFrame) -> VendasSearchIndex:
+        with cls._lock:
+            indice = cls._indices.get(chave_dataset)
+            if indice is not None:
+                cls._indices.move_to_end(chave_dataset)
+                return indice
+
+        indice = VendasSearchIndex(df)
+
+        with cls._lock:
+            cls._indices[chave_dataset] = indice
+            while len(cls._indices) > cls.MAX_INDICES:
+                cls._indices.popitem(last=False)
+        return indice
@@ -82,6 +82,9 @@ class DataUtils:
         try:
             if valor_str is None or valor_str == "":
                 return 0.0
+            if isinstance(valor_str, str):
+                # O Tiny às vezes manda vírgula decimal (padrão BR)
+                valor_str = valor_str.strip().replace(',', '.')
             return float(valor_str)
         except (ValueError, TypeError) as e:
             logger.warning(f"Valor inválido para conversão: '{valor_str}' - {e}")
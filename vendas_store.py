@@ -0,0 +1,492 @@
+"""
+Espelho Local de Vendas - Dashboard Comercial Tiny ERP
+Guarda as notas do Tiny no SQLite e mantém rollups diários por canal
+"""
+
+import time
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from data_processor import DataProcessor
+from clientes_index import ClientesIndex
+from utils import DataUtils
+
+logger = logging.getLogger(__name__)
+
+CANAIS = ["Shopee", "Mercado Livre", "Site", "Venda Direta"]
+
+
+class VendasStore:
+    """
+    Espelho local das notas fiscais do Tiny.
+
+    - `vendas_notas`: uma linha por nota (data ISO, cliente, canal, valor, assinatura)
+    - `vendas_rollup_dia`: total e quantidade por (dia, canal), sem as notas da blacklist
+    - `vendas_rollup_mes`: total e quantidade por (ano, mês, canal), só notas com valor > 0;
+      meses fechados ficam congelados
+    - `clientes_dia` / `clientes_atividade`: índice por cliente (ver ClientesIndex)
+    - `vendas_sync`: controle de sincronização (intervalo já espelhado, última atualização de hoje)
+
+    Dias fechados (até ontem) são baixados uma única vez. Só o dia de hoje é
+    atualizado com frequência. Os totais de qualquer período saem do rollup
+    (no máximo 366 x 4 linhas por ano), sem chamar a API.
+    """
+
+    INTERVALO_HOJE = 60  # segundos entre atualizações do dia corrente
+
+    _lock = threading.Lock()
+    _tabelas_criadas = False
+    _versao_blacklist_aplicada = None
+
+    def __init__(self, db: Any):
+        self.db = db
+        self.criar_tabelas()
+
+    # ------------------------------------------------------------
+    # ESQUEMA
+    # ------------------------------------------------------------
+    def criar_tabelas(self) -> None:
+        if VendasStore._tabelas_criadas:
+            return
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS vendas_notas (
+                        id_nota TEXT PRIMARY KEY,
+                        numero TEXT,
+                        data TEXT NOT NULL,
+                        cliente TEXT,
+                        cidade TEXT,
+                        uf TEXT,
+                        canal TEXT NOT NULL,
+                        valor REAL NOT NULL DEFAULT 0,
+                        assinatura TEXT,
+                        excluida INTEGER NOT NULL DEFAULT 0
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_vendas_notas_data ON vendas_notas(data);
+                    CREATE INDEX IF NOT EXISTS idx_vendas_notas_assinatura ON vendas_notas(assinatura);
+
+                    CREATE TABLE IF NOT EXISTS vendas_rollup_dia (
+                        data TEXT NOT NULL,
+                        canal TEXT NOT NULL,
+                        total REAL NOT NULL DEFAULT 0,
+                        qtd INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (data, canal)
+                    );
+
+                    CREATE TABLE IF NOT EXISTS vendas_rollup_mes (
+                        ano INTEGER NOT NULL,
+                        mes INTEGER NOT NULL,
+                        canal TEXT NOT NULL,
+                        total REAL NOT NULL DEFAULT 0,
+                        qtd INTEGER NOT NULL DEFAULT 0,
+                        fechado INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (ano, mes, canal)
+                    );
+
+                    CREATE TABLE IF NOT EXISTS vendas_sync (
+                        chave TEXT PRIMARY KEY,
+                        valor TEXT
+                    );
+                """)
+                # Rollups mensais gravados antes do filtro valor > 0 contavam notas zeradas
+                refazer_mensal = self._ler_sync(conn, "rollup_mes_valor_positivo") is None
+                if refazer_mensal:
+                    conn.execute("DELETE FROM vendas_rollup_mes")
+                    self._gravar_sync(conn, "rollup_mes_valor_positivo", "1")
+                reconstruir_clientes = ClientesIndex.criar_tabelas(conn)
+            VendasStore._tabelas_criadas = True
+        finally:
+            conn.close()
+        if reconstruir_clientes:
+            ClientesIndex(self.db).reconstruir()
+        if refazer_mensal:
+            self.atualizar_rollup_mensal()
+
+    # ------------------------------------------------------------
+    # CONVERSÃO
+    # ------------------------------------------------------------
+    @staticmethod
+    def converter_nota(v_wrap: Dict[str, Any]) -> Optional[Tuple]:
+        """
+        Converte uma nota da API em uma linha de `vendas_notas`.
+
+        Returns:
+            Tupla (id_nota, numero, data, cliente, cidade, uf, canal, valor, assinatura, cliente_chave)
+            ou None se a nota não tiver data válida.
+        """
+        v = v_wrap.get('nota_fiscal', v_wrap)
+        data_str = v.get('data_emissao', '')
+        try:
+            data_iso = datetime.strptime(data_str, '%d/%m/%Y').date().isoformat()
+        except (ValueError, TypeError):
+            try:
+                data_iso = datetime.strptime(data_str, '%Y-%m-%d').date().isoformat()
+            except (ValueError, TypeError):
+                return None
+
+        raw_valor = v.get('valor_nota') or v.get('valor') or v.get('valor_total')
+        valor = DataUtils.converter_valor(raw_valor)
+        assinatura = DataProcessor.gerar_assinatura_venda(v, valor)
+        cliente_node = v.get('cliente', {}) or {}
+
+        id_nota = v.get('id') or f"{v.get('numero', '')}-{assinatura}"
+        cliente = v.get('nome') or cliente_node.get('nome')
+        return (
+            str(id_nota),
+            str(v.get('numero', '') or ''),
+            data_iso,
+            cliente,
+            cliente_node.get('cidade') or v.get('nome_municipio', ''),
+            cliente_node.get('uf') or v.get('uf', ''),
+            DataProcessor.identificar_canal_pedido(v),
+            valor,
+            assinatura,
+            ClientesIndex.normalizar(cliente),
+        )
+
+    # ------------------------------------------------------------
+    # SINCRONIZAÇÃO
+    # ------------------------------------------------------------
+    def _ler_sync(self, conn, chave: str) -> Optional[str]:
+        row = conn.execute("SELECT valor FROM vendas_sync WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else None
+
+    def _gravar_sync(self, conn, chave: str, valor: str) -> None:
+        conn.execute(
+            "INSERT INTO vendas_sync (chave, valor) VALUES (?, ?) "
+            "ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor",
+            (chave, valor)
+        )
+
+    def gravar_periodo(self, vendas: Iterable[Dict[str, Any]], data_ini: date, data_fim: date,
+                       blacklist: Iterable[str] = ()) -> int:
+        """
+        Substitui as notas de [data_ini, data_fim] e recalcula o rollup só desses dias.
+
+        Args:
+            vendas: Lista de notas da API para o período
+            data_ini: Primeiro dia do período
+            data_fim: Último dia do período
+            blacklist: Assinaturas excluídas (entram marcadas como excluídas)
+
+        Returns:
+            Quantidade de notas gravadas
+        """
+        ini, fim = data_ini.isoformat(), data_fim.isoformat()
+        excluidas = set(blacklist)
+        linhas = []
+        for v in vendas or []:
+            linha = self.converter_nota(v)
+            if linha and ini <= linha[2] <= fim:
+                linhas.append(linha + (1 if linha[8] in excluidas else 0,))
+
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM vendas_notas WHERE data BETWEEN ? AND ?", (ini, fim))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO vendas_notas "
+                    "(id_nota, numero, data, cliente, cidade, uf, canal, valor, assinatura, cliente_chave, excluida) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    linhas
+                )
+                conn.execute("DELETE FROM vendas_rollup_dia WHERE data BETWEEN ? AND ?", (ini, fim))
+                conn.execute(
+                    "INSERT INTO vendas_rollup_dia (data, canal, total, qtd) "
+                    "SELECT data, canal, SUM(valor), COUNT(*) FROM vendas_notas "
+                    "WHERE data BETWEEN ? AND ? AND excluida = 0 GROUP BY data, canal",
+                    (ini, fim)
+                )
+                self._descongelar_meses(conn, ini, fim)
+                ClientesIndex.atualizar_periodo(conn, ini, fim)
+        finally:
+            conn.close()
+        logger.info(f"Espelho de vendas: {len(linhas)} notas gravadas para {ini} a {fim}")
+        return len(linhas)
+
+    def sincronizar(self, client: Any, data_ini: date, blacklist: Iterable[str] = (),
+                    hoje: Optional[date] = None) -> None:
+        """
+        Garante que o espelho cobre [data_ini, hoje].
+
+        Dias fechados que ainda não estão no espelho são baixados uma vez
+        (em blocos mensais); o dia de hoje é rebaixado no máximo a cada
+        INTERVALO_HOJE segundos.
+
+        A busca é estrita: se um bloco falha, nada dele é gravado, a cobertura
+        para no último bloco completo e o erro (TinyAPIError) sobe para a
+        página. O bloco que falhou é baixado de novo na próxima sincronização.
+
+        Args:
+            client: TinyAPIClient
+            data_ini: Data mais antiga que precisa estar disponível
+            blacklist: Assinaturas excluídas no Dashboard
+            hoje: Data de referência (padrão: hoje)
+        """
+        hoje = hoje or date.today()
+        ontem = hoje - timedelta(days=1)
+        blacklist = frozenset(blacklist)
+
+        with VendasStore._lock:
+            conn = self.db._get_connection()
+            try:
+                desde = self._ler_sync(conn, 'fechado_desde')
+                ate = self._ler_sync(conn, 'fechado_ate')
+                ultima_hoje = self._ler_sync(conn, 'hoje_atualizado_em')
+            finally:
+                conn.close()
+
+            desde = date.fromisoformat(desde) if desde else None
+            ate = date.fromisoformat(ate) if ate else None
+
+            # 1. Dias fechados faltantes (antes do início e depois do fim já espelhados).
+            # Cada lacuna é percorrida a partir da borda do trecho espelhado, para que
+            # [fechado_desde, fechado_ate] continue contíguo se um bloco falhar no meio.
+            lacunas = []
+            if desde is None or ate is None:
+                if data_ini <= ontem:
+                    lacunas.append((data_ini, ontem, False))
+            else:
+                if data_ini < desde:
+                    lacunas.append((data_ini, desde - timedelta(days=1), True))
+                if ate < ontem:
+                    lacunas.append((ate + timedelta(days=1), ontem, False))
+
+            gravou = False
+            try:
+                for ini, fim, do_fim in lacunas:
+                    blocos = self._blocos_mensais(ini, fim)
+                    for bloco_ini, bloco_fim in (reversed(blocos) if do_fim else blocos):
+                        vendas = client.buscar_vendas(bloco_ini, bloco_fim, estrito=True)
+                        self.gravar_periodo(vendas, bloco_ini, bloco_fim, blacklist)
+                        gravou = True
+                        conn = self.db._get_connection()
+                        try:
+                            with conn:
+                                novo_desde = min(desde or bloco_ini, bloco_ini)
+                                novo_ate = max(ate or bloco_fim, bloco_fim)
+                                self._gravar_sync(conn, 'fechado_desde', novo_desde.isoformat())
+                                self._gravar_sync(conn, 'fechado_ate', novo_ate.isoformat())
+                                desde, ate = novo_desde, novo_ate
+                        finally:
+                            conn.close()
+
+                # 2. Dia corrente (único trecho atualizado com frequência)
+                chave_hoje = f"{hoje.isoformat()}@"
+                precisa_hoje = (
+                    ultima_hoje is None
+                    or not ultima_hoje.startswith(chave_hoje)
+                    or time.time() - float(ultima_hoje[len(chave_hoje):]) > self.INTERVALO_HOJE
+                )
+                if precisa_hoje:
+                    vendas = client.buscar_vendas(hoje, hoje, estrito=True)
+                    self.gravar_periodo(vendas, hoje, hoje, blacklist)
+                    gravou = True
+                    conn = self.db._get_connection()
+                    try:
+                        with conn:
+                            self._gravar_sync(conn, 'hoje_atualizado_em', f"{chave_hoje}{time.time()}")
+                    finally:
+                        conn.close()
+            finally:
+                # Blocos gravados antes de uma falha também entram no rollup mensal
+                if gravou:
+                    self.atualizar_rollup_mensal(hoje)
+
+    def cobertura(self) -> Tuple[Optional[date], Optional[date]]:
+        """Intervalo de dias fechados já espelhado: (fechado_desde, fechado_ate)."""
+        conn = self.db._get_connection()
+        try:
+            desde = self._ler_sync(conn, 'fechado_desde')
+            ate = self._ler_sync(conn, 'fechado_ate')
+        finally:
+            conn.close()
+        return (date.fromisoformat(desde) if desde else None,
+                date.fromisoformat(ate) if ate else None)
+
+    @staticmethod
+    def _blocos_mensais(ini: date, fim: date) -> List[Tuple[date, date]]:
+        """Quebra [ini, fim] em blocos de no máximo um mês (requisições menores na API)."""
+        blocos = []
+        atual = ini
+        while atual <= fim:
+            proximo_mes = (atual.replace(day=28) + timedelta(days=4)).replace(day=1)
+            bloco_fim = min(fim, proximo_mes - timedelta(days=1))
+            blocos.append((atual, bloco_fim))
+            atual = bloco_fim + timedelta(days=1)
+        return blocos
+
+    # ------------------------------------------------------------
+    # ROLLUP MENSAL
+    # ------------------------------------------------------------
+    @staticmethod
+    def _descongelar_meses(conn, ini: str, fim: str) -> None:
+        """Marca para recálculo os meses que tiveram dias regravados."""
+        conn.execute(
+            "UPDATE vendas_rollup_mes SET fechado = 0 "
+            "WHERE printf('%04d-%02d', ano, mes) BETWEEN ? AND ?",
+            (ini[:7], fim[:7])
+        )
+
+    def atualizar_rollup_mensal(self, hoje: Optional[date] = None) -> None:
+        """
+        Recalcula o rollup mensal a partir das notas.
+
+        Como na análise sazonal original, notas zeradas ou negativas
+        (canceladas) ficam de fora do total e da quantidade.
+
+        Meses anteriores ao corrente são gravados com `fechado = 1` e não são
+        mais recalculados (a não ser que algum dia deles seja regravado). Na
+        prática só o mês corrente é refeito a cada sincronização.
+        """
+        mes_atual = (hoje or date.today()).strftime('%Y-%m')
+        conn = self.db._get_connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM vendas_rollup_mes WHERE fechado = 0")
+                conn.execute(
+                    "INSERT INTO vendas_rollup_mes (ano, mes, canal, total, qtd, fechado) "
+                    "SELECT CAST(substr(data, 1, 4) AS INTEGER), CAST(substr(data, 6, 2) AS INTEGER), "
+                    "canal, SUM(valor), COUNT(*), MAX(substr(data, 1, 7) < ?) "
+                    "FROM vendas_notas "
+                    "WHERE excluida = 0 AND valor > 0 AND substr(data, 1, 7) NOT IN ("
+                    "    SELECT printf('%04d-%02d', ano, mes) FROM vendas_rollup_mes WHERE fechado = 1) "
+                    "GROUP BY substr(data, 1, 7), canal",
+                    (mes_atual,)
+                )
+        finally:
+            conn.close()
+
+    def serie_mensal(self, ano_ini: Optional[int] = None) -> pd.DataFrame:
+        """
+        Faturamento por ano e mês (todos os canais), direto do rollup mensal.
+
+        Só lê: o rollup é mantido por `sincronizar` e `aplicar_blacklist`.
+
+        Returns:
+            DataFrame com colunas Ano, Mes_Num, Valor, Qtd
+        """
+        conn = self.db._get_connection()
+        try:
+            return pd.read_sql_query(
+                "SELECT ano AS Ano, mes AS Mes_Num, SUM(total) AS Valor, SUM(qtd) AS Qtd "
+                "FROM vendas_rollup_mes WHERE ano >= ? GROUP BY ano, mes ORDER BY ano, mes",
+                conn, params=(ano_ini or 0,)
+            )
+        finally:
+            conn.close()
+
+    def serie_diaria(self, data_ini: date, data_fim: date) -> pd.DataFrame:
+        """
+        Faturamento por dia (todos os canais), direto do rollup diário.
+
+        Returns:
+            DataFrame com colunas Data_Obj, Valor, Qtd
+        """
+        conn = self.db._get_connection()
+        try:
+            df = pd.read_sql_query(
+                "SELECT data AS Data_Obj, SUM(total) AS Valor, SUM(qtd) AS Qtd "
+                "FROM vendas_rollup_dia WHERE data BETWEEN ? AND ? GROUP BY data ORDER BY data",
+                conn, params=(data_ini.isoformat(), data_fim.isoformat())
+            )
+        finally:
+            conn.close()
+        df['Data_Obj'] = pd.to_datetime(df['Data_Obj'])
+        return df
+
+    # ------------------------------------------------------------
+    # BLACKLIST
+    # ------------------------------------------------------------
+    def aplicar_blacklist(self, blacklist: Iterable[str], versao: int) -> int:
+        """
+        Marca como excluídas as notas da blacklist e desconta do rollup.
+
+        Só roda quando a versão da blacklist muda; cada nota é descontada
+        uma única vez (filtro `excluida = 0`).
+
+        Returns:
+            Quantidade de notas marcadas nesta chamada
+        """
+        if VendasStore._versao_blacklist_aplicada == versao:
+            return 0
+
+        ids = list(blacklist)
+        marcadas = 0
+        dias_afetados = set()
+        with VendasStore._lock:
+            conn = self.db._get_connection()
+            try:
+                with conn:
+                    for i in range(0, len(ids), 500):
+                        lote = ids[i:i + 500]
+                        marcas = ",".join("?" * len(lote))
+                        linhas = conn.execute(
+                            f"SELECT id_nota, data, canal, valor FROM vendas_notas "
+                            f"WHERE excluida = 0 AND assinatura IN ({marcas})",
+                            lote
+                        ).fetchall()
+                        for id_nota, data_nota, canal, valor in linhas:
+                            conn.execute("UPDATE vendas_notas SET excluida = 1 WHERE id_nota = ?", (id_nota,))
+                            conn.execute(
+                                "UPDATE vendas_rollup_dia SET total = total - ?, qtd = qtd - 1 "
+                                "WHERE data = ? AND canal = ?",
+                                (valor, data_nota, canal)
+                            )
+                            if valor > 0:
+                                conn.execute(
+                                    "UPDATE vendas_rollup_mes SET total = total - ?, qtd = qtd - 1 "
+                                    "WHERE ano = ? AND mes = ? AND canal = ?",
+                                    (valor, int(data_nota[:4]), int(data_nota[5:7]), canal)
+                                )
+                        marcadas += len(linhas)
+                        dias_afetados.update(linha[1] for linha in linhas)
+                    for dia in sorted(dias_afetados):
+                        ClientesIndex.atualizar_periodo(conn, dia, dia)
+            finally:
+                conn.close()
+
+        VendasStore._versao_blacklist_aplicada = versao
+        if marcadas:
+            logger.info(f"Espelho de vendas: {marcadas} notas descontadas pela blacklist")
+        return marcadas
+
+    # ------------------------------------------------------------
+    # CONSULTAS
+    # ------------------------------------------------------------
+    def resumo_periodo(self, data_ini: date, data_fim: date) -> Tuple[float, int, Dict[str, float]]:
+        """
+        Totais do período a partir do rollup diário.
+
+        Returns:
+            (total_vendas, qtd_pedidos, valor_por_canal)
+        """
+        por_canal = {canal: 0.0 for canal in CANAIS}
+        total = 0.0
+        qtd = 0
+
+        conn = self.db._get_connection()
+        try:
+            linhas = conn.execute(
+                "SELECT canal, SUM(total), SUM(qtd) FROM vendas_rollup_dia "
+                "WHERE data BETWEEN ? AND ? GROUP BY canal",
+                (data_ini.isoformat(), data_fim.isoformat())
+            ).fetchall()
+        finally:
+            conn.close()
+
+        for canal, soma, quantidade in linhas:
+            soma = soma or 0.0
+            total += soma
+            qtd += quantidade or 0
+            if canal in por_canal:
+                por_canal[canal] += soma
+            else:
+                por_canal["Venda Direta"] += soma
+        return total, qtd, por_canal